@@ -0,0 +1,159 @@
+"""
+Retention of chat messages.
+
+Messages older than the retention of their room (``ChatRoom.retention_days``,
+CHAT_RETENTION_DAYS by default) are moved out of ChatMessage into
+ChatArchive chunks of up to CHAT_ARCHIVE_CHUNK_SIZE messages, stored as
+gzipped JSON lines in the form the history API returns them. Each chunk
+is written and its messages deleted in one transaction, and a run moves
+at most CHAT_ARCHIVE_MAX_CHUNKS chunks, the next run carries on.
+
+chat.history reads the archive when a page goes past the oldest message
+left in ChatMessage.
+"""
+import gzip
+import json
+from collections import namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ChatArchive, ChatMessage, ChatRoom
+from .serializers import ChatMessageSerializer
+
+# Position of a message in the history of its room, like a ChatMessage
+MessageKey = namedtuple('MessageKey', ['timestamp', 'id'])
+
+
+def _key(message):
+    """MessageKey of a serialized message."""
+    return MessageKey(parse_datetime(message['timestamp']), message['id'])
+
+
+def _encode(messages):
+    return gzip.compress('\n'.join(json.dumps(message) for message in messages).encode())
+
+
+def chunk_messages(chunk):
+    """The serialized messages of a ChatArchive, oldest first."""
+    return [json.loads(line) for line in gzip.decompress(bytes(chunk.data)).decode().splitlines()]
+
+
+def archive_room(room_id, cutoff, chunk_size, max_chunks):
+    """
+    Move the messages of a room older than ``cutoff`` to the archive.
+
+    Returns:
+        tuple: Number of messages and of chunks archived
+    """
+    archived = chunks = 0
+    while chunks < max_chunks:
+        with transaction.atomic():
+            # Concurrent runs take turns on a room, so its chunks never overlap
+            ChatRoom.objects.select_for_update().filter(pk=room_id).first()
+            rows = list(
+                ChatMessage.objects.filter(room_id=room_id, timestamp__lt=cutoff)
+                .select_related('sender')
+                .order_by('timestamp', 'id')[:chunk_size]
+            )
+            if not rows:
+                break
+            archived_rows = ChatMessage.objects.filter(id__in=[row.id for row in rows])
+            ids = archived_rows.aggregate(min_id=Min('id'), max_id=Max('id'))
+            ChatArchive.objects.create(
+                room_id=room_id,
+                first_timestamp=rows[0].timestamp,
+                first_id=rows[0].id,
+                last_timestamp=rows[-1].timestamp,
+                last_id=rows[-1].id,
+                min_id=ids['min_id'],
+                max_id=ids['max_id'],
+                message_count=len(rows),
+                data=_encode(ChatMessageSerializer(rows, many=True).data),
+            )
+            archived_rows.delete()
+        archived += len(rows)
+        chunks += 1
+        if len(rows) < chunk_size:
+            break
+    if archived:
+        from .history import HISTORY_CACHE_KEY
+
+        # The cached window may hold archived messages, the next read rebuilds it
+        cache.delete(HISTORY_CACHE_KEY.format(room_id=room_id))
+    return archived, chunks
+
+
+def archive_expired_messages(chunk_size=None, max_chunks=None):
+    """
+    Archive the messages of every room that are past its retention.
+
+    Returns:
+        int: Number of messages archived
+    """
+    chunk_size = chunk_size or settings.CHAT_ARCHIVE_CHUNK_SIZE
+    max_chunks = max_chunks or settings.CHAT_ARCHIVE_MAX_CHUNKS
+    now = timezone.now()
+    archived = 0
+    for room_id, retention_days in ChatRoom.objects.values_list('id', 'retention_days'):
+        if retention_days is None:
+            retention_days = settings.CHAT_RETENTION_DAYS
+        try:
+            room_archived, chunks = archive_room(
+                room_id, now - timedelta(days=retention_days), chunk_size, max_chunks
+            )
+        except Exception as e:
+            print(f"Error archiving messages of chat room {room_id}: {str(e)}")
+            continue
+        archived += room_archived
+        max_chunks -= chunks
+        if max_chunks <= 0:
+            break
+    return archived
+
+
+def read_archive(room_id, limit, before=None):
+    """
+    Return up to ``limit`` archived messages older than ``before``, newest first.
+
+    Args:
+        room_id: Primary key of the ChatRoom
+        limit: Number of messages to return
+        before: ChatMessage or MessageKey to page back from, or None
+    """
+    chunks = ChatArchive.objects.filter(room_id=room_id)
+    if before is not None:
+        chunks = chunks.filter(
+            Q(first_timestamp__lt=before.timestamp)
+            | Q(first_timestamp=before.timestamp, first_id__lt=before.id)
+        )
+    results = []
+    before_key = MessageKey(before.timestamp, before.id) if before is not None else None
+    for chunk in chunks.order_by('-first_timestamp', '-first_id').iterator(chunk_size=4):
+        for message in reversed(chunk_messages(chunk)):
+            if before_key is None or _key(message) < before_key:
+                results.append(message)
+                if len(results) >= limit:
+                    return results
+    return results
+
+
+def find_archived_message(room_id, message_id):
+    """
+    Return the MessageKey of an archived message, or None if it is not archived.
+
+    Only the chunks whose range of ids holds the message are read. Ids of
+    different processes are not ordered by time, so these ranges can
+    overlap even though the chunks do not.
+    """
+    chunks = ChatArchive.objects.filter(
+        room_id=room_id, min_id__lte=message_id, max_id__gte=message_id
+    )
+    for chunk in chunks:
+        for message in chunk_messages(chunk):
+            if message['id'] == message_id:
+                return _key(message)
+    return None
@@ -0,0 +1,291 @@
+"""
+Write-behind persistence of chat messages.
+
+ChatConsumer broadcasts a message as soon as it is received, with an id
+and timestamp assigned here, and queues it in the process-wide
+``message_buffer``. The flusher task writes the queue with bulk_create
+every CHAT_FLUSH_INTERVAL_MS, or as soon as CHAT_FLUSH_BATCH_SIZE
+messages are waiting, and the buffer is flushed once more when the
+process exits.
+
+Failures are handled as follows:
+
+* A batch the database rejects (a deleted room or sender) is written row
+  by row, and the rows that still fail are dropped. A message keeps the
+  id it was broadcast with, clients page history by it.
+* When the database is unavailable the batch goes back to the front of
+  the queue and is retried on the next flush.
+* The queue holds at most CHAT_BUFFER_MAX_MESSAGES, the oldest messages
+  are dropped beyond that.
+
+``message_buffer.stats()`` reports the buffered, flushed and dropped
+counts.
+"""
+import asyncio
+import atexit
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from .history import HISTORY_CACHE_KEY
+from .models import ChatMessage
+
+# Message ids: milliseconds since 2024-01-01, a worker id and a sequence
+# number, 53 bits in all so JavaScript clients read them exactly.
+ID_EPOCH_MS = 1704067200000
+WORKER_BITS = 5
+SEQUENCE_BITS = 7
+
+
+# Renews a lease held by ARGV[1] for ARGV[2] seconds, 0 if it was lost
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class WorkerLease:
+    """
+    A worker id held by this process in Redis for as long as it renews it.
+
+    Processes take the first free id after a shared counter, so they do
+    not all try the same ids first, and an id held by a process that died
+    is free again after ``ttl`` seconds.
+    """
+
+    key = 'chat:worker:{worker_id}'
+    counter_key = 'chat:worker:next'
+
+    def __init__(self, ttl):
+        from django_redis import get_redis_connection
+
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.worker_id = None
+        self.renewed = 0
+        self._redis = get_redis_connection('default')
+        self._renew = self._redis.register_script(RENEW_SCRIPT)
+
+    def acquire(self):
+        """Lease a free worker id and return it."""
+        start = self._redis.incr(self.counter_key)
+        for offset in range(1 << WORKER_BITS):
+            worker_id = (start + offset) % (1 << WORKER_BITS)
+            if self._redis.set(self.key.format(worker_id=worker_id), self.token, nx=True, ex=self.ttl):
+                self.worker_id = worker_id
+                self.renewed = time.monotonic()
+                return worker_id
+        raise RuntimeError(f'All {1 << WORKER_BITS} chat worker ids are leased')
+
+    def due(self):
+        return time.monotonic() - self.renewed >= self.ttl / 3
+
+    def renew(self):
+        """Extend the lease, leasing another id if it expired. Returns the id."""
+        renewed = self._renew(
+            keys=[self.key.format(worker_id=self.worker_id)], args=[self.token, self.ttl]
+        )
+        if not renewed:
+            print(f"Error renewing chat worker id {self.worker_id}: lease lost")
+            return self.acquire()
+        self.renewed = time.monotonic()
+        return self.worker_id
+
+
+class MessageIds:
+    """
+    Increasing message ids, unique across processes with distinct worker ids.
+
+    Without a ``worker_id`` one is leased from Redis on first use, see
+    WorkerLease. If Redis is unavailable a random id is used instead.
+    """
+
+    def __init__(self, worker_id=None):
+        self.worker_id = None if worker_id is None else worker_id % (1 << WORKER_BITS)
+        self._lease = None
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _lease_worker_id(self):
+        try:
+            self._lease = WorkerLease(settings.CHAT_WORKER_LEASE_SECONDS)
+            return self._lease.acquire()
+        except Exception as e:
+            print(f"Error leasing a chat worker id, using a random one: {str(e)}")
+            self._lease = None
+            return random.getrandbits(WORKER_BITS)
+
+    def renewal_due(self):
+        return self._lease is not None and self._lease.due()
+
+    def renew(self):
+        """Renew the leased worker id, see WorkerLease."""
+        if not self.renewal_due():
+            return
+        try:
+            worker_id = self._lease.renew()
+        except Exception as e:
+            print(f"Error renewing chat worker id: {str(e)}")
+            return
+        with self._lock:
+            self.worker_id = worker_id
+
+    def next(self):
+        with self._lock:
+            if self.worker_id is None:
+                self.worker_id = self._lease_worker_id()
+            now = int(time.time() * 1000) - ID_EPOCH_MS
+            if now <= self._last_ms:
+                now = self._last_ms
+                self._sequence = (self._sequence + 1) % (1 << SEQUENCE_BITS)
+                if self._sequence == 0:
+                    # Sequence exhausted in this millisecond, borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (
+                now << (WORKER_BITS + SEQUENCE_BITS)
+                | self.worker_id << SEQUENCE_BITS
+                | self._sequence
+            )
+
+
+class MessageBuffer:
+    """Chat messages waiting to be written, shared by the consumers of a process."""
+
+    def __init__(self, batch_size, max_size):
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+        self.buffered = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffered': self.buffered,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'failed_flushes': self.failed_flushes,
+                'pending': len(self._pending),
+            }
+
+    def add(self, message):
+        """Queue an unsaved ChatMessage with its id and timestamp set."""
+        with self._lock:
+            self._pending.append(message)
+            self.buffered += 1
+            self._trim()
+            full = len(self._pending) >= self.batch_size
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _trim(self):
+        while len(self._pending) > self.max_size:
+            self._pending.popleft()
+            self.dropped += 1
+
+    def start(self, interval):
+        """Run the flusher on the running event loop unless it already runs there."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run(interval))
+
+    async def stop(self):
+        """Stop the flusher and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await database_sync_to_async(self.flush)()
+
+    async def _run(self, interval):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await database_sync_to_async(self.flush)()
+            if message_ids.renewal_due():
+                await sync_to_async(message_ids.renew, thread_sensitive=False)()
+
+    def flush(self):
+        """
+        Write the queued messages in batches.
+
+        Returns:
+            int: Number of messages written
+        """
+        written = 0
+        while True:
+            with self._lock:
+                count = min(self.batch_size, len(self._pending))
+                batch = [self._pending.popleft() for _ in range(count)]
+            if not batch:
+                return written
+            try:
+                written += self._write(batch)
+            except DatabaseError as e:
+                with self._lock:
+                    self._pending.extendleft(reversed(batch))
+                    self.failed_flushes += 1
+                    self._trim()
+                print(f"Error flushing chat messages: {str(e)}")
+                return written
+
+    def _write(self, batch):
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch)
+        except IntegrityError:
+            batch = [message for message in batch if self._write_one(message)]
+        with self._lock:
+            self.flushed += len(batch)
+        # bulk_create sends no post_save, see chat.signals
+        cache.delete_many(
+            [HISTORY_CACHE_KEY.format(room_id=room_id) for room_id in {m.room_id for m in batch}]
+        )
+        return len(batch)
+
+    def _write_one(self, message):
+        # The id was already broadcast, so a message is never saved under another
+        try:
+            with transaction.atomic():
+                message.save(force_insert=True)
+            return True
+        except IntegrityError as e:
+            with self._lock:
+                self.dropped += 1
+            print(f"Error saving chat message, dropped: {str(e)}")
+            return False
+
+
+message_ids = MessageIds(settings.CHAT_WORKER_ID)
+
+message_buffer = MessageBuffer(
+    settings.CHAT_FLUSH_BATCH_SIZE, settings.CHAT_BUFFER_MAX_MESSAGES
+)
+
+# Daphne has no lifespan events, a stopping server still runs atexit hooks
+atexit.register(message_buffer.flush)
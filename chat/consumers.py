@@ -1,54 +1,86 @@
-import json
+import asyncio
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import ChatMessage, ChatRoom
-from courses.models import Course
+from django.utils import timezone
+from .buffer import message_buffer, message_ids
+from .frames import decode_frame, frame_cache, negotiate
+from .layers import room_group
+from .limits import ConnectionLimiter, limit_stats
+from .models import ChatMessage
+from .presence import presence_tracker
+from .rooms import join_room, resolve_room, room_cache
 
 User = get_user_model()
 
+# Close code for connections that do not read their messages fast enough
+SLOW_CONNECTION_CLOSE_CODE = 1013
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs'].get('room_name') or 'general'
-        self.room_group_name = f'chat_{self.room_name}'
+        self.room_group_name = room_group(self.room_name)
 
         if not self.scope['user'].is_authenticated:
             await self.close()
             return
         
-        try:
-            self.course = await database_sync_to_async(Course.objects.get)(slug=self.room_name)
-        except Course.DoesNotExist:
+        # Resolved once per connection, known rooms come from the process cache
+        self.room = room_cache.get(self.room_name) or await database_sync_to_async(resolve_room)(
+            self.room_name
+        )
+        if self.room is None:
             await self.send(text_data='{"error": "Course not found."}')
             await self.close()
             return
 
-
-        # Join room group
-        
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        self.wire = negotiate(self.scope.get('subprotocols'))
+        await self.accept(subprotocol=self.wire.subprotocol)
         print(f"User {self.scope['user']} connected to room {self.room_group_name}")
 
-
-        await self.add_user_to_room_participants(self.scope['user'], self.room_name)
+        self.limiter = ConnectionLimiter(self.scope['user'].id)
+        # Frames wait here for the writer, a full queue closes the connection
+        self.outbound = asyncio.Queue(maxsize=settings.CHAT_OUTBOUND_QUEUE_SIZE)
+        self.closing = False
+        self.writer = asyncio.ensure_future(self._write())
+        # Messages held back by the rate limits, sent when their token is due
+        self.delayed = set()
+
+        # Other tabs of the user are already online, and only a first join
+        # writes the participants
+        came_online = await sync_to_async(presence_tracker.connect, thread_sensitive=False)(
+            self.room_name, self.scope['user'], self.channel_name
+        )
+        presence_tracker.start()
+        if came_online and self.scope['user'].id not in self.room.participant_ids:
+            await database_sync_to_async(join_room)(self.room, self.scope['user'].id)
 
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'writer'):
+            self.writer.cancel()
+            for task in self.delayed:
+                task.cancel()
         if hasattr(self, 'room_group_name'): 
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+            await sync_to_async(presence_tracker.disconnect, thread_sensitive=False)(
+                self.channel_name
+            )
             print(f"User {self.scope['user']} disconnected from room {self.room_group_name}")
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = decode_frame(text_data, bytes_data)
         message_content = text_data_json.get('message')
         user = self.scope['user']
 
@@ -56,13 +88,43 @@ class ChatConsumer(AsyncWebsocketConsumer):
             print("Discarding empty message or message from unauthenticated user.")
             return
 
-        chat_message = await self.save_message(user, self.room_name, message_content)
+        wait = await self.limiter.acquire()
+        if wait is None:
+            await self._queue(
+                self.wire.format.encode({'error': 'Rate limit exceeded, message dropped.'})
+            )
+            return
+        if wait:
+            # Sleeping here would also hold back the frames sent to this
+            # connection, so the message goes out from its own task
+            task = asyncio.ensure_future(self._broadcast_later(wait, user, message_content))
+            self.delayed.add(task)
+            task.add_done_callback(self.delayed.discard)
+            return
+        await self._broadcast(user, message_content)
+
+    async def _broadcast_later(self, wait, user, message_content):
+        await asyncio.sleep(wait)
+        await self._broadcast(user, message_content)
+
+    async def _broadcast(self, user, message_content):
+        # Broadcast right away, the message is written by the buffer's flusher
+        chat_message = ChatMessage(
+            id=message_ids.next(),
+            room_id=self.room.id,
+            sender=user,
+            content=message_content,
+            timestamp=timezone.now(),
+        )
+        message_buffer.add(chat_message)
+        message_buffer.start(settings.CHAT_FLUSH_INTERVAL_MS / 1000)
 
         # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat.message', 
+                'id': chat_message.id,
                 'message': message_content,
                 'sender_id': user.id,
                 'sender_username': user.username,
@@ -75,36 +137,47 @@ class ChatConsumer(AsyncWebsocketConsumer):
     # Receive message from room group
     async def chat_message(self, event):
         message = event['message']
-        sender_id = event['sender_id']
         sender_username = event['sender_username']
-        timestamp = event['timestamp']
-
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'message': message,
-            'sender_id': sender_id,
-            'sender_username': sender_username,
-            'timestamp': timestamp,
-            'is_self': self.scope['user'].id == sender_id 
-        }))
-        print(f"Message '{message}' from {sender_username} delivered to user {self.scope['user'].username} in room {self.room_group_name}")
 
-    @database_sync_to_async
-    def save_message(self, sender, room_name, content):
-        room = ChatRoom.objects.get(name=room_name)
-
-        message = ChatMessage.objects.create(
-            room=room,
-            sender=sender,
-            content=content
+        # Encoded once per process and shared by the room's other consumers
+        await self._queue(
+            frame_cache.get(event, self.wire.format, self.scope['user'].id == event['sender_id'])
         )
-        return message
+        print(f"Message '{message}' from {sender_username} delivered to user {self.scope['user'].username} in room {self.room_group_name}")
 
-    @database_sync_to_async
-    def add_user_to_room_participants(self, user, room_name):
-         room, created = ChatRoom.objects.get_or_create(name=room_name)
-         if created:
-             room.course = Course.objects.get(slug=self.room_name)
-             room.save()
-         room.participants.add(user)
+    # Users who came online or went offline since the last update
+    async def presence_update(self, event):
+        await self._queue(self.wire.format.encode({
+            'type': 'presence',
+            'joined': event['joined'],
+            'left': event['left'],
+            'online': event['online'],
+        }))
 
+    async def _queue(self, frame):
+        """Queue a frame for the writer, closing connections that fall behind."""
+        if self.closing:
+            return
+        try:
+            self.outbound.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.closing = True
+            limit_stats.count('slow_disconnects')
+            print(f"Closing slow connection of user {self.scope['user']} in room {self.room_group_name}")
+            await self.close(code=SLOW_CONNECTION_CLOSE_CODE)
+
+    async def _write(self):
+        while True:
+            frame = await self.outbound.get()
+            if self.wire.batch:
+                # Frames queued within the window go out as one
+                await asyncio.sleep(settings.CHAT_COALESCE_MS / 1000)
+                frames = [frame]
+                while not self.outbound.empty():
+                    frames.append(self.outbound.get_nowait())
+                if len(frames) > 1:
+                    frame = self.wire.format.batch(frames)
+            if self.wire.format.binary:
+                await self.send(bytes_data=frame)
+            else:
+                await self.send(text_data=frame)
@@ -0,0 +1,132 @@
+"""
+Wire formats of the chat websocket.
+
+Clients pick a format with the websocket subprotocol: ``chat.json`` (the
+default when none is offered) sends JSON text frames, ``chat.msgpack``
+the same payloads as msgpack binary frames. With ``.batch`` appended, the
+frames queued within CHAT_COALESCE_MS are sent together as one
+``{"type": "batch", "frames": [...]}`` frame.
+
+A chat message is the same for every member of its room except for
+``is_self``, so its encoded frames are kept in ``frame_cache`` and a
+group message is serialized once per format and variant in each process
+instead of once per recipient.
+"""
+import json
+import threading
+from collections import OrderedDict, namedtuple
+import msgpack
+
+# Chat messages whose frames a process keeps, the newest ones are enough
+FRAME_CACHE_SIZE = 1024
+
+
+class JsonFormat:
+    name = 'json'
+    binary = False
+
+    def encode(self, payload):
+        return json.dumps(payload, separators=(',', ':'))
+
+    def batch(self, frames):
+        # Joins the encoded frames instead of decoding and encoding them again
+        return '{"type":"batch","frames":[' + ','.join(frames) + ']}'
+
+
+class MsgpackFormat:
+    name = 'msgpack'
+    binary = True
+
+    def encode(self, payload):
+        return msgpack.packb(payload)
+
+    def batch(self, frames):
+        packer = msgpack.Packer()
+        return b''.join(
+            [
+                packer.pack_map_header(2),
+                packer.pack('type'),
+                packer.pack('batch'),
+                packer.pack('frames'),
+                packer.pack_array_header(len(frames)),
+                *frames,
+            ]
+        )
+
+
+FORMATS = {
+    'json': JsonFormat(),
+    'msgpack': MsgpackFormat(),
+}
+
+Wire = namedtuple('Wire', ['subprotocol', 'format', 'batch'])
+
+SUBPROTOCOLS = {
+    'chat.json': Wire('chat.json', FORMATS['json'], False),
+    'chat.json.batch': Wire('chat.json.batch', FORMATS['json'], True),
+    'chat.msgpack': Wire('chat.msgpack', FORMATS['msgpack'], False),
+    'chat.msgpack.batch': Wire('chat.msgpack.batch', FORMATS['msgpack'], True),
+}
+
+# Clients that offer no subprotocol, or none of ours
+DEFAULT_WIRE = Wire(None, FORMATS['json'], False)
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """Decode a frame from a client, JSON text or msgpack binary."""
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data)
+    return json.loads(text_data)
+
+
+def negotiate(offered):
+    """Return the wire of the first subprotocol offered that is supported."""
+    for subprotocol in offered or ():
+        if subprotocol in SUBPROTOCOLS:
+            return SUBPROTOCOLS[subprotocol]
+    return DEFAULT_WIRE
+
+
+class FrameCache:
+    """Encoded chat message frames shared by the consumers of a process."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.encoded = 0
+
+    def get(self, event, chat_format, is_self):
+        """
+        Return the frame of a ``chat.message`` event for one recipient.
+
+        Args:
+            event: The group message, see ChatConsumer.receive
+            chat_format: A format of FORMATS
+            is_self: Whether the recipient sent the message
+        """
+        key = (event['id'], chat_format.name, is_self)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                return frame
+        frame = chat_format.encode(
+            {
+                'id': event['id'],
+                'message': event['message'],
+                'sender_id': event['sender_id'],
+                'sender_username': event['sender_username'],
+                'timestamp': event['timestamp'],
+                'is_self': is_self,
+            }
+        )
+        with self._lock:
+            self.encoded += 1
+            self._frames[key] = frame
+            while len(self._frames) > self.max_size:
+                self._frames.popitem(last=False)
+        return frame
+
+
+frame_cache = FrameCache(FRAME_CACHE_SIZE)
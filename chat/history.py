@@ -0,0 +1,94 @@
+"""
+Chat history, read newest first with keyset pagination.
+
+Pages are anchored on a message id ("before message X") and walk the
+(room, timestamp, id) index, so loading old history costs the same as
+loading recent history. The newest HISTORY_WINDOW messages of each room
+are also kept in the cache, so reconnecting clients get their scrollback
+with a single cache hit. Saving a message only drops the cached window
+(see chat.signals) and the next read rebuilds it, so sending a message
+costs no query beyond its insert.
+
+Messages past the retention of their room are moved to ChatArchive (see
+chat.archive), pages that reach past the oldest message left in
+ChatMessage continue from there.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from .archive import find_archived_message, read_archive
+from .models import ChatMessage
+from .serializers import ChatMessageSerializer
+
+HISTORY_WINDOW = 50
+HISTORY_CACHE_KEY = 'chat_history:{room_id}'
+
+
+def _page(room_id, limit, before=None):
+    """Serialize up to ``limit`` messages older than ``before``, oldest first."""
+    messages = ChatMessage.objects.filter(room_id=room_id).select_related('sender')
+    if before is not None:
+        messages = messages.filter(
+            Q(timestamp__lt=before.timestamp) | Q(timestamp=before.timestamp, id__lt=before.id)
+        )
+    # One extra row tells whether older messages remain
+    rows = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+    results = list(ChatMessageSerializer(rows, many=True).data)
+    if len(rows) <= limit:
+        results += read_archive(room_id, limit + 1 - len(rows), rows[-1] if rows else before)
+    has_more = len(results) > limit
+    results = results[:limit]
+    results.reverse()
+    return {
+        'results': results,
+        'has_more': has_more,
+    }
+
+
+def refresh_history_window(room_id):
+    """Rebuild the cached window of the newest messages of a room."""
+    window = _page(room_id, HISTORY_WINDOW)
+    cache.set(HISTORY_CACHE_KEY.format(room_id=room_id), window, timeout=settings.CACHE_TTL)
+    return window
+
+
+def get_history(room_id, limit=HISTORY_WINDOW, before=None):
+    """
+    Return a page of the history of a room.
+
+    Args:
+        room_id: Primary key of the ChatRoom
+        limit: Number of messages to return
+        before: ChatMessage, or MessageKey of an archived message, to page
+            back from, or None for the newest messages
+
+    Returns:
+        dict: ``results`` oldest first, ``has_more`` and ``next_before``, the
+        id to pass as ``before`` for the previous page
+    """
+    if before is None and limit <= HISTORY_WINDOW:
+        window = cache.get(HISTORY_CACHE_KEY.format(room_id=room_id))
+        if window is None:
+            window = refresh_history_window(room_id)
+        results = window['results'][-limit:] if limit else []
+        page = {
+            'results': results,
+            'has_more': window['has_more'] or len(window['results']) > len(results),
+        }
+    else:
+        page = _page(room_id, limit, before)
+    page['next_before'] = page['results'][0]['id'] if page['has_more'] and page['results'] else None
+    return page
+
+
+def find_message(room_id, message_id):
+    """
+    Return the message to page back from, in ChatMessage or in the archive.
+
+    Returns:
+        ChatMessage or MessageKey: None if the room has no such message
+    """
+    message = ChatMessage.objects.only('id', 'timestamp').filter(
+        pk=message_id, room_id=room_id
+    ).first()
+    return message or find_archived_message(room_id, message_id)
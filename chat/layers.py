@@ -0,0 +1,128 @@
+"""
+Channel layer for chat fan-out sharded over several Redis nodes.
+
+The rooms' groups (``chat_<room>``) and the consumers' channels are
+spread over CHAT_REDIS_HOSTS. RedisChannelLayer picks a host as the hash
+of the name modulo the number of hosts, so adding a host moves nearly
+every group and disconnects its members from the fan-out until they
+reconnect. ShardedRedisChannelLayer places each host at many points of a
+hash ring instead, and adding a host only moves the groups that now fall
+on its points.
+"""
+import asyncio
+import bisect
+import hashlib
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+from channels_redis.core import RedisChannelLayer
+
+
+def _hash(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return int.from_bytes(hashlib.md5(value).digest()[:8], 'big')
+
+
+def host_label(host):
+    """Name of a host as decoded by channels_redis, stable across processes."""
+    if 'address' in host:
+        # Without credentials, so changing a password does not move groups
+        url = urlsplit(str(host['address']))
+        return url._replace(netloc=url.netloc.rpartition('@')[2]).geturl()
+    if 'master_name' in host:
+        return f"sentinel:{host['master_name']}"
+    return f"{host.get('host')}:{host.get('port')}"
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """RedisChannelLayer placing groups and channels on a consistent hash ring."""
+
+    # Points per host, more even out the shards at the cost of a larger ring
+    ring_replicas = 160
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        ring = sorted(
+            (_hash(f'{host_label(host)}#{replica}'), index)
+            for index, host in enumerate(self.hosts)
+            for replica in range(self.ring_replicas)
+        )
+        self._ring_points = [point for point, _ in ring]
+        self._ring_hosts = [index for _, index in ring]
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        position = bisect.bisect(self._ring_points, _hash(value)) % len(self._ring_points)
+        return self._ring_hosts[position]
+
+
+def room_group(room_name):
+    """Group of a chat room, see ChatConsumer."""
+    return f'chat_{room_name}'
+
+
+async def shard_report(layer, room_names, interval=1.0):
+    """
+    Report the health, load and rooms of every shard of a channel layer.
+
+    Redis shards are pinged and their command counters sampled over
+    ``interval`` seconds. Other layers, such as the in-memory one, report
+    a single shard.
+
+    Args:
+        layer: The channel layer
+        room_names: Names of the chat rooms to place on the shards
+        interval: Seconds between the two samples of the command counters
+
+    Returns:
+        list: One dict per shard
+    """
+    if not isinstance(layer, RedisChannelLayer):
+        return [
+            {
+                'shard': 0,
+                'host': layer.__class__.__name__,
+                'healthy': True,
+                'rooms': len(room_names),
+                'groups': len(getattr(layer, 'groups', {})),
+            }
+        ]
+
+    rooms = Counter(layer.consistent_hash(room_group(name)) for name in room_names)
+    shards = await asyncio.gather(
+        *[_redis_shard(layer, index, interval) for index in range(layer.ring_size)]
+    )
+    for shard in shards:
+        shard['rooms'] = rooms[shard['shard']]
+    await layer.close_pools()
+    return shards
+
+
+async def _redis_shard(layer, index, interval):
+    shard = {'shard': index, 'host': host_label(layer.hosts[index])}
+    connection = layer.connection(index)
+    try:
+        start = time.perf_counter()
+        await connection.ping()
+        shard['ping_ms'] = (time.perf_counter() - start) * 1000
+        before = await connection.info('stats')
+        await asyncio.sleep(interval)
+        after = await connection.info()
+        groups = 0
+        async for _ in connection.scan_iter(match=f'{layer.prefix}:group:*', count=1000):
+            groups += 1
+    except Exception as e:
+        shard.update(healthy=False, error=str(e))
+        return shard
+    processed = after['total_commands_processed'] - before['total_commands_processed']
+    shard.update(
+        healthy=True,
+        groups=groups,
+        commands_per_second=processed / interval if interval else None,
+        instantaneous_ops_per_sec=after['instantaneous_ops_per_sec'],
+        connected_clients=after['connected_clients'],
+        used_memory=after['used_memory'],
+    )
+    return shard
@@ -0,0 +1,213 @@
+"""
+Rate limits of chat senders.
+
+Every connection has a token bucket of CHAT_RATE_LIMIT_BURST messages
+refilled at CHAT_RATE_LIMIT_PER_SECOND, and every user one of
+CHAT_USER_RATE_LIMIT_BURST refilled at CHAT_USER_RATE_LIMIT_PER_SECOND
+over all their connections. The user buckets are kept by this process
+("memory"), or shared by all processes through Redis ("redis"), as set by
+CHAT_RATE_LIMIT_BACKEND.
+
+A message over a limit waits for its token if that takes at most
+CHAT_RATE_LIMIT_MAX_DELAY_MS, and is dropped otherwise. ``limit_stats``
+counts the delayed and dropped messages and the connections closed for
+reading too slowly, see ChatConsumer.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+# User buckets kept by a process, the least recently used are forgotten
+MAX_USER_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Allow ``rate`` messages per second with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, max_wait=0, now=None):
+        """
+        Take a token, reserving a future one if the bucket is empty.
+
+        Args:
+            max_wait: Longest wait in seconds for a token
+            now: Current monotonic time, for tests
+
+        Returns:
+            float: Seconds to wait before sending, or None if that would be
+            longer than ``max_wait`` and no token was taken
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class InMemoryUserLimits:
+    """Buckets of the users connected to this process."""
+
+    shared = False
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, user_id, max_wait):
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(
+                    settings.CHAT_USER_RATE_LIMIT_PER_SECOND,
+                    settings.CHAT_USER_RATE_LIMIT_BURST,
+                )
+                while len(self._buckets) > MAX_USER_BUCKETS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            return bucket.take(max_wait)
+
+
+# The bucket of TokenBucket.take in a hash, ARGV is rate, burst, the time
+# and the longest wait. Returns the wait as a string, floats would be
+# truncated to integers, and -1 when no token was taken.
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now, max_wait = tonumber(ARGV[3]), tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = math.max(0, (1 - tokens) / rate)
+if wait > max_wait then
+    return '-1'
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate + max_wait) + 1)
+return tostring(wait)
+"""
+
+
+class RedisUserLimits:
+    """Buckets shared by all ASGI processes through Redis."""
+
+    shared = True
+    key = 'chat:ratelimit:{user_id}'
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+
+        self._take = get_redis_connection('default').register_script(TAKE_SCRIPT)
+
+    def take(self, user_id, max_wait):
+        wait = float(
+            self._take(
+                keys=[self.key.format(user_id=user_id)],
+                args=[
+                    settings.CHAT_USER_RATE_LIMIT_PER_SECOND,
+                    settings.CHAT_USER_RATE_LIMIT_BURST,
+                    time.time(),
+                    max_wait,
+                ],
+            )
+        )
+        return None if wait < 0 else wait
+
+
+USER_LIMIT_BACKENDS = {
+    'memory': InMemoryUserLimits,
+    'redis': RedisUserLimits,
+}
+
+_backends = {}
+
+
+def get_user_limits():
+    """Return the user buckets configured by ``CHAT_RATE_LIMIT_BACKEND``."""
+    name = settings.CHAT_RATE_LIMIT_BACKEND
+    if name not in _backends:
+        _backends[name] = USER_LIMIT_BACKENDS[name]()
+    return _backends[name]
+
+
+class LimitStats:
+    """Counts of the messages and connections the limits acted on, per process."""
+
+    names = ('delayed', 'dropped_connection', 'dropped_user', 'slow_disconnects')
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {name: self._counts[name] for name in self.names}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+limit_stats = LimitStats()
+
+
+class ConnectionLimiter:
+    """The limits of one connection: its own bucket and the one of its user."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.bucket = TokenBucket(
+            settings.CHAT_RATE_LIMIT_PER_SECOND, settings.CHAT_RATE_LIMIT_BURST
+        )
+
+    async def acquire(self):
+        """
+        Take a token for a message from both buckets.
+
+        Returns:
+            float: Seconds to wait before sending, or None to drop the message
+        """
+        max_wait = settings.CHAT_RATE_LIMIT_MAX_DELAY_MS / 1000
+        wait = self.bucket.take(max_wait)
+        if wait is None:
+            limit_stats.count('dropped_connection')
+            return None
+
+        user_limits = get_user_limits()
+        try:
+            if user_limits.shared:
+                user_wait = await sync_to_async(user_limits.take, thread_sensitive=False)(
+                    self.user_id, max_wait
+                )
+            else:
+                user_wait = user_limits.take(self.user_id, max_wait)
+        except Exception as e:
+            # The connection's bucket still applies without the shared one
+            print(f"Error checking chat rate limit: {str(e)}")
+            user_wait = 0
+        if user_wait is None:
+            self.bucket.refund()
+            limit_stats.count('dropped_user')
+            return None
+
+        wait = max(wait, user_wait)
+        if wait:
+            limit_stats.count('delayed')
+        return wait
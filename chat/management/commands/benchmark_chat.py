@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import time
+import uuid
+from collections import Counter
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from chat.buffer import message_buffer
+from chat.frames import SUBPROTOCOLS, decode_frame
+from chat.limits import limit_stats
+from chat.models import ChatMessage
+from chat.presence import presence_tracker
+from chat.rooms import room_cache
+from chat.routing import websocket_urlpatterns
+from courses.models import Course, Subject
+
+User = get_user_model()
+
+MEMORY_LAYER = {
+    "BACKEND": "channels.layers.InMemoryChannelLayer",
+    # Large enough that the layer itself never drops a delivery
+    "CONFIG": {"capacity": 100000},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test ChatConsumer: R rooms with U connected users each receive M "
+        "messages per second. Reports fan-out latency percentiles, delivered messages "
+        "per second and chat message inserts per second as JSON. Test data is deleted "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=5)
+        parser.add_argument("--users", type=int, default=10, help="Connections per room")
+        parser.add_argument("--rate", type=float, default=20, help="Messages per second per room")
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument(
+            "--redis",
+            metavar="URL",
+            help="Use a Redis channel layer at this URL instead of the in-memory layer",
+        )
+        parser.add_argument(
+            "--subprotocol",
+            choices=sorted(SUBPROTOCOLS),
+            help="Websocket subprotocol of the clients, plain JSON by default",
+        )
+        parser.add_argument("--output", help="JSON file to write, stdout by default")
+
+    def handle(self, *args, **options):
+        if options["rooms"] < 1 or options["users"] < 1 or options["rate"] <= 0:
+            raise CommandError("rooms, users and rate must be positive")
+        layer = MEMORY_LAYER
+        if options["redis"]:
+            layer = {
+                "BACKEND": "channels_redis.core.RedisChannelLayer",
+                "CONFIG": {"hosts": [options["redis"]]},
+            }
+
+        # Not rolled back like the other benchmarks: database_sync_to_async
+        # closes connections that are inside a transaction.
+        subject, users = self._setup(options["rooms"], options["users"])
+        limit_stats.reset()
+        try:
+            # Presence stays in this process unless the run uses Redis
+            presence = "redis" if options["redis"] else "memory"
+            with override_settings(
+                CHANNEL_LAYERS={"default": layer}, CHAT_PRESENCE_BACKEND=presence
+            ):
+                with CaptureQueriesContext(connection) as queries, open(os.devnull, "w") as devnull:
+                    # The consumers print every message, which is part of the
+                    # cost being measured but would bury the report.
+                    with contextlib.redirect_stdout(devnull):
+                        result = async_to_sync(self._run)(
+                            subject.courses.order_by("id"),
+                            users,
+                            options["users"],
+                            options["rate"],
+                            options["seconds"],
+                            options["subprotocol"],
+                        )
+            written = ChatMessage.objects.filter(room__course__subject=subject).count()
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            subject.delete()
+            room_cache.clear()
+
+        inserts = [
+            query for query in queries
+            if query["sql"].startswith('INSERT INTO "chat_chatmessage"')
+        ]
+        latencies = sorted(result["latencies"])
+        elapsed = result["elapsed"]
+        expected = result["sent"] * options["users"]
+        report = json.dumps(
+            {
+                "rooms": options["rooms"],
+                "users_per_room": options["users"],
+                "rate_per_room": options["rate"],
+                "seconds": elapsed,
+                "channel_layer": "redis" if options["redis"] else "memory",
+                "subprotocol": options["subprotocol"],
+                "sent": result["sent"],
+                "delivered": len(latencies),
+                "lost": expected - len(latencies),
+                "latency_ms": {
+                    "p50": self._percentile(latencies, 50),
+                    "p90": self._percentile(latencies, 90),
+                    "p99": self._percentile(latencies, 99),
+                    "max": latencies[-1] if latencies else None,
+                },
+                "sent_per_second": result["sent"] / elapsed,
+                "delivered_per_second": len(latencies) / elapsed,
+                # Batching subprotocols deliver several messages per frame
+                "frames": result["traffic"]["frames"],
+                "bytes_per_message": (
+                    result["traffic"]["bytes"] / len(latencies) if latencies else None
+                ),
+                # Messages the rate limits delayed or dropped, dropped ones are lost
+                "rate_limits": limit_stats.stats(),
+                "messages_written": written,
+                "db_inserts": len(inserts),
+                "db_inserts_per_second": len(inserts) / elapsed,
+            },
+            indent=2,
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report)
+        self.stdout.write(report)
+
+    def _percentile(self, samples, percent):
+        if not samples:
+            return None
+        if len(samples) == 1:
+            return samples[0]
+        return statistics.quantiles(samples, n=100, method="inclusive")[percent - 1]
+
+    def _setup(self, room_count, user_count):
+        suffix = uuid.uuid4().hex[:8]
+        subject = Subject.objects.create(title=f"bench-{suffix}", slug=f"bench-{suffix}")
+        # Every room has its own users, each sending within the user rate limit
+        users = [
+            User.objects.create_user(username=f"bench-{suffix}-{index}")
+            for index in range(room_count * user_count)
+        ]
+        for index in range(room_count):
+            Course.objects.create(
+                title=f"Chat benchmark {suffix} {index}",
+                subject=subject,
+                required_time=1,
+                summary="benchmark",
+                owner=users[0],
+            )
+        return subject, users
+
+    async def _run(self, courses, users, users_per_room, rate, seconds, subprotocol):
+        application = URLRouter(websocket_urlpatterns)
+        connections = {}
+        async for course in courses:
+            room_name = course.slug
+            start = len(connections) * users_per_room
+            connections[room_name] = []
+            for user in users[start : start + users_per_room]:
+                communicator = WebsocketCommunicator(
+                    application,
+                    f"ws/chat/{room_name}/",
+                    subprotocols=[subprotocol] if subprotocol else None,
+                )
+                communicator.scope["user"] = user
+                connected, _ = await communicator.connect()
+                if not connected:
+                    raise CommandError(f"Could not connect to room {room_name}")
+                connections[room_name].append(communicator)
+
+        latencies = []
+        # Time of the last delivery, the run ends there and not after the drain
+        last_received = [0]
+        traffic = Counter()
+        sending = asyncio.Event()
+        receivers = [
+            asyncio.ensure_future(
+                self._receive(communicator, latencies, last_received, traffic, sending)
+            )
+            for communicators in connections.values()
+            for communicator in communicators
+        ]
+        start = time.perf_counter()
+        sent = await asyncio.gather(
+            *[self._send(communicators, rate, seconds) for communicators in connections.values()]
+        )
+        sent_at = time.perf_counter()
+        sending.set()
+        await asyncio.gather(*receivers)
+        elapsed = max(sent_at, last_received[0]) - start
+
+        for communicators in connections.values():
+            for communicator in communicators:
+                await communicator.disconnect()
+        await message_buffer.stop()
+        await presence_tracker.stop()
+        return {"sent": sum(sent), "latencies": latencies, "elapsed": elapsed, "traffic": traffic}
+
+    async def _send(self, communicators, rate, seconds):
+        """Send ``rate`` messages per second round robin from the room's users."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        count = int(rate * seconds)
+        for index in range(count):
+            delay = start + index / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # The message carries its send time
+            await communicators[index % len(communicators)].send_json_to(
+                {"message": repr(time.perf_counter())}
+            )
+        return count
+
+    async def _receive(
+        self, communicator, latencies, last_received, traffic, sending, drain_timeout=2
+    ):
+        while True:
+            try:
+                # Read the output queue directly: receive_from() cancels the
+                # consumer when it times out.
+                output = await asyncio.wait_for(
+                    communicator.output_queue.get(), 0.1 if not sending.is_set() else drain_timeout
+                )
+            except asyncio.TimeoutError:
+                if sending.is_set():
+                    return
+                continue
+            received = time.perf_counter()
+            if output["type"] != "websocket.send":
+                continue
+            frame = decode_frame(output.get("text"), output.get("bytes"))
+            traffic["frames"] += 1
+            traffic["bytes"] += len(output.get("bytes") or output["text"].encode())
+            for message in frame["frames"] if frame.get("type") == "batch" else [frame]:
+                if "message" in message:
+                    latencies.append((received - float(message["message"])) * 1000)
+                    last_received[0] = max(last_received[0], received)
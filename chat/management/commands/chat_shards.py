@@ -0,0 +1,38 @@
+import json
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from chat.layers import shard_report
+from chat.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the health and throughput of every shard of the chat channel layer, "
+        "and how many chat rooms it serves, as JSON. Fails if a shard is unhealthy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds over which commands per second are measured",
+        )
+        parser.add_argument("--output", help="JSON file to write, stdout by default")
+
+    def handle(self, *args, **options):
+        if options["interval"] < 0:
+            raise CommandError("interval must not be negative")
+        room_names = list(ChatRoom.objects.values_list("name", flat=True))
+        shards = async_to_sync(shard_report)(get_channel_layer(), room_names, options["interval"])
+
+        report = json.dumps({"shards": shards}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report)
+        self.stdout.write(report)
+
+        unhealthy = [shard["host"] for shard in shards if not shard["healthy"]]
+        if unhealthy:
+            raise CommandError(f"Unhealthy chat shards: {', '.join(unhealthy)}")
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["room", "timestamp", "id"], name="chat_message_history_idx"
+            ),
+        ),
+    ]
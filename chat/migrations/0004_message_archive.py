@@ -0,0 +1,67 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0003_message_server_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatroom",
+            name="retention_days",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Days messages stay in the message table before they are archived, CHAT_RETENTION_DAYS if empty",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="ChatArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_timestamp", models.DateTimeField()),
+                ("first_id", models.BigIntegerField()),
+                ("last_timestamp", models.DateTimeField()),
+                ("last_id", models.BigIntegerField()),
+                ("message_count", models.PositiveIntegerField()),
+                (
+                    "data",
+                    models.BinaryField(
+                        help_text="The serialized messages as gzipped JSON lines, oldest first"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "room",
+                    models.ForeignKey(
+                        help_text="The chat room the messages belong to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archives",
+                        to="chat.chatroom",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["first_timestamp", "first_id"],
+                "indexes": [
+                    models.Index(
+                        fields=["room", "first_timestamp", "first_id"],
+                        name="chat_archive_range_idx",
+                    )
+                ],
+            },
+        ),
+    ]
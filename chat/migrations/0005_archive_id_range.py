@@ -0,0 +1,44 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:14
+
+import gzip
+import json
+from django.db import migrations, models
+
+
+def fill_id_ranges(apps, schema_editor):
+    ChatArchive = apps.get_model("chat", "ChatArchive")
+    for chunk in ChatArchive.objects.iterator(chunk_size=100):
+        ids = [
+            json.loads(line)["id"]
+            for line in gzip.decompress(bytes(chunk.data)).decode().splitlines()
+        ]
+        chunk.min_id = min(ids, default=chunk.first_id)
+        chunk.max_id = max(ids, default=chunk.last_id)
+        chunk.save(update_fields=["min_id", "max_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_message_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatarchive",
+            name="max_id",
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="chatarchive",
+            name="min_id",
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_id_ranges, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="chatarchive",
+            index=models.Index(fields=["room", "min_id"], name="chat_archive_id_idx"),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from courses.models import Course # Assuming you want to link chat rooms to courses
 
 class ChatRoom(models.Model):
@@ -21,6 +22,12 @@ class ChatRoom(models.Model):
         blank=True,
         help_text="Users participating in this chat room"
     )
+    retention_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Days messages stay in the message table before they are archived, "
+        "CHAT_RETENTION_DAYS if empty"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -45,10 +52,50 @@ class ChatMessage(models.Model):
         help_text="The user who sent this message"
     )
     content = models.TextField(help_text="The content of the message")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by the server when the message is received, see chat.buffer
+    timestamp = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"Message from {self.sender} in {self.room.name} at {self.timestamp}"
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # History pages walk a room newest first, see chat.history
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_message_history_idx'),
+        ]
+
+class ChatArchive(models.Model):
+    """
+    A chunk of old messages of a room, moved out of ChatMessage by chat.archive.
+    """
+    room = models.ForeignKey(
+        ChatRoom,
+        related_name='archives',
+        on_delete=models.CASCADE,
+        help_text="The chat room the messages belong to"
+    )
+    # Range of the chunk in history order, chunks of a room do not overlap
+    first_timestamp = models.DateTimeField()
+    first_id = models.BigIntegerField()
+    last_timestamp = models.DateTimeField()
+    last_id = models.BigIntegerField()
+    # Ids are not ordered by time across processes, so the range of ids is
+    # kept apart from the first and last message
+    min_id = models.BigIntegerField()
+    max_id = models.BigIntegerField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField(help_text="The serialized messages as gzipped JSON lines, oldest first")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.message_count} archived messages of {self.room.name}"
+
+    class Meta:
+        ordering = ['first_timestamp', 'first_id']
+        indexes = [
+            models.Index(
+                fields=['room', 'first_timestamp', 'first_id'], name='chat_archive_range_idx'
+            ),
+            models.Index(fields=['room', 'min_id'], name='chat_archive_id_idx'),
+        ]
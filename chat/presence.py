@@ -0,0 +1,383 @@
+"""
+Who is online in the chat rooms.
+
+Every open websocket is a connection that expires unless its process
+refreshes it, and every room keeps its online users with their number of
+open connections, so a user with several tabs is online once and
+``is_online`` and ``online_count`` are O(1). Each process refreshes the
+connections it holds every CHAT_PRESENCE_HEARTBEAT_SECONDS; those of a
+process that died expire after CHAT_PRESENCE_TTL_SECONDS and are swept by
+the processes still running.
+
+Users coming online or going offline are not broadcast one by one: the
+``presence_tracker`` of each process sends one ``presence.update`` event
+per room every CHAT_PRESENCE_BROADCAST_MS.
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .layers import room_group
+
+
+class InMemoryPresence:
+    """Process-local presence, for development and tests only."""
+
+    def __init__(self):
+        # (room, user_id, channel_name) -> expiry time
+        self._expires = {}
+        # room -> {user_id: open connections}
+        self._users = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def connect(self, room, user_id, channel_name, ttl):
+        """
+        Register a connection, or extend it if it is known.
+
+        Returns:
+            bool: True if the user just came online in the room
+        """
+        key = (room, user_id, channel_name)
+        with self._lock:
+            known = key in self._expires
+            self._expires[key] = time.time() + ttl
+            if known:
+                return False
+            users = self._users[room]
+            users[user_id] = users.get(user_id, 0) + 1
+            return users[user_id] == 1
+
+    def refresh(self, connections, ttl):
+        """
+        Extend connections, registering again those that expired meanwhile.
+
+        Args:
+            connections: Iterable of (room, user_id, channel_name)
+            ttl: Seconds until the connections expire
+
+        Returns:
+            list: (room, user_id) of the users that came online again
+        """
+        return [
+            (room, user_id)
+            for room, user_id, channel_name in connections
+            if self.connect(room, user_id, channel_name, ttl)
+        ]
+
+    def disconnect(self, room, user_id, channel_name):
+        """
+        Remove a connection.
+
+        Returns:
+            bool: True if it was the last connection of the user in the room
+        """
+        with self._lock:
+            if self._expires.pop((room, user_id, channel_name), None) is None:
+                return False
+            return self._release(room, user_id)
+
+    def _release(self, room, user_id):
+        users = self._users[room]
+        users[user_id] -= 1
+        if users[user_id] > 0:
+            return False
+        del users[user_id]
+        if not users:
+            del self._users[room]
+        return True
+
+    def expire(self, limit=1000):
+        """
+        Remove up to ``limit`` expired connections.
+
+        Returns:
+            list: (room, user_id) of the users that went offline
+        """
+        now = time.time()
+        with self._lock:
+            expired = [key for key, expires in self._expires.items() if expires <= now]
+            offline = []
+            for room, user_id, channel_name in expired[:limit]:
+                del self._expires[(room, user_id, channel_name)]
+                if self._release(room, user_id):
+                    offline.append((room, user_id))
+            return offline
+
+    def is_online(self, room, user_id):
+        return user_id in self._users.get(room, {})
+
+    def online_count(self, room):
+        return len(self._users.get(room, {}))
+
+    def online_users(self, room):
+        return set(self._users.get(room, {}))
+
+
+# The scripts keep the connections and the per-room counts consistent.
+# KEYS[1] is the sorted set of connections scored by expiry time, KEYS[2]
+# the hash of a room's online users.
+CONNECT_SCRIPT = """
+if redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[3], 1) == 1 then
+    return 1
+end
+return 0
+"""
+
+DISCONNECT_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) > 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[2])
+return 1
+"""
+
+EXPIRE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local offline = {}
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], member)
+    local room, user = string.match(member, '^(.-)|(%d+)|')
+    local key = ARGV[3] .. room
+    if redis.call('HINCRBY', key, user, -1) <= 0 then
+        redis.call('HDEL', key, user)
+        table.insert(offline, room .. '|' .. user)
+    end
+end
+return offline
+"""
+
+
+class RedisPresence:
+    """Presence shared by all ASGI processes through Redis."""
+
+    connections_key = 'chat:presence:connections'
+    room_key_prefix = 'chat:presence:room:'
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+
+        self._redis = get_redis_connection('default')
+        self._connect = self._redis.register_script(CONNECT_SCRIPT)
+        self._disconnect = self._redis.register_script(DISCONNECT_SCRIPT)
+        self._expire = self._redis.register_script(EXPIRE_SCRIPT)
+
+    def _room_key(self, room):
+        return f'{self.room_key_prefix}{room}'
+
+    @staticmethod
+    def _member(room, user_id, channel_name):
+        # Room names are slugs and never contain "|"
+        return f'{room}|{user_id}|{channel_name}'
+
+    def connect(self, room, user_id, channel_name, ttl, client=None):
+        return bool(
+            self._connect(
+                keys=[self.connections_key, self._room_key(room)],
+                args=[self._member(room, user_id, channel_name), time.time() + ttl, user_id],
+                client=client,
+            )
+        )
+
+    def refresh(self, connections, ttl):
+        connections = list(connections)
+        pipeline = self._redis.pipeline(transaction=False)
+        for room, user_id, channel_name in connections:
+            self.connect(room, user_id, channel_name, ttl, client=pipeline)
+        online = pipeline.execute()
+        return [
+            (room, user_id)
+            for (room, user_id, _), came_online in zip(connections, online)
+            if came_online
+        ]
+
+    def disconnect(self, room, user_id, channel_name):
+        return bool(
+            self._disconnect(
+                keys=[self.connections_key, self._room_key(room)],
+                args=[self._member(room, user_id, channel_name), user_id],
+            )
+        )
+
+    def expire(self, limit=1000):
+        offline = self._expire(
+            keys=[self.connections_key],
+            args=[time.time(), limit, self.room_key_prefix],
+        )
+        return [
+            (room, int(user_id))
+            for room, user_id in (entry.decode().rsplit('|', 1) for entry in offline)
+        ]
+
+    def is_online(self, room, user_id):
+        return bool(self._redis.hexists(self._room_key(room), user_id))
+
+    def online_count(self, room):
+        return self._redis.hlen(self._room_key(room))
+
+    def online_users(self, room):
+        return {int(user_id) for user_id in self._redis.hkeys(self._room_key(room))}
+
+
+PRESENCE_BACKENDS = {
+    'memory': InMemoryPresence,
+    'redis': RedisPresence,
+}
+
+_backends = {}
+
+
+def get_presence():
+    """Return the presence backend configured by ``CHAT_PRESENCE_BACKEND``."""
+    name = settings.CHAT_PRESENCE_BACKEND
+    if name not in _backends:
+        _backends[name] = PRESENCE_BACKENDS[name]()
+    return _backends[name]
+
+
+class PresenceTracker:
+    """The connections of a process and the presence changes it has yet to broadcast."""
+
+    def __init__(self):
+        # channel_name -> (room, user_id, username)
+        self._connections = {}
+        # room -> {user_id: username} and room -> {user_id}
+        self._joined = defaultdict(dict)
+        self._left = defaultdict(set)
+        self._lock = threading.Lock()
+        self._task = None
+
+    def connect(self, room, user, channel_name):
+        """
+        Register a websocket of ``user`` in ``room``.
+
+        Returns:
+            bool: True if the user just came online in the room
+        """
+        with self._lock:
+            self._connections[channel_name] = (room, user.id, user.username)
+        online = get_presence().connect(
+            room, user.id, channel_name, settings.CHAT_PRESENCE_TTL_SECONDS
+        )
+        if online:
+            self._came_online(room, user.id, user.username)
+        return online
+
+    def disconnect(self, channel_name):
+        """
+        Remove a websocket registered by ``connect``.
+
+        Returns:
+            bool: True if it was the last connection of the user in the room
+        """
+        with self._lock:
+            connection = self._connections.pop(channel_name, None)
+        if connection is None:
+            return False
+        room, user_id, _ = connection
+        offline = get_presence().disconnect(room, user_id, channel_name)
+        if offline:
+            self._went_offline(room, user_id)
+        return offline
+
+    def _came_online(self, room, user_id, username):
+        with self._lock:
+            if user_id in self._left[room]:
+                # Left and came back since the last broadcast, nothing changed
+                self._left[room].discard(user_id)
+            else:
+                self._joined[room][user_id] = username
+
+    def _went_offline(self, room, user_id):
+        with self._lock:
+            if self._joined[room].pop(user_id, None) is None:
+                self._left[room].add(user_id)
+
+    def heartbeat(self):
+        """Refresh the connections of this process and sweep expired ones."""
+        presence = get_presence()
+        with self._lock:
+            connections = dict(self._connections)
+        online = presence.refresh(
+            [(room, user_id, channel_name) for channel_name, (room, user_id, _) in connections.items()],
+            settings.CHAT_PRESENCE_TTL_SECONDS,
+        )
+        usernames = {(room, user_id): username for room, user_id, username in connections.values()}
+        for room, user_id in online:
+            self._came_online(room, user_id, usernames[(room, user_id)])
+        for room, user_id in presence.expire():
+            self._went_offline(room, user_id)
+
+    def pending(self):
+        """Take the changes to broadcast, by room."""
+        with self._lock:
+            joined, self._joined = self._joined, defaultdict(dict)
+            left, self._left = self._left, defaultdict(set)
+        return {
+            room: (joined.get(room, {}), left.get(room, set()))
+            for room in set(joined) | set(left)
+            if joined.get(room) or left.get(room)
+        }
+
+    async def broadcast(self):
+        """Send one presence.update event to every room whose online users changed."""
+        changes = self.pending()
+        if not changes:
+            return
+        channel_layer = get_channel_layer()
+        presence = get_presence()
+        for room, (joined, left) in changes.items():
+            online = await sync_to_async(presence.online_count, thread_sensitive=False)(room)
+            await channel_layer.group_send(
+                room_group(room),
+                {
+                    'type': 'presence.update',
+                    'joined': [
+                        {'id': user_id, 'username': username}
+                        for user_id, username in joined.items()
+                    ],
+                    'left': sorted(left),
+                    'online': online,
+                },
+            )
+
+    def start(self):
+        """Run the heartbeats and broadcasts on the running event loop unless they already run there."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the heartbeats and send the pending broadcasts."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.broadcast()
+
+    async def _run(self):
+        last_heartbeat = time.monotonic()
+        while True:
+            await asyncio.sleep(settings.CHAT_PRESENCE_BROADCAST_MS / 1000)
+            try:
+                if time.monotonic() - last_heartbeat >= settings.CHAT_PRESENCE_HEARTBEAT_SECONDS:
+                    last_heartbeat = time.monotonic()
+                    await sync_to_async(self.heartbeat, thread_sensitive=False)()
+                await self.broadcast()
+            except Exception as e:
+                print(f"Error updating chat presence: {str(e)}")
+
+
+presence_tracker = PresenceTracker()
@@ -0,0 +1,122 @@
+"""
+Chat rooms resolved by name, cached per process.
+
+A room name is the slug of its course. Consumers resolve it once when
+they connect and keep the result, and the result is shared by every
+consumer of the process through a bounded LRU, so connecting to a known
+room and saving a message need no lookups. The cached entry also records
+who already joined, loaded along with the room, so participants are only
+written when a user joins the room for the first time.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.db.models import Q
+from courses.models import Course
+from .models import ChatRoom
+
+# participant_ids is a set of the users known to be participants
+ResolvedRoom = namedtuple('ResolvedRoom', ['id', 'course_id', 'participant_ids'])
+
+
+class RoomCache:
+    """Least recently used rooms by name, shared by the consumers of a process."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            room = self._rooms.get(name)
+            if room is not None:
+                self._rooms.move_to_end(name)
+            return room
+
+    def put(self, name, room):
+        with self._lock:
+            self._rooms[name] = room
+            self._rooms.move_to_end(name)
+            while len(self._rooms) > self.max_size:
+                self._rooms.popitem(last=False)
+
+    def evict(self, name):
+        with self._lock:
+            self._rooms.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+room_cache = RoomCache(settings.CHAT_ROOM_CACHE_SIZE)
+
+
+def resolve_room(name):
+    """
+    Return the room of a course, creating it on first use.
+
+    Args:
+        name: The room name, a course slug
+
+    Returns:
+        ResolvedRoom: The room, or None if there is no such course
+    """
+    room = room_cache.get(name)
+    if room is not None:
+        return room
+    course_id = Course.objects.filter(slug=name).values_list('id', flat=True).first()
+    if course_id is None:
+        return None
+    chat_room, _ = ChatRoom.objects.get_or_create(name=name, defaults={'course_id': course_id})
+    participant_ids = set(chat_room.participants.values_list('id', flat=True))
+    room = ResolvedRoom(chat_room.id, chat_room.course_id, participant_ids)
+    room_cache.put(name, room)
+    return room
+
+
+def join_room(room, user_id):
+    """
+    Add a user to the participants of a room unless already known.
+
+    Returns:
+        bool: True if the participants were written
+    """
+    if user_id in room.participant_ids:
+        return False
+    field = ChatRoom.participants.field
+    # A plain insert that ignores existing rows, instead of the read and
+    # write of participants.add()
+    ChatRoom.participants.through.objects.bulk_create(
+        [
+            ChatRoom.participants.through(
+                **{f'{field.m2m_field_name()}_id': room.id, f'{field.m2m_reverse_field_name()}_id': user_id}
+            )
+        ],
+        ignore_conflicts=True,
+    )
+    room.participant_ids.add(user_id)
+    return True
+
+
+def can_read_room(user, room):
+    """
+    Whether a user may read the messages and online users of a room.
+
+    Course rooms are open to the instructor and the enrolled students of
+    the course, other rooms to their participants.
+
+    Args:
+        user: The requesting user
+        room: The ChatRoom
+    """
+    if user.is_staff:
+        return True
+    if room.course_id is None:
+        return room.participants.filter(pk=user.pk).exists()
+    return (
+        Course.objects.filter(pk=room.course_id)
+        .filter(Q(owner=user) | Q(enrollments__user=user))
+        .exists()
+    )
@@ -0,0 +1,42 @@
+from rest_framework import serializers
+from .models import ChatMessage
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'sender_id', 'sender_username', 'content', 'timestamp']
+        read_only_fields = fields
+
+
+class ChatHistorySerializer(serializers.Serializer):
+    results = ChatMessageSerializer(many=True)
+    has_more = serializers.BooleanField()
+    next_before = serializers.IntegerField(allow_null=True)
+
+
+class ChatPresenceSerializer(serializers.Serializer):
+    online = serializers.IntegerField()
+    user_ids = serializers.ListField(child=serializers.IntegerField())
+
+
+class ChatMessageStatsSerializer(serializers.Serializer):
+    buffered = serializers.IntegerField()
+    flushed = serializers.IntegerField()
+    dropped = serializers.IntegerField()
+    failed_flushes = serializers.IntegerField()
+    pending = serializers.IntegerField()
+
+
+class ChatRateLimitStatsSerializer(serializers.Serializer):
+    delayed = serializers.IntegerField()
+    dropped_connection = serializers.IntegerField()
+    dropped_user = serializers.IntegerField()
+    slow_disconnects = serializers.IntegerField()
+
+
+class ChatMetricsSerializer(serializers.Serializer):
+    messages = ChatMessageStatsSerializer()
+    rate_limits = ChatRateLimitStatsSerializer()
@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .history import HISTORY_CACHE_KEY
+from .models import ChatMessage, ChatRoom
+from .rooms import room_cache
+
+
+@receiver(post_save, sender=ChatMessage)
+def message_saved(sender, instance, created, **kwargs):
+    """Drop the cached history window, the next read rebuilds it."""
+    cache.delete(HISTORY_CACHE_KEY.format(room_id=instance.room_id))
+
+
+@receiver(post_delete, sender=ChatRoom)
+def room_deleted(sender, instance, **kwargs):
+    room_cache.evict(instance.name)
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def participants_changed(sender, instance, action, reverse, **kwargs):
+    """Forget the cached participants when some are removed."""
+    if action not in ('post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Removed from the user side, the rooms are not known for post_clear
+        room_cache.clear()
+    else:
+        room_cache.evict(instance.name)
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+
+@shared_task
+def archive_chat_messages():
+    """Move chat messages past their room's retention to the archive."""
+    from .archive import archive_expired_messages
+
+    return archive_expired_messages()
@@ -1,3 +1,697 @@
-from django.test import TestCase
+import asyncio
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+import msgpack
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from courses.models import Course, Subject
+from enrollment.models import Enrollment
+from .buffer import WORKER_BITS, MessageBuffer, MessageIds
+from channels.testing import WebsocketCommunicator
+from .archive import archive_expired_messages, chunk_messages
+from .consumers import SLOW_CONNECTION_CLOSE_CODE, ChatConsumer
+from .frames import FORMATS, FrameCache, decode_frame
+from .history import HISTORY_CACHE_KEY
+from .layers import ShardedRedisChannelLayer, room_group, shard_report
+from .limits import ConnectionLimiter, TokenBucket, limit_stats
+from .limits import _backends as limit_backends
+from .models import ChatArchive, ChatMessage, ChatRoom
+from .presence import InMemoryPresence, PresenceTracker, _backends
+from .rooms import ResolvedRoom, RoomCache, join_room, resolve_room, room_cache
 
-# Create your tests here.
+User = get_user_model()
+
+# Course thumbnails saved by the tests go here instead of the repo's media/
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ChatHistoryTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+        subject = Subject.objects.create(title='test', slug='test')
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=subject,
+            required_time=10,
+            owner=self.user
+        )
+        self.room = ChatRoom.objects.create(name=self.course.slug, course=self.course)
+        # Bulk created messages share timestamps, so pages must break ties by id
+        ChatMessage.objects.bulk_create(
+            ChatMessage(room=self.room, sender=self.user, content=f'Message {index}')
+            for index in range(120)
+        )
+        self.url = reverse('chat-history', kwargs={'room_name': self.room.name})
+        self.client.force_authenticate(user=self.user)
+
+    def test_pages_walk_back_through_history(self):
+        contents = []
+        params = {}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            contents = [message['content'] for message in response.data['results']] + contents
+            if not response.data['has_more']:
+                self.assertIsNone(response.data['next_before'])
+                break
+            params = {'before': response.data['next_before']}
+        self.assertEqual(contents, [f'Message {index}' for index in range(120)])
+
+    def test_recent_messages_are_cached(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'limit': 10})
+        self.assertFalse([query for query in context if 'chat_chatmessage' in query['sql']])
+        self.assertEqual(response.data['results'][-1]['content'], 'Message 119')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertTrue(response.data['has_more'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatMessage.objects.create(room=self.room, sender=self.user, content='New message')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][-1]['content'], 'New message')
+        self.assertEqual(response.data['results'][-1]['sender_username'], 'student')
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'before': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        other_room = ChatRoom.objects.create(name='other')
+        message = ChatMessage.objects.create(room=other_room, sender=self.user, content='Elsewhere')
+        self.assertEqual(self.client.get(self.url, {'before': message.id}).status_code, status.HTTP_404_NOT_FOUND)
+        url = reverse('chat-history', kwargs={'room_name': 'missing'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_only_members_read_history(self):
+        student = User.objects.create_user(
+            username='enrolled',
+            email='enrolled@example.com',
+            password='testpassword123',
+        )
+        self.client.force_authenticate(user=student)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        Enrollment.objects.create(user=student, course=self.course, deadline=timezone.now().date())
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class RoomResolutionTest(APITestCase):
+    def setUp(self):
+        room_cache.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+        subject = Subject.objects.create(title='test', slug='test')
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=subject,
+            required_time=10,
+            owner=self.user
+        )
+
+    def test_room_is_resolved_once(self):
+        room = resolve_room(self.course.slug)
+        self.assertEqual(ChatRoom.objects.get(pk=room.id).course, self.course)
+        with self.assertNumQueries(0):
+            self.assertIs(resolve_room(self.course.slug), room)
+        self.assertIsNone(resolve_room('missing'))
+
+    def test_participants_written_once(self):
+        room = resolve_room(self.course.slug)
+        with self.assertNumQueries(1):
+            self.assertTrue(join_room(room, self.user.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(join_room(room, self.user.id))
+        self.assertEqual(list(ChatRoom.objects.get(pk=room.id).participants.all()), [self.user])
+
+        # A fresh process loads the participants with the room
+        room_cache.clear()
+        room = resolve_room(self.course.slug)
+        with self.assertNumQueries(0):
+            self.assertFalse(join_room(room, self.user.id))
+        self.assertEqual(ChatRoom.objects.get(pk=room.id).participants.count(), 1)
+
+    def test_deleted_rooms_are_evicted(self):
+        room = resolve_room(self.course.slug)
+        self.course.delete()
+        self.assertIsNone(room_cache.get(self.course.slug))
+        self.assertFalse(ChatRoom.objects.filter(pk=room.id).exists())
+
+    def test_cache_is_bounded(self):
+        cache = RoomCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+
+class MessageBufferTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+        self.room = ChatRoom.objects.create(name='room')
+        self.ids = MessageIds(worker_id=3)
+        self.buffer = MessageBuffer(batch_size=10, max_size=100)
+
+    def _message(self, content='Hello'):
+        return ChatMessage(id=self.ids.next(), room=self.room, sender=self.user, content=content)
+
+    def test_ids_increase(self):
+        ids = [self.ids.next() for _ in range(1000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLess(ids[-1], 2 ** 53)
+
+    def test_flush_writes_in_batches(self):
+        cache.set(HISTORY_CACHE_KEY.format(room_id=self.room.id), {'results': [], 'has_more': False})
+        messages = [self._message(f'Message {index}') for index in range(25)]
+        for message in messages:
+            self.buffer.add(message)
+        with self.assertNumQueries(3 * 3):  # A savepoint around each batch insert
+            self.assertEqual(self.buffer.flush(), 25)
+        self.assertEqual(
+            list(ChatMessage.objects.order_by('id').values_list('id', flat=True)),
+            [message.id for message in messages],
+        )
+        self.assertIsNone(cache.get(HISTORY_CACHE_KEY.format(room_id=self.room.id)))
+        self.assertEqual(self.buffer.stats(), {
+            'buffered': 25, 'flushed': 25, 'dropped': 0, 'failed_flushes': 0, 'pending': 0,
+        })
+
+    def test_rejected_messages_are_dropped(self):
+        self.buffer.add(self._message('First'))
+        self.buffer.add(self._message(None))
+        self.buffer.add(self._message('Last'))
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(list(ChatMessage.objects.values_list('content', flat=True)), ['First', 'Last'])
+        self.assertEqual(self.buffer.stats()['dropped'], 1)
+
+    def test_duplicate_id_is_dropped_not_renumbered(self):
+        first = self._message('First')
+        first.save()
+        duplicate = ChatMessage(id=first.id, room=self.room, sender=self.user, content='Again')
+        self.buffer.add(duplicate)
+        self.buffer.add(self._message('Last'))
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(duplicate.id, first.id)
+        self.assertEqual(list(ChatMessage.objects.values_list('content', flat=True)), ['First', 'Last'])
+
+    def test_worker_id_falls_back_without_redis(self):
+        ids = MessageIds()
+        ids.next()
+        self.assertLess(ids.worker_id, 2 ** WORKER_BITS)
+        self.assertFalse(ids.renewal_due())
+
+    def test_oldest_messages_dropped_when_full(self):
+        buffer = MessageBuffer(batch_size=10, max_size=3)
+        for index in range(5):
+            buffer.add(self._message(f'Message {index}'))
+        self.assertEqual(buffer.stats()['dropped'], 2)
+        buffer.flush()
+        self.assertEqual(
+            list(ChatMessage.objects.values_list('content', flat=True)),
+            ['Message 2', 'Message 3', 'Message 4'],
+        )
+
+    def test_flusher_task(self):
+        async def run():
+            self.buffer.start(interval=60)
+            for index in range(10):
+                self.buffer.add(self._message(f'Message {index}'))
+            # A full batch wakes the flusher before the interval
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if self.buffer.stats()['flushed']:
+                    break
+            self.buffer.add(self._message('Last'))
+            await self.buffer.stop()
+
+        async_to_sync(run)()
+        self.assertEqual(ChatMessage.objects.count(), 11)
+
+
+@override_settings(CHAT_PRESENCE_BACKEND='memory', CHAT_PRESENCE_TTL_SECONDS=60)
+class PresenceTest(APITestCase):
+    def setUp(self):
+        _backends.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='testpassword123',
+        )
+        self.tracker = PresenceTracker()
+
+    def test_tabs_count_once(self):
+        presence = InMemoryPresence()
+        self.assertTrue(presence.connect('room', 1, 'tab-1', ttl=60))
+        self.assertFalse(presence.connect('room', 1, 'tab-2', ttl=60))
+        self.assertFalse(presence.connect('room', 1, 'tab-1', ttl=60))
+        self.assertEqual(presence.online_count('room'), 1)
+        self.assertFalse(presence.disconnect('room', 1, 'tab-1'))
+        self.assertTrue(presence.is_online('room', 1))
+        self.assertTrue(presence.disconnect('room', 1, 'tab-2'))
+        self.assertFalse(presence.is_online('room', 1))
+        self.assertFalse(presence.disconnect('room', 1, 'tab-2'))
+
+    def test_connections_expire(self):
+        presence = InMemoryPresence()
+        presence.connect('room', 1, 'tab-1', ttl=-1)
+        presence.connect('room', 1, 'tab-2', ttl=-1)
+        presence.connect('room', 2, 'tab-3', ttl=60)
+        self.assertEqual(presence.expire(), [('room', 1)])
+        self.assertEqual(presence.online_users('room'), {2})
+
+        # A refresh after the connection expired brings the user back
+        self.assertEqual(
+            presence.refresh([('room', 1, 'tab-1'), ('room', 2, 'tab-3')], ttl=60), [('room', 1)]
+        )
+
+    def test_changes_are_batched(self):
+        self.tracker.connect('room', self.user, 'tab-1')
+        self.tracker.connect('room', self.user, 'tab-2')
+        self.tracker.connect('room', self.other, 'tab-3')
+        self.tracker.disconnect('tab-3')
+        self.assertEqual(
+            self.tracker.pending(), {'room': ({self.user.id: 'student'}, set())}
+        )
+
+        self.tracker.disconnect('tab-1')
+        self.assertEqual(self.tracker.pending(), {})
+        self.tracker.disconnect('tab-2')
+        self.tracker.connect('room', self.user, 'tab-4')
+        self.assertEqual(self.tracker.pending(), {})
+        self.tracker.disconnect('tab-4')
+        self.assertEqual(self.tracker.pending(), {'room': ({}, {self.user.id})})
+
+    def test_heartbeat_sweeps_expired_connections(self):
+        with override_settings(CHAT_PRESENCE_TTL_SECONDS=-1):
+            self.tracker.connect('room', self.user, 'tab-1')
+        # Left behind by a process that died
+        _backends['memory'].connect('room', self.other.id, 'gone', ttl=-1)
+        self.tracker.pending()
+        self.tracker.heartbeat()
+        self.assertEqual(_backends['memory'].online_users('room'), {self.user.id})
+        self.assertEqual(self.tracker.pending(), {'room': ({}, {self.other.id})})
+
+    def test_broadcast(self):
+        async def run():
+            channel_layer = get_channel_layer()
+            channel_name = await channel_layer.new_channel()
+            await channel_layer.group_add('chat_room', channel_name)
+            self.tracker.connect('room', self.user, 'tab-1')
+            await self.tracker.broadcast()
+            return await channel_layer.receive(channel_name)
+
+        self.assertEqual(async_to_sync(run)(), {
+            'type': 'presence.update',
+            'joined': [{'id': self.user.id, 'username': 'student'}],
+            'left': [],
+            'online': 1,
+        })
+
+    def test_online_endpoint(self):
+        room = ChatRoom.objects.create(name='room')
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(reverse('chat-presence', kwargs={'room_name': 'room'}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        room.participants.add(self.user)
+        self.tracker.connect('room', self.user, 'tab-1')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('chat-presence', kwargs={'room_name': 'room'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'online': 1, 'user_ids': [self.user.id]})
+        response = self.client.get(reverse('chat-presence', kwargs={'room_name': 'missing'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ShardedChannelLayerTest(APITestCase):
+    hosts = [f'redis://127.0.0.1:{port}/0' for port in (6380, 6381, 6382, 6383)]
+    groups = [room_group(f'course-{index}') for index in range(4000)]
+
+    def test_groups_spread_over_hosts(self):
+        layer = ShardedRedisChannelLayer(hosts=self.hosts)
+        shards = [layer.consistent_hash(group) for group in self.groups]
+        for index in range(len(self.hosts)):
+            self.assertGreater(shards.count(index), len(self.groups) / len(self.hosts) * 0.7)
+        # Every process places a group on the same host
+        other = ShardedRedisChannelLayer(hosts=self.hosts)
+        self.assertEqual(shards, [other.consistent_hash(group) for group in self.groups])
+
+    def test_adding_a_host_moves_few_groups(self):
+        before = ShardedRedisChannelLayer(hosts=self.hosts)
+        after = ShardedRedisChannelLayer(hosts=[*self.hosts, 'redis://127.0.0.1:6384/0'])
+        moved = [
+            group for group in self.groups
+            if before.consistent_hash(group) != after.consistent_hash(group)
+        ]
+        # About a fifth move, all of them to the new host
+        self.assertLess(len(moved), len(self.groups) * 0.3)
+        self.assertEqual({after.consistent_hash(group) for group in moved}, {4})
+
+    def test_credentials_do_not_place_groups(self):
+        layer = ShardedRedisChannelLayer(hosts=['redis://:secret@127.0.0.1:6380/0', *self.hosts[1:]])
+        other = ShardedRedisChannelLayer(hosts=self.hosts)
+        self.assertEqual(
+            [layer.consistent_hash(group) for group in self.groups[:100]],
+            [other.consistent_hash(group) for group in self.groups[:100]],
+        )
+
+    def test_report_of_memory_layer(self):
+        async def run():
+            layer = InMemoryChannelLayer()
+            await layer.group_add(room_group('course-1'), await layer.new_channel())
+            return await shard_report(layer, ['course-1', 'course-2'])
+
+        self.assertEqual(async_to_sync(run)(), [{
+            'shard': 0, 'host': 'InMemoryChannelLayer', 'healthy': True, 'rooms': 2, 'groups': 1,
+        }])
+
+    def test_unreachable_shard_is_unhealthy(self):
+        layers = {
+            'default': {
+                'BACKEND': 'chat.layers.ShardedRedisChannelLayer',
+                'CONFIG': {'hosts': ['redis://127.0.0.1:1/0']},
+            }
+        }
+        with override_settings(CHANNEL_LAYERS=layers), self.assertRaises(CommandError):
+            call_command('chat_shards', interval=0, stdout=io.StringIO())
+
+
+class StalledConsumer(ChatConsumer):
+    """A consumer whose client never reads its frames."""
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        await asyncio.Event().wait()
+
+
+class RecordingConsumer(ChatConsumer):
+    """A consumer that records the messages it would broadcast."""
+
+    broadcast = []
+
+    async def _broadcast(self, user, message_content):
+        self.broadcast.append(message_content)
+
+
+@override_settings(
+    CHAT_PRESENCE_BACKEND='memory',
+    CHAT_RATE_LIMIT_BACKEND='memory',
+    CHAT_RATE_LIMIT_PER_SECOND=1,
+    CHAT_RATE_LIMIT_BURST=2,
+    CHAT_USER_RATE_LIMIT_PER_SECOND=1,
+    CHAT_USER_RATE_LIMIT_BURST=3,
+    CHAT_RATE_LIMIT_MAX_DELAY_MS=0,
+    CHAT_OUTBOUND_QUEUE_SIZE=3,
+)
+class RateLimitTest(APITestCase):
+    def setUp(self):
+        limit_stats.reset()
+        limit_backends.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2, burst=2)
+        now = bucket.updated
+        self.assertEqual(bucket.take(now=now), 0)
+        self.assertEqual(bucket.take(now=now), 0)
+        self.assertIsNone(bucket.take(now=now))
+        # The next token is due in half a second and can be reserved
+        self.assertEqual(bucket.take(max_wait=1, now=now), 0.5)
+        self.assertEqual(bucket.take(max_wait=1, now=now + 0.5), 0.5)
+        self.assertEqual(bucket.take(now=now + 5), 0)
+
+    def test_connection_and_user_limits(self):
+        async def run():
+            first, second = ConnectionLimiter(self.user.id), ConnectionLimiter(self.user.id)
+            waits = [await first.acquire() for _ in range(3)]
+            waits += [await second.acquire() for _ in range(2)]
+            return waits
+
+        self.assertEqual(async_to_sync(run)(), [0, 0, None, 0, None])
+        self.assertEqual(limit_stats.stats(), {
+            'delayed': 0, 'dropped_connection': 1, 'dropped_user': 1, 'slow_disconnects': 0,
+        })
+
+    def _connect(self, consumer, subprotocols=None):
+        room_cache.put('room', ResolvedRoom(1, 1, {self.user.id}))
+        communicator = WebsocketCommunicator(
+            consumer.as_asgi(), '/ws/chat/room/', subprotocols=subprotocols
+        )
+        communicator.scope['user'] = self.user
+        communicator.scope['url_route'] = {'kwargs': {'room_name': 'room'}}
+        return communicator
+
+    def test_messages_over_the_limit_are_dropped(self):
+        async def run():
+            communicator = self._connect(ChatConsumer)
+            await communicator.connect()
+            await communicator.send_json_to({'message': 'Hello'})
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        with override_settings(CHAT_RATE_LIMIT_BURST=0):
+            response = async_to_sync(run)()
+        self.assertEqual(response, {'error': 'Rate limit exceeded, message dropped.'})
+        self.assertEqual(limit_stats.stats()['dropped_connection'], 1)
+        room_cache.clear()
+
+    def test_delayed_message_does_not_hold_back_incoming_frames(self):
+        async def run():
+            communicator = self._connect(RecordingConsumer)
+            await communicator.connect()
+            await communicator.send_json_to({'message': 'First'})
+            await communicator.send_json_to({'message': 'Second'})
+            await asyncio.sleep(0.1)
+            await get_channel_layer().group_send(room_group('room'), self._event(1, self.user.id + 1))
+            frame = await communicator.receive_json_from(timeout=0.5)
+            sent_before_frame = list(RecordingConsumer.broadcast)
+            await asyncio.sleep(1.2)
+            await communicator.disconnect()
+            return frame, sent_before_frame
+
+        RecordingConsumer.broadcast = []
+        with override_settings(CHAT_RATE_LIMIT_BURST=1, CHAT_RATE_LIMIT_MAX_DELAY_MS=1000):
+            frame, sent_before_frame = async_to_sync(run)()
+        self.assertEqual(frame['id'], 1)
+        self.assertEqual(sent_before_frame, ['First'])
+        self.assertEqual(RecordingConsumer.broadcast, ['First', 'Second'])
+        self.assertEqual(limit_stats.stats()['delayed'], 1)
+        room_cache.clear()
+
+    def test_slow_connection_is_closed(self):
+        async def run():
+            communicator = self._connect(StalledConsumer)
+            await communicator.connect()
+            channel_layer = get_channel_layer()
+            for index in range(5):
+                await channel_layer.group_send(room_group('room'), self._event(index, self.user.id))
+            output = await communicator.receive_output()
+            await communicator.disconnect()
+            return output
+
+        self.assertEqual(async_to_sync(run)(), {
+            'type': 'websocket.close', 'code': SLOW_CONNECTION_CLOSE_CODE,
+        })
+        self.assertEqual(limit_stats.stats()['slow_disconnects'], 1)
+        room_cache.clear()
+
+    def test_metrics_endpoint(self):
+        limit_stats.count('delayed')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('chat-metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('chat-metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rate_limits']['delayed'], 1)
+        self.assertIn('pending', response.data['messages'])
+
+    def _event(self, message_id, sender_id):
+        return {
+            'type': 'chat.message',
+            'id': message_id,
+            'message': 'Hello',
+            'sender_id': sender_id,
+            'sender_username': 'student',
+            'timestamp': '',
+        }
+
+    def test_frames_are_encoded_once(self):
+        cache = FrameCache(max_size=10)
+        event = self._event(1, self.user.id)
+        frames = [cache.get(event, FORMATS['json'], False) for _ in range(50)]
+        self.assertEqual(cache.encoded, 1)
+        self.assertEqual(len(set(frames)), 1)
+        self.assertTrue(decode_frame(cache.get(event, FORMATS['json'], True))['is_self'])
+        self.assertEqual(
+            msgpack.unpackb(cache.get(event, FORMATS['msgpack'], False)),
+            {**decode_frame(frames[0]), 'is_self': False},
+        )
+        self.assertEqual(cache.encoded, 3)
+
+    @override_settings(CHAT_COALESCE_MS=50)
+    def test_msgpack_frames_are_batched(self):
+        async def run():
+            communicator = self._connect(
+                ChatConsumer, subprotocols=['chat.v2', 'chat.msgpack.batch']
+            )
+            _, subprotocol = await communicator.connect()
+            channel_layer = get_channel_layer()
+            for index in range(3):
+                event = self._event(index, sender_id=self.user.id + 1)
+                await channel_layer.group_send(room_group('room'), event)
+            output = await communicator.receive_output()
+            await communicator.disconnect()
+            return subprotocol, output
+
+        subprotocol, output = async_to_sync(run)()
+        self.assertEqual(subprotocol, 'chat.msgpack.batch')
+        frame = msgpack.unpackb(output['bytes'])
+        self.assertEqual(frame['type'], 'batch')
+        self.assertEqual([message['id'] for message in frame['frames']], [0, 1, 2])
+        self.assertFalse(frame['frames'][0]['is_self'])
+        room_cache.clear()
+
+
+@override_settings(CHAT_RETENTION_DAYS=30)
+class ChatArchiveTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+        self.room = ChatRoom.objects.create(name='room')
+        now = timezone.now()
+        ChatMessage.objects.bulk_create(
+            ChatMessage(
+                room=self.room,
+                sender=self.user,
+                content=f'Message {index}',
+                timestamp=now - timedelta(days=60) + timedelta(minutes=index),
+            )
+            for index in range(30)
+        )
+        ChatMessage.objects.bulk_create(
+            ChatMessage(
+                room=self.room,
+                sender=self.user,
+                content=f'Message {index}',
+                timestamp=now - timedelta(minutes=60 - index),
+            )
+            for index in range(30, 40)
+        )
+        self.room.participants.add(self.user)
+        self.url = reverse('chat-history', kwargs={'room_name': self.room.name})
+        self.client.force_authenticate(user=self.user)
+
+    def test_old_messages_are_archived_in_chunks(self):
+        self.assertEqual(archive_expired_messages(chunk_size=8, max_chunks=2), 16)
+        self.assertEqual(archive_expired_messages(chunk_size=8, max_chunks=2), 14)
+        self.assertEqual(archive_expired_messages(chunk_size=8, max_chunks=2), 0)
+
+        self.assertEqual(ChatMessage.objects.count(), 10)
+        chunks = list(ChatArchive.objects.all())
+        self.assertEqual([chunk.message_count for chunk in chunks], [8, 8, 8, 6])
+        self.assertEqual(
+            [message['content'] for chunk in chunks for message in chunk_messages(chunk)],
+            [f'Message {index}' for index in range(30)],
+        )
+
+    def test_room_retention(self):
+        self.room.retention_days = 90
+        self.room.save()
+        self.assertEqual(archive_expired_messages(), 0)
+        self.room.retention_days = 0
+        self.room.save()
+        self.assertEqual(archive_expired_messages(), 40)
+
+    def test_history_reads_the_archive(self):
+        self.client.get(self.url)
+        archive_expired_messages(chunk_size=8)
+
+        contents = []
+        params = {'limit': 7}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            contents = [message['content'] for message in response.data['results']] + contents
+            if not response.data['has_more']:
+                break
+            params['before'] = response.data['next_before']
+        self.assertEqual(contents, [f'Message {index}' for index in range(40)])
+
+        # An archived message is found to page back from
+        archived_id = chunk_messages(ChatArchive.objects.last())[2]['id']
+        response = self.client.get(self.url, {'before': archived_id, 'limit': 2})
+        self.assertEqual(
+            [message['content'] for message in response.data['results']],
+            ['Message 24', 'Message 25'],
+        )
+        response = self.client.get(self.url, {'before': 10 ** 12})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archived_ids_out_of_time_order(self):
+        # Messages of several processes, ids do not follow the timestamps
+        ChatMessage.objects.all().delete()
+        now = timezone.now()
+        ChatMessage.objects.bulk_create(
+            ChatMessage(
+                id=message_id,
+                room=self.room,
+                sender=self.user,
+                content=f'Message {index}',
+                timestamp=now - timedelta(days=60) + timedelta(minutes=index),
+            )
+            for index, message_id in enumerate([500, 100, 400, 200])
+        )
+        archive_expired_messages(chunk_size=2)
+        self.assertEqual(
+            list(ChatArchive.objects.values_list('min_id', 'max_id')), [(100, 500), (200, 400)]
+        )
+        response = self.client.get(self.url, {'before': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message['content'] for message in response.data['results']], ['Message 0'])
@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import ChatHistoryView, ChatMetricsView, ChatPresenceView
+
+urlpatterns = [
+    path('rooms/<str:room_name>/messages/', ChatHistoryView.as_view(), name='chat-history'),
+    path('rooms/<str:room_name>/online/', ChatPresenceView.as_view(), name='chat-presence'),
+    path('metrics/', ChatMetricsView.as_view(), name='chat-metrics'),
+]
@@ -1,3 +1,132 @@
-from django.shortcuts import render
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .buffer import message_buffer
+from .history import HISTORY_WINDOW, find_message, get_history
+from .limits import limit_stats
+from .models import ChatRoom
+from .presence import get_presence
+from .rooms import can_read_room
+from .serializers import ChatHistorySerializer, ChatMetricsSerializer, ChatPresenceSerializer
 
-# Create your views here.
+MAX_HISTORY_LIMIT = 100
+
+
+class ChatHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['chat'],
+        summary='Load chat history',
+        description='Get the messages of a chat room, newest page first. Pass the '
+        '`next_before` of a page as `before` to load the page before it.',
+        parameters=[
+            OpenApiParameter(
+                name='room_name',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.PATH,
+                description='Name of the chat room, the slug of its course',
+            ),
+            OpenApiParameter(
+                name='before',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description='Only return messages older than this message id',
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Number of messages, {HISTORY_WINDOW} by default and '
+                f'at most {MAX_HISTORY_LIMIT}',
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: ChatHistorySerializer,
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(description='Invalid before or limit'),
+            status.HTTP_403_FORBIDDEN: OpenApiResponse(description='Not a member of the room'),
+            status.HTTP_404_NOT_FOUND: OpenApiResponse(description='Room not found'),
+        },
+    )
+    def get(self, request, room_name):
+        room = ChatRoom.objects.filter(name=room_name).order_by('id').first()
+        if room is None:
+            return Response({'error': 'Room not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not can_read_room(request.user, room):
+            return Response(
+                {'error': 'You are not a member of this room'},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        try:
+            limit = int(request.query_params.get('limit', HISTORY_WINDOW))
+            before_id = request.query_params.get('before')
+            before_id = int(before_id) if before_id is not None else None
+        except ValueError:
+            return Response(
+                {'error': 'before and limit must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= limit <= MAX_HISTORY_LIMIT:
+            return Response(
+                {'error': f'limit must be between 1 and {MAX_HISTORY_LIMIT}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        before = None
+        if before_id is not None:
+            before = find_message(room.id, before_id)
+            if before is None:
+                return Response({'error': 'Message not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(get_history(room.id, limit, before))
+
+
+class ChatPresenceView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['chat'],
+        summary='List online users',
+        description='Get the number and ids of the users connected to a chat room.',
+        parameters=[
+            OpenApiParameter(
+                name='room_name',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.PATH,
+                description='Name of the chat room, the slug of its course',
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: ChatPresenceSerializer,
+            status.HTTP_403_FORBIDDEN: OpenApiResponse(description='Not a member of the room'),
+            status.HTTP_404_NOT_FOUND: OpenApiResponse(description='Room not found'),
+        },
+    )
+    def get(self, request, room_name):
+        room = ChatRoom.objects.filter(name=room_name).order_by('id').first()
+        if room is None:
+            return Response({'error': 'Room not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not can_read_room(request.user, room):
+            return Response(
+                {'error': 'You are not a member of this room'},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        user_ids = get_presence().online_users(room_name)
+        return Response({'online': len(user_ids), 'user_ids': sorted(user_ids)})
+
+
+class ChatMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=['chat'],
+        summary='Chat metrics',
+        description='Counters of the process answering the request: buffered and written '
+        'messages, messages delayed or dropped by the rate limits, and connections '
+        'closed for reading too slowly.',
+        responses={status.HTTP_200_OK: ChatMetricsSerializer},
+    )
+    def get(self, request):
+        return Response({'messages': message_buffer.stats(), 'rate_limits': limit_stats.stats()})
@@ -265,11 +265,15 @@ SESSION_CACHE_ALIAS = "default"
 ASGI_APPLICATION = "core.asgi.application"
 
 # Channel Layers
+# Chat fan-out has its own Redis, apart from the cache, sessions and the
+# Celery broker. List several comma separated URLs to shard the rooms
+# over them; every ASGI process must list the same hosts.
+CHAT_REDIS_HOSTS = env.list("CHAT_REDIS_HOSTS", default=["redis://127.0.0.1:6379/2"])
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "chat.layers.ShardedRedisChannelLayer",
         "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+            "hosts": CHAT_REDIS_HOSTS,
         },
     },
 }
@@ -281,6 +285,82 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    "flush-progress-heartbeats": {
+        "task": "courses.tasks.flush_progress_heartbeats",
+        "schedule": env.int("PROGRESS_HEARTBEAT_FLUSH_SECONDS", default=10),
+    },
+    "purge-upload-sessions": {
+        "task": "courses.tasks.purge_upload_sessions",
+        "schedule": 60 * 60,
+    },
+    "drain-media-tombstones": {
+        "task": "courses.tasks.drain_media_tombstones",
+        "schedule": env.int("MEDIA_TOMBSTONE_DRAIN_SECONDS", default=60),
+    },
+    "archive-chat-messages": {
+        "task": "chat.tasks.archive_chat_messages",
+        "schedule": env.int("CHAT_ARCHIVE_SECONDS", default=60 * 60),
+    },
+}
+
+# Buffer for video position heartbeats: "redis" is shared by all workers,
+# "memory" only works when the web server and the flusher share a process.
+PROGRESS_HEARTBEAT_BUFFER = env("PROGRESS_HEARTBEAT_BUFFER", default="redis")
+
+# Chat rooms each process keeps resolved for its websocket consumers
+CHAT_ROOM_CACHE_SIZE = env.int("CHAT_ROOM_CACHE_SIZE", default=1024)
+
+# Chat messages are broadcast at once and written in batches, every
+# CHAT_FLUSH_INTERVAL_MS or once CHAT_FLUSH_BATCH_SIZE are waiting. Every
+# ASGI process needs its own worker id (0-31) to keep message ids unique:
+# CHAT_WORKER_ID if set, otherwise one leased from Redis and renewed for
+# CHAT_WORKER_LEASE_SECONDS at a time.
+CHAT_FLUSH_INTERVAL_MS = env.int("CHAT_FLUSH_INTERVAL_MS", default=250)
+CHAT_FLUSH_BATCH_SIZE = env.int("CHAT_FLUSH_BATCH_SIZE", default=100)
+CHAT_BUFFER_MAX_MESSAGES = env.int("CHAT_BUFFER_MAX_MESSAGES", default=10000)
+CHAT_WORKER_ID = env.int("CHAT_WORKER_ID", default=None)
+CHAT_WORKER_LEASE_SECONDS = env.int("CHAT_WORKER_LEASE_SECONDS", default=60)
+
+# Online users of the chat rooms: "redis" is shared by all ASGI processes,
+# "memory" only sees the connections of its own process. Each process
+# refreshes its connections every CHAT_PRESENCE_HEARTBEAT_SECONDS, and
+# those not refreshed for CHAT_PRESENCE_TTL_SECONDS go offline. Joins and
+# leaves are broadcast in batches every CHAT_PRESENCE_BROADCAST_MS.
+CHAT_PRESENCE_BACKEND = env("CHAT_PRESENCE_BACKEND", default="redis")
+CHAT_PRESENCE_HEARTBEAT_SECONDS = env.int("CHAT_PRESENCE_HEARTBEAT_SECONDS", default=15)
+CHAT_PRESENCE_TTL_SECONDS = env.int("CHAT_PRESENCE_TTL_SECONDS", default=60)
+CHAT_PRESENCE_BROADCAST_MS = env.int("CHAT_PRESENCE_BROADCAST_MS", default=1000)
+
+# Chat messages each connection and each user may send, per second and in
+# a burst. Messages over a limit are delayed by up to
+# CHAT_RATE_LIMIT_MAX_DELAY_MS, dropped beyond that. The user limits are
+# kept per process ("memory") or shared through Redis ("redis").
+CHAT_RATE_LIMIT_PER_SECOND = env.float("CHAT_RATE_LIMIT_PER_SECOND", default=5)
+CHAT_RATE_LIMIT_BURST = env.int("CHAT_RATE_LIMIT_BURST", default=10)
+CHAT_USER_RATE_LIMIT_PER_SECOND = env.float("CHAT_USER_RATE_LIMIT_PER_SECOND", default=10)
+CHAT_USER_RATE_LIMIT_BURST = env.int("CHAT_USER_RATE_LIMIT_BURST", default=20)
+CHAT_RATE_LIMIT_MAX_DELAY_MS = env.int("CHAT_RATE_LIMIT_MAX_DELAY_MS", default=500)
+CHAT_RATE_LIMIT_BACKEND = env("CHAT_RATE_LIMIT_BACKEND", default="memory")
+
+# Frames waiting to be sent to a websocket; a connection that lets this
+# many pile up is closed with code 1013. The queue only fills while the
+# server's send() waits for the client, and Daphne's does not, so under
+# Daphne a client that reads slowly is buffered by the server and only
+# dropped by its --ping-timeout once it stops answering pings.
+CHAT_OUTBOUND_QUEUE_SIZE = env.int("CHAT_OUTBOUND_QUEUE_SIZE", default=256)
+
+# Window in which frames to clients of a ".batch" subprotocol are
+# coalesced into one, see chat.frames
+CHAT_COALESCE_MS = env.int("CHAT_COALESCE_MS", default=25)
+
+# Days chat messages stay in the message table unless their room sets its
+# own retention. Older ones are moved to the archive every
+# CHAT_ARCHIVE_SECONDS, in chunks of CHAT_ARCHIVE_CHUNK_SIZE messages and
+# at most CHAT_ARCHIVE_MAX_CHUNKS chunks per run.
+CHAT_RETENTION_DAYS = env.int("CHAT_RETENTION_DAYS", default=90)
+CHAT_ARCHIVE_CHUNK_SIZE = env.int("CHAT_ARCHIVE_CHUNK_SIZE", default=1000)
+CHAT_ARCHIVE_MAX_CHUNKS = env.int("CHAT_ARCHIVE_MAX_CHUNKS", default=100)
 
 # Cache time to live is 15 minutes
 CACHE_TTL = 60 * 15
@@ -298,6 +378,26 @@ CLOUDINARY_STORAGE = {
     "SECURE": True,
 }
 
+# Where uploaded media is stored: "cloudinary", or "local" to keep files
+# under MEDIA_ROOT for development and offline tests.
+MEDIA_UPLOAD_BACKEND = env("MEDIA_UPLOAD_BACKEND", default="cloudinary")
+
+# Connections kept open to Cloudinary per process, at least the number of
+# threads that upload or delete media concurrently.
+CLOUDINARY_HTTP_POOL_SIZE = env.int("CLOUDINARY_HTTP_POOL_SIZE", default=10)
+
+# Uploads wait here until the process_*_upload tasks transfer them. Web
+# and worker processes must share this directory.
+UPLOAD_STAGING_ROOT = env("UPLOAD_STAGING_ROOT", default=str(BASE_DIR / "media" / "staging"))
+
+# Resized course and content images, rendered by this many worker
+# processes per web process and cached in a directory of bounded size.
+IMAGE_DERIVATIVE_ROOT = env(
+    "IMAGE_DERIVATIVE_ROOT", default=str(BASE_DIR / "media" / "derivatives")
+)
+IMAGE_DERIVATIVE_CACHE_MB = env.int("IMAGE_DERIVATIVE_CACHE_MB", default=512)
+IMAGE_DERIVATIVE_WORKERS = env.int("IMAGE_DERIVATIVE_WORKERS", default=2)
+
 # Media files configuration
 if DEBUG:
     # Use local storage in development
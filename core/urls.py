@@ -11,6 +11,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
 from courses import instructor_urls, student_urls
+from courses.storage import UPLOAD_FOLDER
+from courses.views import serve_local_media
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -32,6 +34,7 @@ api_urlpatterns = [
     path("student/", include(student_urls)),
     path("enrollment/", include("enrollment.urls")),
     path("dashboard/", include("dashboard.urls")),
+    path("chat/", include("chat.urls")),
 ]
 
 # Main URL patterns
@@ -50,6 +53,17 @@ urlpatterns = [
     ),
 ]
 
+# Files of the local media backend, with range support for video seeking
+if settings.MEDIA_UPLOAD_BACKEND == "local":
+    urlpatterns.insert(
+        0,
+        path(
+            f"{settings.MEDIA_URL.strip('/')}/{UPLOAD_FOLDER}/<path:name>",
+            serve_local_media,
+            name="local_media",
+        ),
+    )
+
 # Serve media and static files in development
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
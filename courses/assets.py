@@ -0,0 +1,148 @@
+"""
+Content-addressed index of the files stored on the media backend.
+
+Uploads are keyed by the SHA-256 of their bytes. When a file with the same
+digest is already stored, the upload takes a reference on it instead of
+transferring the bytes again, and the file is only deleted from the media
+backend when its last reference is released.
+
+Releasing the last reference does not call the media backend. It queues a
+MediaTombstone in the same transaction as the delete, and the
+drain_media_tombstones task removes the queued files in batches.
+"""
+from django.db import transaction
+from django.db.models import F
+from .models import MediaTombstone, StoredAsset
+from .storage import get_media_storage
+
+# Files deleted per call to the media backend
+TOMBSTONE_BATCH_SIZE = 100
+
+# Tombstones that failed this many times are left for inspection
+TOMBSTONE_MAX_ATTEMPTS = 10
+
+
+def asset_result(asset):
+    """Return a stored asset in the shape of a ``MediaStorage.upload`` result."""
+    return {
+        "url": asset.url,
+        "public_id": asset.public_id,
+        "thumbnail_url": asset.thumbnail_url,
+    }
+
+
+def acquire_asset(sha256):
+    """
+    Take a reference on the stored file with this digest.
+
+    Args:
+        sha256: Hex SHA-256 of the uploaded bytes
+
+    Returns:
+        dict: The stored file like ``MediaStorage.upload`` returns it, or None if no
+        file with this digest is stored yet
+    """
+    with transaction.atomic():
+        asset = StoredAsset.objects.select_for_update().filter(sha256=sha256).first()
+        if asset is None:
+            return None
+        asset.ref_count = F("ref_count") + 1
+        asset.save(update_fields=["ref_count"])
+    return asset_result(asset)
+
+
+def register_asset(sha256, result, size):
+    """
+    Record a freshly uploaded file and take the first reference on it.
+
+    If the same bytes were stored by a concurrent upload in the meantime,
+    that file is used and the new copy is queued for deletion.
+
+    Args:
+        sha256: Hex SHA-256 of the uploaded bytes
+        result: The ``MediaStorage.upload`` result of the upload
+        size: Size of the file in bytes
+
+    Returns:
+        dict: The stored file to use
+    """
+    with transaction.atomic():
+        asset, created = StoredAsset.objects.select_for_update().get_or_create(
+            sha256=sha256,
+            defaults={
+                "public_id": result["public_id"],
+                "url": result["url"],
+                "thumbnail_url": result.get("thumbnail_url"),
+                "size": size,
+                "ref_count": 1,
+            },
+        )
+        if not created:
+            asset.ref_count = F("ref_count") + 1
+            asset.save(update_fields=["ref_count"])
+            MediaTombstone.objects.create(public_id=result["public_id"])
+    return asset_result(asset)
+
+
+def release_asset(public_id):
+    """
+    Drop a reference on a stored file, queueing it for deletion with the last one.
+
+    Files stored before the index existed have no StoredAsset and are
+    queued right away.
+
+    Args:
+        public_id: The public_id of the file
+
+    Returns:
+        bool: True if the file was queued for deletion
+    """
+    if not public_id:
+        return False
+    with transaction.atomic():
+        asset = StoredAsset.objects.select_for_update().filter(public_id=public_id).first()
+        if asset is not None and asset.ref_count > 1:
+            asset.ref_count = F("ref_count") - 1
+            asset.save(update_fields=["ref_count"])
+            return False
+        if asset is not None:
+            asset.delete()
+        MediaTombstone.objects.create(public_id=public_id)
+    return True
+
+
+def drain_tombstones(batch_size=TOMBSTONE_BATCH_SIZE):
+    """
+    Delete the queued files from the media backend.
+
+    Tombstones are taken in batches with one bulk delete each, and removed
+    once their file is gone. Failed ones count an attempt and are picked up
+    again by the next run, so a run stops at the first batch with failures
+    instead of hammering an unavailable backend. Rows locked by another
+    worker are skipped.
+
+    Args:
+        batch_size: Files per call to the media backend
+
+    Returns:
+        int: Number of files removed from the queue
+    """
+    storage = get_media_storage()
+    drained = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                MediaTombstone.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=TOMBSTONE_MAX_ATTEMPTS)
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                return drained
+            gone = set(storage.destroy_many([tomb.public_id for tomb in batch]))
+            done = [tomb.pk for tomb in batch if tomb.public_id in gone]
+            failed = [tomb.pk for tomb in batch if tomb.public_id not in gone]
+            MediaTombstone.objects.filter(pk__in=done).delete()
+            MediaTombstone.objects.filter(pk__in=failed).update(attempts=F("attempts") + 1)
+        drained += len(done)
+        if failed:
+            return drained
@@ -0,0 +1,22 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .uploads import UPLOAD_GROUP
+
+
+class UploadStatusConsumer(AsyncJsonWebsocketConsumer):
+    """Push the outcome of the user's background uploads as they finish."""
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = UPLOAD_GROUP.format(user_id=user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def upload_status(self, event):
+        await self.send_json(event["upload"])
@@ -0,0 +1,236 @@
+"""
+Resized copies of course thumbnails and image contents.
+
+Derivatives are rendered with Pillow in a process pool, so resizing large
+images neither holds the GIL of the web process nor blocks its other
+requests, and are kept in a size-bounded directory that evicts the least
+recently used files first.
+"""
+import hashlib
+import io
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Bounding boxes of the presets, all 16:9 like the course pages
+PRESETS = {
+    "thumbnail": (320, 180),
+    "card": (640, 360),
+    "hero": (1600, 900),
+}
+
+# Pillow format and content type per output format
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+QUALITY = 80
+
+# Seconds to wait for a worker before giving up on a render
+RENDER_TIMEOUT = 30
+
+# Share of the bound a full cache is evicted down to, so the directory is
+# scanned once per this much room freed rather than on every write
+EVICT_TO = 0.9
+
+# Bytes stored under each cache root as last counted by this process
+_sizes = {}
+_sizes_lock = threading.Lock()
+
+
+class DerivativeError(Exception):
+    """The source image could not be read or rendered."""
+
+
+def render_derivative(data, size, image_format, quality=QUALITY):
+    """
+    Resize and crop an image to ``size`` and encode it.
+
+    Runs in the worker processes, so it only depends on Pillow. Images
+    smaller than the preset are cropped to its aspect ratio but not
+    enlarged.
+
+    Args:
+        data: Bytes of the source image
+        size: (width, height) of the preset
+        image_format: Pillow format name, "WEBP" or "JPEG"
+        quality: Encoder quality
+
+    Returns:
+        bytes: The encoded derivative
+    """
+    width, height = size
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG sources are decoded at a reduced scale when possible
+        image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            transparent = "transparency" in image.info or image.mode in ("LA", "PA")
+            image = image.convert("RGBA" if transparent else "RGB")
+        scale = min(1, image.width / width, image.height / height)
+        image = ImageOps.fit(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            Image.LANCZOS,
+        )
+        if image.mode == "RGBA" and image_format == "JPEG":
+            # JPEG has no alpha channel, so transparency becomes white
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        output = io.BytesIO()
+        image.save(output, image_format, quality=quality)
+    return output.getvalue()
+
+
+class DerivativeCache:
+    """
+    Directory of rendered derivatives bounded to ``max_bytes``.
+
+    Reads touch the file, so the modification times order the entries by
+    last use and the oldest ones are evicted first. Several processes can
+    share the directory: each adds its own writes to the size found by its
+    last scan and scans again once that goes over ``max_bytes``.
+
+    Entries are returned as open files, which stay readable if another
+    request evicts them before they are sent.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """Return a cached derivative opened for reading, or None if it is not cached."""
+        path = self.path(key)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return file
+
+    def put(self, key, data):
+        """Store a derivative, evict old ones if the cache is full and return it opened."""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(key)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        file = open(temporary, "w+b")
+        file.write(data)
+        file.flush()
+        file.seek(0)
+        os.replace(temporary, path)
+        if self._grow(len(data)):
+            self.evict(keep=key)
+        return file
+
+    def _grow(self, size):
+        """Count a stored file, return True if the cache may be over its bound."""
+        with _sizes_lock:
+            total = _sizes.get(self.root)
+            if total is None:
+                return True
+            _sizes[self.root] = total + size
+            return total + size > self.max_bytes
+
+    def evict(self, keep=None):
+        """Delete the least recently used derivatives until the cache fits."""
+        entries = []
+        total = 0
+        with os.scandir(self.root) as scan:
+            for entry in scan:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                entries.append((stat.st_mtime, stat.st_size, entry.name))
+        if total > self.max_bytes:
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                if name == keep:
+                    continue
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with _sizes_lock:
+            _sizes[self.root] = total
+
+
+_executor = None
+
+
+def get_executor():
+    """Return the process pool rendering derivatives, started on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS)
+    return _executor
+
+
+def get_derivative_cache():
+    return DerivativeCache(
+        settings.IMAGE_DERIVATIVE_ROOT,
+        settings.IMAGE_DERIVATIVE_CACHE_MB * 1024 * 1024,
+    )
+
+
+def get_derivative(source_id, open_source, preset, output_format):
+    """
+    Return a derivative opened for reading, rendering it on a cache miss.
+
+    Args:
+        source_id: Name of the source file; a new file gets new derivatives
+        open_source: Callable returning the source as a binary file object
+        preset: Key of PRESETS
+        output_format: Key of FORMATS
+
+    Returns:
+        file: The derivative, to be closed by the caller
+
+    Raises:
+        DerivativeError: The source could not be read or is not an image
+    """
+    global _executor
+    size = PRESETS[preset]
+    key = hashlib.sha256(f"{source_id}|{size[0]}x{size[1]}|{QUALITY}".encode()).hexdigest()
+    key = f"{key}.{output_format}"
+    cache = get_derivative_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        source = open_source()
+        try:
+            data = source.read()
+        finally:
+            source.close()
+        rendered = (
+            get_executor()
+            .submit(render_derivative, data, size, FORMATS[output_format][0])
+            .result(timeout=RENDER_TIMEOUT)
+        )
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            # A worker died, start a new pool for the next request
+            _executor = None
+        print(f"Error rendering image derivative: {str(e)}")
+        raise DerivativeError(str(e))
+    return cache.put(key, rendered)
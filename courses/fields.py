@@ -1,35 +1,145 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from django.apps import apps
+from django.db import models, connections, router, transaction
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 
 
 class OrderField(models.PositiveIntegerField):
+    """
+    Position of an object among the objects sharing its ``for_fields``.
+
+    New positions come from a per-parent counter row in ``OrderSequence``
+    that is incremented in a single UPDATE ... RETURNING statement. The row
+    lock taken by the update serializes concurrent inserts into the same
+    parent, so two inserts can never receive the same position.
+    """
+
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super().__init__(*args, **kwargs)
 
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # filter by objects with the same field values
-                    # for the fields in "for_fields"
-                    query = {
-                        field: getattr(model_instance, field)
-                        for field in self.for_fields
-                    }
-                    qs = qs.filter(**query)
-                # get the order of the last item
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 0
+            value = self.allocate(model_instance)
             setattr(model_instance, self.attname, value)
             return value
         else:
             return super().pre_save(model_instance, add)
 
+    def _scope_columns(self):
+        return [
+            self.model._meta.get_field(field).get_attname_column()
+            for field in self.for_fields or []
+        ]
+
+    def sequence_scope(self, model_instance):
+        values = [
+            str(getattr(model_instance, attname))
+            for attname, column in self._scope_columns()
+        ]
+        return ":".join([self.model._meta.label_lower, self.attname, *values])
+
+    def allocate(self, model_instance):
+        """Reserve and return the next position for ``model_instance``."""
+        connection = connections[
+            router.db_for_write(self.model, instance=model_instance)
+        ]
+        quote = connection.ops.quote_name
+        sequence_table = quote(apps.get_model("courses", "OrderSequence")._meta.db_table)
+        scope = self.sequence_scope(model_instance)
+        scope_columns = self._scope_columns()
+        where = " AND ".join(
+            f"{quote(column)} = %s" for attname, column in scope_columns
+        ) or "1 = 1"
+        params = [getattr(model_instance, attname) for attname, column in scope_columns]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {sequence_table} SET value = value + 1 "
+                f"WHERE scope = %s RETURNING value",
+                [scope],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                # First insert since the sequence was created: seed it from
+                # the current maximum of the parent's existing rows.
+                cursor.execute(
+                    f"INSERT INTO {sequence_table} (scope, value) "
+                    f"SELECT %s, COALESCE(MAX({quote(self.column)}), -1) + 1 "
+                    f"FROM {quote(self.model._meta.db_table)} WHERE {where} "
+                    f"ON CONFLICT (scope) DO UPDATE "
+                    f"SET value = {sequence_table}.value + 1 RETURNING value",
+                    [scope, *params],
+                )
+                row = cursor.fetchone()
+        return row[0]
+
+    def lock_sequence(self, **scope):
+        """
+        Lock the position counter of one parent until the transaction ends.
+
+        ``allocate`` updates the same row, so inserts into the parent wait
+        until the lock is released. A missing counter is first created at
+        the parent's current maximum position, -1 when it has no rows, the
+        same seed ``allocate`` uses.
+
+        Args:
+            scope: The ``for_fields`` values of the parent, e.g. module=module
+
+        Returns:
+            OrderSequence: The locked counter
+        """
+        sequence, _ = (
+            apps.get_model("courses", "OrderSequence")
+            .objects.select_for_update()
+            .get_or_create(
+                scope=self.sequence_scope(self.model(**scope)),
+                defaults={
+                    "value": lambda: self.model._default_manager.filter(
+                        **scope
+                    ).aggregate(
+                        value=Coalesce(models.Max(self.attname), models.Value(-1))
+                    )["value"]
+                },
+            )
+        )
+        return sequence
+
+    def reorder(self, keys, key_field="slug", **scope):
+        """
+        Rewrite the positions of one parent's objects in one UPDATE statement.
+
+        The parent's counter is locked for the whole rewrite, so a
+        concurrent insert cannot be given one of the rewritten positions.
+
+        Args:
+            keys: Values of ``key_field`` in the new order, starting at 0
+            scope: The ``for_fields`` values of the parent, e.g. module=module
+
+        Returns:
+            int: Number of rows updated
+        """
+        if not keys:
+            return 0
+        positions = models.Case(
+            *[
+                models.When(**{key_field: key}, then=models.Value(position))
+                for position, key in enumerate(keys)
+            ],
+            output_field=models.PositiveIntegerField(),
+        )
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            sequence = self.lock_sequence(**scope)
+            updated = (
+                self.model._default_manager.filter(**scope)
+                .filter(**{f"{key_field}__in": keys})
+                .update(**{self.attname: positions})
+            )
+            # Continue numbering after the last rewritten position
+            sequence.value = len(keys) - 1
+            sequence.save(update_fields=["value"])
+        return updated
+
 
 class AutoSlugField(models.SlugField):
     def __init__(self, *args, populate_from=None, **kwargs):
@@ -0,0 +1,202 @@
+"""
+Write-coalescing buffer for video position heartbeats.
+
+Players report ``last_position`` every few seconds. Instead of writing a
+ContentProgress row per report, positions are kept in a buffer keyed by
+(student, content) where later reports overwrite earlier ones, and
+``flush_heartbeats`` periodically writes the latest positions back in bulk.
+The other fields a heartbeat answers with come from ``get_progress_fields``,
+so a heartbeat does not read the database either.
+"""
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from .models import Content, ContentProgress, UserModel
+
+# Reads and deletes the hash in one step, so a heartbeat is either drained
+# or left for the next flush, never lost between the read and the delete
+DRAIN_SCRIPT = """
+local positions = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return positions
+"""
+
+class InMemoryHeartbeatBuffer:
+    """Process-local buffer, for development and tests only."""
+
+    def __init__(self):
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def push(self, student_id, content_id, position):
+        with self._lock:
+            self._positions[(student_id, content_id)] = position
+
+    def get(self, student_id, content_id):
+        return self._positions.get((student_id, content_id))
+
+    def drain(self):
+        with self._lock:
+            positions, self._positions = self._positions, {}
+        return positions
+
+    def restore(self, positions):
+        """Put back drained positions that failed to flush, keeping newer ones."""
+        with self._lock:
+            for key, position in positions.items():
+                self._positions.setdefault(key, position)
+
+
+class RedisHeartbeatBuffer:
+    """Buffer shared by all web and Celery workers through a Redis hash."""
+
+    key = "progress:heartbeats"
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+
+        self._redis = get_redis_connection("default")
+        self._drain = self._redis.register_script(DRAIN_SCRIPT)
+
+    @staticmethod
+    def _field(student_id, content_id):
+        return f"{student_id}:{content_id}"
+
+    def push(self, student_id, content_id, position):
+        self._redis.hset(self.key, self._field(student_id, content_id), position)
+
+    def get(self, student_id, content_id):
+        position = self._redis.hget(self.key, self._field(student_id, content_id))
+        return float(position) if position is not None else None
+
+    def drain(self):
+        raw = self._drain(keys=[self.key])
+        positions = {}
+        for field, position in zip(raw[::2], raw[1::2]):
+            student_id, content_id = field.decode().split(":")
+            positions[(int(student_id), int(content_id))] = float(position)
+        return positions
+
+    def restore(self, positions):
+        """Put back drained positions that failed to flush, keeping newer ones."""
+        pipeline = self._redis.pipeline()
+        for (student_id, content_id), position in positions.items():
+            pipeline.hsetnx(self.key, self._field(student_id, content_id), position)
+        pipeline.execute()
+
+
+PROGRESS_KEY = "progress:row:{student_id}:{content_id}"
+PROGRESS_FIELDS = ("id", "completed", "completed_at")
+PROGRESS_CACHE_TTL = 300
+
+
+def get_progress_fields(student_id, content_id):
+    """
+    Return the id, completed and completed_at of a student's progress row.
+
+    The values are cached per student and content, and are ``{}`` while the
+    student has no row. The cached entry is dropped when a flush creates
+    the row and when the content is completed, see ``forget_progress``.
+    """
+    key = PROGRESS_KEY.format(student_id=student_id, content_id=content_id)
+    fields = cache.get(key)
+    if fields is None:
+        fields = (
+            ContentProgress.objects.filter(student_id=student_id, content_id=content_id)
+            .values(*PROGRESS_FIELDS)
+            .first()
+            or {}
+        )
+        cache.set(key, fields, PROGRESS_CACHE_TTL)
+    return fields
+
+
+def forget_progress(keys):
+    """Drop the cached progress fields of (student_id, content_id) pairs."""
+    cache.delete_many(
+        [
+            PROGRESS_KEY.format(student_id=student_id, content_id=content_id)
+            for student_id, content_id in keys
+        ]
+    )
+
+
+HEARTBEAT_BUFFERS = {
+    "memory": InMemoryHeartbeatBuffer,
+    "redis": RedisHeartbeatBuffer,
+}
+
+_buffers = {}
+
+
+def get_heartbeat_buffer():
+    """Return the buffer configured by ``PROGRESS_HEARTBEAT_BUFFER``."""
+    name = settings.PROGRESS_HEARTBEAT_BUFFER
+    if name not in _buffers:
+        _buffers[name] = HEARTBEAT_BUFFERS[name]()
+    return _buffers[name]
+
+
+def flush_heartbeats(buffer=None, batch_size=500):
+    """
+    Write buffered positions back to ContentProgress.
+
+    Each batch costs one SELECT, one bulk UPDATE for the existing rows and,
+    for (student, content) pairs that have no row yet, two SELECTs and one
+    bulk INSERT. Positions of a student or content deleted since the
+    heartbeat are dropped, so they cannot fail every later flush.
+
+    Returns:
+        int: Number of positions written
+    """
+    buffer = buffer or get_heartbeat_buffer()
+    positions = buffer.drain()
+    items = list(positions.items())
+    written = 0
+    try:
+        for start in range(0, len(items), batch_size):
+            written += _write_batch(dict(items[start : start + batch_size]))
+    except Exception:
+        buffer.restore(dict(items[start:]))
+        raise
+    return written
+
+
+def _write_batch(positions):
+    student_ids = {student_id for student_id, _ in positions}
+    content_ids = {content_id for _, content_id in positions}
+    existing = ContentProgress.objects.filter(
+        student_id__in=student_ids, content_id__in=content_ids
+    ).only("id", "student_id", "content_id", "last_position")
+
+    to_update = []
+    for progress in existing:
+        key = (progress.student_id, progress.content_id)
+        if key in positions:
+            progress.last_position = positions.pop(key)
+            to_update.append(progress)
+    ContentProgress.objects.bulk_update(to_update, ["last_position"])
+    if not positions:
+        return len(to_update)
+
+    # ignore_conflicts skips duplicate rows but not missing foreign keys
+    student_ids = set(
+        UserModel.objects.filter(
+            pk__in={student_id for student_id, _ in positions}
+        ).values_list("pk", flat=True)
+    )
+    content_ids = set(
+        Content.objects.non_polymorphic()
+        .filter(pk__in={content_id for _, content_id in positions})
+        .values_list("pk", flat=True)
+    )
+    to_create = [
+        ContentProgress(
+            student_id=student_id, content_id=content_id, last_position=position
+        )
+        for (student_id, content_id), position in positions.items()
+        if student_id in student_ids and content_id in content_ids
+    ]
+    ContentProgress.objects.bulk_create(to_create, ignore_conflicts=True)
+    forget_progress([(progress.student_id, progress.content_id) for progress in to_create])
+    return len(to_update) + len(to_create)
@@ -1,6 +1,18 @@
 from django.urls import path
 from rest_framework import routers
-from .views import CourseViewSet, ModuleViewSet, ModuleCreateView, ModuleListView, ContentViewListCreate, ContentDetailView
+from .views import (
+    CourseViewSet,
+    ModuleViewSet,
+    ModuleCreateView,
+    ModuleListView,
+    ModuleReorderView,
+    ContentViewListCreate,
+    ContentDetailView,
+    ContentReorderView,
+    UploadSessionCreateView,
+    UploadSessionView,
+    UploadSessionFinalizeView,
+)
 router = routers.DefaultRouter()
 router.register(r'courses', CourseViewSet, basename='course')
 router.register(r'modules', ModuleViewSet, basename="module")
@@ -9,5 +21,10 @@ urlpatterns = router.urls
 urlpatterns += [
     path("course/<slug:slug>/create_module/", ModuleCreateView.as_view(), name="module_create"),
     path("course/<slug:slug>/moudels", ModuleListView.as_view(), name="module_list"),
-    path("module/<slug:module_slug>/content/", ContentViewListCreate.as_view(), name="module-contents")
+    path("module/<slug:module_slug>/content/", ContentViewListCreate.as_view(), name="module-contents"),
+    path("course/<slug:slug>/modules/reorder/", ModuleReorderView.as_view(), name="module_reorder"),
+    path("module/<slug:module_slug>/content/reorder/", ContentReorderView.as_view(), name="content-reorder"),
+    path("module/<slug:module_slug>/uploads/", UploadSessionCreateView.as_view(), name="upload-session-create"),
+    path("uploads/<uuid:upload_id>/", UploadSessionView.as_view(), name="upload-session"),
+    path("uploads/<uuid:upload_id>/finalize/", UploadSessionFinalizeView.as_view(), name="upload-session-finalize"),
 ]
\ No newline at end of file
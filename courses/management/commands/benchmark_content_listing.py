@@ -0,0 +1,103 @@
+import statistics
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from courses.models import (
+    Content,
+    Course,
+    FileContent,
+    ImageContent,
+    Module,
+    Subject,
+    TextContent,
+    VideoContent,
+)
+from courses.serializers import ContentSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and latency of listing a module's contents through the "
+        "polymorphic queryset and through select_subclasses(). Test data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=100)
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            module = self._create_module(options["items"])
+
+            def polymorphic():
+                return ContentSerializer(
+                    module.contents.order_by("order"), many=True
+                ).data
+
+            def joined():
+                return ContentSerializer(
+                    Content.objects.filter(module=module)
+                    .order_by("order")
+                    .select_subclasses(),
+                    many=True,
+                ).data
+
+            if polymorphic() != joined():
+                raise CommandError("select_subclasses() output differs")
+            self.stdout.write(
+                f"{options['items']} contents, {options['iterations']} iterations"
+            )
+            for name, func in [
+                ("polymorphic queryset", polymorphic),
+                ("select_subclasses()", joined),
+            ]:
+                queries, timings = self._measure(func, options["iterations"])
+                self.stdout.write(
+                    f"{name:<22} queries={queries:<5} "
+                    f"p50={statistics.median(timings):.2f}ms max={max(timings):.2f}ms"
+                )
+            transaction.set_rollback(True)
+
+    def _measure(self, func, iterations):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(context), timings
+
+    def _create_module(self, item_count):
+        suffix = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(username=f"bench-{suffix}")
+        subject = Subject.objects.create(title=f"bench-{suffix}", slug=f"bench-{suffix}")
+        course = Course.objects.create(
+            title=f"Benchmark {suffix}",
+            subject=subject,
+            required_time=1,
+            summary="benchmark",
+            owner=owner,
+        )
+        module = Module.objects.create(course=course, title="Benchmark module")
+        url = "https://example.com/benchmark"
+        factories = [
+            lambda title: TextContent(module=module, title=title, text="benchmark"),
+            lambda title: VideoContent(
+                module=module, title=title, video_file=url, public_id=title
+            ),
+            lambda title: ImageContent(
+                module=module, title=title, image_file=url, public_id=title
+            ),
+            lambda title: FileContent(
+                module=module, title=title, file=url, public_id=title, file_size=1
+            ),
+        ]
+        for index in range(item_count):
+            factories[index % len(factories)](f"Content {index}").save()
+        return module
@@ -0,0 +1,102 @@
+import statistics
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from courses.models import Course, Module, Subject, TextContent
+from courses.outline import OUTLINE_KEY, get_outline_version
+from courses.serializers import CourseSerializer, ModuleSerializer
+
+User = get_user_model()
+
+
+class NestedCourseSerializer(serializers.ModelSerializer):
+    """The pre-outline CourseSerializer, kept as the benchmark baseline."""
+
+    modules = ModuleSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Course
+        exclude = ["slug", "owner"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and latency of serializing a course through nested "
+        "serializers and through the cached outline. Test data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modules", type=int, default=20)
+        parser.add_argument("--contents", type=int, default=10, help="Per module")
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=["testserver"]):
+            course = self._create_course(options["modules"], options["contents"])
+            request = RequestFactory().get("/")
+
+            def nested():
+                return NestedCourseSerializer(course, context={"request": request}).data
+
+            def outline_cold():
+                cache.delete(
+                    OUTLINE_KEY.format(
+                        course_id=course.id, version=get_outline_version(course.id)
+                    )
+                )
+                return CourseSerializer(course, context={"request": request}).data
+
+            def outline_warm():
+                return CourseSerializer(course, context={"request": request}).data
+
+            outline_warm()
+            self.stdout.write(
+                f"{options['modules']} modules x {options['contents']} contents, "
+                f"{options['iterations']} iterations"
+            )
+            for name, func in [
+                ("nested serializers", nested),
+                ("outline (cold cache)", outline_cold),
+                ("outline (warm cache)", outline_warm),
+            ]:
+                queries, timings = self._measure(func, options["iterations"])
+                self.stdout.write(
+                    f"{name:<22} queries={queries:<5} "
+                    f"p50={statistics.median(timings):.2f}ms max={max(timings):.2f}ms"
+                )
+            transaction.set_rollback(True)
+
+    def _measure(self, func, iterations):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(context), timings
+
+    def _create_course(self, module_count, content_count):
+        suffix = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(username=f"bench-{suffix}")
+        subject = Subject.objects.create(title=f"bench-{suffix}", slug=f"bench-{suffix}")
+        course = Course.objects.create(
+            title=f"Benchmark {suffix}",
+            subject=subject,
+            required_time=1,
+            summary="benchmark",
+            owner=owner,
+        )
+        for module_index in range(module_count):
+            module = Module.objects.create(course=course, title=f"Module {module_index}")
+            for content_index in range(content_count):
+                TextContent.objects.create(
+                    module=module, title=f"Content {content_index}", text="benchmark"
+                )
+        return course
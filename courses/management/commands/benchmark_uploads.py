@@ -0,0 +1,255 @@
+import json
+import os
+import re
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from celery import current_app
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import Instructor
+from courses.models import Content, Course, Module, Subject, UploadStatus
+from courses.uploads import RESOURCE_TYPE_MAPPING
+
+User = get_user_model()
+
+SIZE_PATTERN = re.compile(r"^(\d+)(B|KB|MB)$", re.IGNORECASE)
+UNITS = {"B": 1, "KB": 1024, "MB": 1024 * 1024}
+
+# Content type and leading bytes of the synthetic file of each resource type
+PAYLOADS = {
+    "VideoContent": ("video/mp4", "clip.mp4", b"\x00\x00\x00\x18ftypmp42"),
+    "ImageContent": ("image/png", "image.png", b"\x89PNG\r\n\x1a\n"),
+    "FileContent": ("video/webm", "file.webm", b"\x1a\x45\xdf\xa3"),
+    "TextContent": (None, None, b""),
+}
+
+
+def parse_size(value):
+    match = SIZE_PATTERN.match(value.strip())
+    if not match:
+        raise CommandError(f"Invalid size {value!r}, use e.g. 512B, 64KB or 10MB")
+    return int(match.group(1)) * UNITS[match.group(2).upper()]
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No procfs, fall back to the peak of the whole process (KB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(threading.Thread):
+    """Track the peak RSS while a benchmark case runs."""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the content upload, update and delete endpoints with synthetic files "
+        "against the local media backend, and write p50/p99 latency, throughput and "
+        "peak RSS per resource type and size as JSON. Test data is rolled back. The peak "
+        "RSS includes the request bodies built by the test client."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1KB,64KB,1MB,10MB,100MB")
+        parser.add_argument("--types", default=",".join(PAYLOADS))
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--output", help="JSON file to write, stdout by default")
+
+    def handle(self, *args, **options):
+        sizes = [parse_size(size) for size in options["sizes"].split(",")]
+        types = options["types"].split(",")
+        unknown = set(types) - set(PAYLOADS)
+        if unknown:
+            raise CommandError(f"Unknown resource types: {', '.join(sorted(unknown))}")
+
+        media_root = tempfile.mkdtemp(prefix="benchmark-uploads-")
+        always_eager = current_app.conf.task_always_eager
+        # The queued transfers run inline when their callbacks are executed
+        current_app.conf.task_always_eager = True
+        try:
+            with override_settings(
+                MEDIA_UPLOAD_BACKEND="local",
+                MEDIA_ROOT=media_root,
+                UPLOAD_STAGING_ROOT=os.path.join(media_root, "staging"),
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ), transaction.atomic():
+                results = self._run(types, sizes, options["iterations"])
+                transaction.set_rollback(True)
+        finally:
+            current_app.conf.task_always_eager = always_eager
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = json.dumps(
+            {
+                "created": timezone.now().isoformat(),
+                "backend": "local",
+                "iterations": options["iterations"],
+                "results": results,
+            },
+            indent=2,
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report)
+            for result in results:
+                self.stdout.write(
+                    f"{result['resourcetype']:<13} {result['size']:>10}B "
+                    f"{result['operation']:<15} p50={result['p50_ms']:.1f}ms "
+                    f"p99={result['p99_ms']:.1f}ms "
+                    f"{result['throughput_mb_s']:.1f}MB/s "
+                    f"rss={result['peak_rss_mb']:.0f}MB"
+                )
+        else:
+            self.stdout.write(report)
+
+    def _run(self, types, sizes, iterations):
+        client, module = self._setup()
+        results = []
+        for resource_type in types:
+            for size in sizes:
+                if resource_type == "TextContent" and size > settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+                    # Form fields above this limit are rejected by Django
+                    continue
+                results.extend(self._case(client, module, resource_type, size, iterations))
+        return results
+
+    def _case(self, client, module, resource_type, size, iterations):
+        content_type, name, signature = PAYLOADS[resource_type]
+        # One buffer per case; every file gets a unique prefix so no upload
+        # is deduplicated against an earlier one.
+        filler = os.urandom(min(size, 1024 * 1024))
+        body = (filler * (size // len(filler) + 1))[: max(size - len(signature) - 16, 0)]
+
+        def payload():
+            data = signature + uuid.uuid4().bytes + body
+            if resource_type == "TextContent":
+                return {"text": data.hex()[:size]}
+            return {
+                RESOURCE_TYPE_MAPPING[resource_type]: SimpleUploadedFile(
+                    name, data, content_type=content_type
+                )
+            }
+
+        create_url = reverse("module-contents", kwargs={"module_slug": module.slug})
+        timings = {"create": [], "create.process": [], "update": [], "update.process": [], "delete": []}
+        sampler = RssSampler()
+        sampler.start()
+        try:
+            for index in range(iterations):
+                data = {"title": f"Benchmark {index}", "resourcetype": resource_type, **payload()}
+                response, elapsed = self._timed(client.post, create_url, data, format="multipart")
+                self._check(response, resource_type, "create")
+                timings["create"].append(elapsed)
+                timings["create.process"].append(self._process(resource_type))
+
+                detail_url = reverse("content-detail", kwargs={"slug": response.data["slug"]})
+                response, elapsed = self._timed(client.patch, detail_url, payload(), format="multipart")
+                self._check(response, resource_type, "update")
+                timings["update"].append(elapsed)
+                timings["update.process"].append(self._process(resource_type))
+
+                response, elapsed = self._timed(client.delete, detail_url)
+                self._check(response, resource_type, "delete")
+                timings["delete"].append(elapsed)
+        finally:
+            peak = sampler.stop()
+
+        results = []
+        for operation, samples in timings.items():
+            if not samples or (operation.endswith(".process") and resource_type == "TextContent"):
+                continue
+            moved = 0 if operation == "delete" else size * len(samples)
+            results.append(
+                {
+                    "resourcetype": resource_type,
+                    "size": size,
+                    "operation": operation,
+                    "p50_ms": statistics.median(samples) * 1000,
+                    "p99_ms": self._percentile(samples, 99) * 1000,
+                    "ops_per_s": len(samples) / sum(samples) if sum(samples) else 0,
+                    "throughput_mb_s": moved / sum(samples) / UNITS["MB"] if sum(samples) else 0,
+                    "peak_rss_mb": peak / UNITS["MB"],
+                }
+            )
+        return results
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        response = method(*args, **kwargs)
+        return response, time.perf_counter() - start
+
+    def _check(self, response, resource_type, operation):
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{operation} of {resource_type} answered {response.status_code}: "
+                f"{getattr(response, 'data', '')}"
+            )
+
+    def _process(self, resource_type):
+        """Run the transfers the last request queued for after commit."""
+        # Everything runs in one transaction, so the callbacks are still pending
+        callbacks = list(connection.run_on_commit)
+        connection.run_on_commit.clear()
+        start = time.perf_counter()
+        for _, callback, _ in callbacks:
+            callback()
+        elapsed = time.perf_counter() - start
+        if resource_type != "TextContent" and Content.objects.filter(
+            status=UploadStatus.FAILED
+        ).exists():
+            raise CommandError(f"Transfer of {resource_type} failed")
+        return elapsed
+
+    def _percentile(self, samples, percent):
+        if len(samples) == 1:
+            return samples[0]
+        return statistics.quantiles(samples, n=100, method="inclusive")[percent - 1]
+
+    def _setup(self):
+        suffix = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(username=f"bench-{suffix}")
+        Instructor.objects.create(user=owner, education="BACHELORS")
+        subject = Subject.objects.create(title=f"bench-{suffix}", slug=f"bench-{suffix}")
+        course = Course.objects.create(
+            title=f"Benchmark {suffix}",
+            subject=subject,
+            required_time=1,
+            summary="benchmark",
+            owner=owner,
+        )
+        module = Module.objects.create(course=course, title="Benchmark module")
+        client = APIClient()
+        client.force_authenticate(user=owner)
+        return client, module
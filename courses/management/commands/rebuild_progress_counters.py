@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from courses.models import Content, ContentProgress, CourseProgress
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored content counters of every CourseProgress row."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course",
+            help="Only rebuild the counters of the course with this slug.",
+        )
+
+    def handle(self, *args, **options):
+        total_contents = (
+            Content.objects.non_polymorphic()
+            .filter(module__course=OuterRef("course"))
+            .order_by()
+            .values("module__course")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        completed_contents = (
+            ContentProgress.objects.filter(
+                student=OuterRef("student"),
+                content__module__course=OuterRef("course"),
+                completed=True,
+            )
+            .order_by()
+            .values("student")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+
+        progresses = CourseProgress.objects.all()
+        if options["course"]:
+            progresses = progresses.filter(course__slug=options["course"])
+
+        updated = progresses.update(
+            total_contents=Coalesce(
+                Subquery(total_contents, output_field=IntegerField()), 0
+            ),
+            completed_contents=Coalesce(
+                Subquery(completed_contents, output_field=IntegerField()), 0
+            ),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt counters for {updated} course progress rows")
+        )
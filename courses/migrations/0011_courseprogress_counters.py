@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-17 05:55
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Content = apps.get_model("courses", "Content")
+    ContentProgress = apps.get_model("courses", "ContentProgress")
+    CourseProgress = apps.get_model("courses", "CourseProgress")
+
+    total_contents = (
+        Content.objects.filter(module__course=OuterRef("course"))
+        .order_by()
+        .values("module__course")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    completed_contents = (
+        ContentProgress.objects.filter(
+            student=OuterRef("student"),
+            content__module__course=OuterRef("course"),
+            completed=True,
+        )
+        .order_by()
+        .values("student")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    CourseProgress.objects.update(
+        total_contents=Coalesce(Subquery(total_contents, output_field=IntegerField()), 0),
+        completed_contents=Coalesce(
+            Subquery(completed_contents, output_field=IntegerField()), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_alter_course_owner"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="courseprogress",
+            name="completed_contents",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="courseprogress",
+            name="total_contents",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
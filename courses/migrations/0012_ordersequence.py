@@ -0,0 +1,29 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0011_courseprogress_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scope", models.CharField(max_length=255, unique=True)),
+                ("value", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0012_ordersequence"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["-created", "-id"], name="course_catalog_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["subject", "-created", "-id"], name="course_subject_catalog_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["price", "-created"], name="course_price_catalog_idx"
+            ),
+        ),
+    ]
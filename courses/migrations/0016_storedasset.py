@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0015_uploadsession"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredAsset",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("public_id", models.CharField(max_length=255, unique=True)),
+                ("url", models.URLField()),
+                ("thumbnail_url", models.URLField(blank=True, null=True)),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
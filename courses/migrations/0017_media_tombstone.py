@@ -0,0 +1,42 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:22
+
+from django.db import migrations, models
+import django.db.models.manager
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0016_storedasset"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("public_id", models.CharField(max_length=255)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name="content",
+            options={"base_manager_name": "plain_objects"},
+        ),
+        migrations.AlterModelManagers(
+            name="content",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("plain_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
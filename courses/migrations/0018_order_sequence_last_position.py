@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0017_media_tombstone"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ordersequence",
+            name="value",
+            field=models.IntegerField(default=-1),
+        ),
+    ]
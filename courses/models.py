@@ -1,9 +1,14 @@
+import os
 import uuid
+from django.conf import settings
 from django.db import models
+from django.db.models.query import ModelIterable
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from .fields import OrderField, AutoSlugField
+from polymorphic.managers import PolymorphicManager
 from polymorphic.models import PolymorphicModel
-from django.utils import timezone
+from polymorphic.query import PolymorphicQuerySet
 
 UserModel = get_user_model()
 
@@ -16,6 +21,16 @@ class CreateUpdateDate(models.Model):
         abstract = True
 
 
+class OrderSequence(models.Model):
+    """Last position handed out by an OrderField for one parent, -1 if none."""
+
+    scope = models.CharField(max_length=255, unique=True)
+    value = models.IntegerField(default=-1)
+
+    def __str__(self):
+        return f"{self.scope} = {self.value}"
+
+
 class Subject(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
@@ -42,6 +57,13 @@ class Course(CreateUpdateDate):
     class Meta:
         ordering = ["-created"]
         verbose_name_plural = "courses"
+        indexes = [
+            models.Index(fields=["-created", "-id"], name="course_catalog_idx"),
+            models.Index(
+                fields=["subject", "-created", "-id"], name="course_subject_catalog_idx"
+            ),
+            models.Index(fields=["price", "-created"], name="course_price_catalog_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.owner.get_full_name()}"
@@ -68,6 +90,62 @@ class Module(CreateUpdateDate):
         return self.title
 
 
+class UploadStatus(models.TextChoices):
+    PROCESSING = "processing", "Processing"
+    READY = "ready", "Ready"
+    FAILED = "failed", "Failed"
+
+
+class SubclassIterable(ModelIterable):
+    """Yield the subclass instances joined in by ``select_subclasses()``."""
+
+    def __iter__(self):
+        relations = self.queryset._subclass_relations
+        for obj in super().__iter__():
+            model = ContentType.objects.get_for_id(obj.polymorphic_ctype_id).model_class()
+            relation = relations.get(model)
+            # Read the joined row from the relation cache: polymorphic swaps
+            # the reverse accessors for properties that always query.
+            yield relation.get_cached_value(obj, default=obj) if relation else obj
+
+
+class ContentQuerySet(PolymorphicQuerySet):
+    def select_subclasses(self):
+        """
+        Fetch every content with its subclass columns in one joined query.
+
+        The polymorphic queryset loads the base rows and then runs one more
+        query per subclass present. This LEFT JOINs all direct subclass
+        tables instead and yields the same concrete instances.
+        """
+        relations = {
+            rel.related_model: rel
+            for rel in self.model._meta.related_objects
+            if rel.one_to_one and rel.parent_link
+        }
+        qs = self.non_polymorphic().select_related(
+            *[rel.get_accessor_name() for rel in relations.values()]
+        )
+        qs._iterable_class = SubclassIterable
+        qs._subclass_relations = relations
+        return qs
+
+    def delete(self):
+        # The delete collector files rows under the class of the first one,
+        # so a mix of subclasses would leave child rows behind. Deleting the
+        # base rows cascades to every child table instead.
+        return models.QuerySet.delete(self.non_polymorphic())
+
+    def _clone(self, *args, **kwargs):
+        clone = super()._clone(*args, **kwargs)
+        clone._subclass_relations = getattr(self, "_subclass_relations", {})
+        return clone
+
+
+class ContentManager(PolymorphicManager):
+    queryset_class = ContentQuerySet
+
+
 class Content(PolymorphicModel):
     module = models.ForeignKey(
         Module, related_name="contents", on_delete=models.CASCADE
@@ -78,6 +156,16 @@ class Content(PolymorphicModel):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     is_free = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=10, choices=UploadStatus.choices, default=UploadStatus.READY
+    )
+
+    objects = ContentManager()
+    # Plain manager for cascade deletes, see ContentQuerySet.delete
+    plain_objects = models.Manager()
+
+    class Meta:
+        base_manager_name = "plain_objects"
 
 
 class VideoContent(Content):
@@ -86,26 +174,12 @@ class VideoContent(Content):
     duration = models.DurationField(null=True, blank=True)
     thumbnail_url = models.URLField(blank=True, null=True)
 
-    def delete(self, *args, **kwargs):
-        """Delete the video from Cloudinary when the model instance is deleted."""
-        from .utils import delete_file_from_cloudinary
-
-        delete_file_from_cloudinary(self.public_id)
-        super().delete(*args, **kwargs)
-
 
 class ImageContent(Content):
     image_file = models.URLField()  # Store Cloudinary URL
     public_id = models.CharField(max_length=255)  # Store Cloudinary public_id
     thumbnail_url = models.URLField(blank=True, null=True)
 
-    def delete(self, *args, **kwargs):
-        """Delete the image from Cloudinary when the model instance is deleted."""
-        from .utils import delete_file_from_cloudinary
-
-        delete_file_from_cloudinary(self.public_id)
-        super().delete(*args, **kwargs)
-
 
 class TextContent(Content):
     text = models.TextField()
@@ -116,13 +190,6 @@ class FileContent(Content):
     public_id = models.CharField(max_length=255)  # Store Cloudinary public_id
     file_size = models.PositiveIntegerField()  # Store file size in bytes
 
-    def delete(self, *args, **kwargs):
-        """Delete the file from Cloudinary when the model instance is deleted."""
-        from .utils import delete_file_from_cloudinary
-
-        delete_file_from_cloudinary(self.public_id)
-        super().delete(*args, **kwargs)
-
 
 class CourseProgress(models.Model):
     student = models.ForeignKey(
@@ -135,6 +202,11 @@ class CourseProgress(models.Model):
     last_accessed = models.DateTimeField(auto_now=True)
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Denormalized counters, kept in sync by courses.signals and
+    # ContentProgress.mark_as_completed. Rebuild with
+    # `manage.py rebuild_progress_counters` if they ever drift.
+    total_contents = models.PositiveIntegerField(default=0)
+    completed_contents = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ["student", "course"]
@@ -142,17 +214,35 @@ class CourseProgress(models.Model):
     def __str__(self):
         return f"{self.student.get_full_name()} - {self.course.title}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.total_contents, self.completed_contents = self.count_contents()
+        super().save(*args, **kwargs)
+
+    def count_contents(self):
+        """Count the course contents and the ones this student completed."""
+        counts = (
+            Content.objects.non_polymorphic()
+            .filter(module__course_id=self.course_id)
+            .aggregate(
+                total=models.Count("pk", distinct=True),
+                completed=models.Count(
+                    "progress",
+                    filter=models.Q(
+                        progress__student_id=self.student_id,
+                        progress__completed=True,
+                    ),
+                    distinct=True,
+                ),
+            )
+        )
+        return counts["total"], counts["completed"]
+
     @property
     def progress_percentage(self):
-        total_contents = sum(
-            module.contents.count() for module in self.course.modules.all()
-        )
-        if total_contents == 0:
+        if self.total_contents == 0:
             return 0
-        completed_contents = ContentProgress.objects.filter(
-            student=self.student, content__module__course=self.course, completed=True
-        ).count()
-        return (completed_contents / total_contents) * 100
+        return (self.completed_contents / self.total_contents) * 100
 
 
 class ContentProgress(models.Model):
@@ -173,41 +263,66 @@ class ContentProgress(models.Model):
         return f"{self.student.get_full_name()} - {self.content.title}"
 
     def mark_as_completed(self):
-        self.completed = True
-        self.completed_at = timezone.now()
-        self.save()
-
-        # Check if all contents in the module are completed
-        module = self.content.module
-        all_contents = module.contents.all()
-        all_completed = all(
-            ContentProgress.objects.filter(
-                student=self.student, content=content, completed=True
-            ).exists()
-            for content in all_contents
-        )
+        """Complete this content; see courses.progress.complete_content."""
+        from .progress import complete_content
 
-        if all_completed:
-            # Mark course as completed if all modules are completed
-            course = module.course
-            all_modules = course.modules.all()
-            all_modules_completed = all(
-                all(
-                    ContentProgress.objects.filter(
-                        student=self.student, content=content, completed=True
-                    ).exists()
-                    for content in module.contents.all()
-                )
-                for module in all_modules
-            )
+        return complete_content(self)
 
-            if all_modules_completed:
-                course_progress = CourseProgress.objects.get(
-                    student=self.student, course=course
-                )
-                course_progress.completed = True
-                course_progress.completed_at = timezone.now()
-                course_progress.save()
+
+class StoredAsset(models.Model):
+    """A file on the media backend, shared by every upload with the same bytes."""
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    public_id = models.CharField(max_length=255, unique=True)
+    url = models.URLField()
+    thumbnail_url = models.URLField(blank=True, null=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)  # Rows using the file
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.public_id} ({self.ref_count} references)"
+
+
+class MediaTombstone(models.Model):
+    """A file to delete from the media backend, see assets.drain_tombstones."""
+
+    public_id = models.CharField(max_length=255)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.public_id
+
+
+class UploadSession(models.Model):
+    """A resumable upload assembled chunk by chunk in the staging directory."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        UserModel, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    module = models.ForeignKey(
+        Module, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    resourcetype = models.CharField(max_length=20)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()  # Declared total size in bytes
+    offset = models.PositiveBigIntegerField(default=0)  # Bytes received so far
+    content_type = models.CharField(max_length=100, blank=True)  # Sniffed
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def staged_path(self):
+        extension = os.path.splitext(self.filename)[1].lower()
+        return os.path.join(settings.UPLOAD_STAGING_ROOT, f"{self.id.hex}{extension}")
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
 
 
 class CourseMedia(models.Model):
@@ -229,6 +344,9 @@ class CourseMedia(models.Model):
     thumbnail_url = models.URLField(blank=True, null=True)
     duration = models.DurationField(null=True, blank=True)  # For videos
     size = models.PositiveIntegerField()  # File size in bytes
+    status = models.CharField(
+        max_length=10, choices=UploadStatus.choices, default=UploadStatus.READY
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -237,10 +355,3 @@ class CourseMedia(models.Model):
 
     def __str__(self):
         return f"{self.title} ({self.get_media_type_display()})"
-
-    def delete(self, *args, **kwargs):
-        """Delete the file from Cloudinary when the model instance is deleted."""
-        from .utils import delete_file_from_cloudinary
-
-        delete_file_from_cloudinary(self.public_id)
-        super().delete(*args, **kwargs)
@@ -0,0 +1,120 @@
+"""
+Cached course outline: the modules of a course with their ordered contents.
+
+The outline is built with two queries and stored in the cache under a
+per-course version number. Saving or deleting a Module or Content bumps
+the version (see courses.signals), so stale outlines are never read and
+simply expire.
+"""
+import time
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.duration import duration_string
+from .models import Content, Module
+
+OUTLINE_VERSION_KEY = "course_outline_version:{course_id}"
+OUTLINE_KEY = "course_outline:{course_id}:{version}"
+
+
+def get_outline_version(course_id):
+    key = OUTLINE_VERSION_KEY.format(course_id=course_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a
+        # number an older outline was cached under.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_outline_version(course_id):
+    key = OUTLINE_VERSION_KEY.format(course_id=course_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_outline_version(course_id)
+
+
+def build_course_outline(course_id):
+    """Build the outline of a course from the database."""
+    modules = {
+        module["id"]: {
+            "order": module["order"],
+            "slug": str(module["slug"]),
+            "title": module["title"],
+            "description": module["description"],
+            "items": [],
+        }
+        for module in Module.objects.filter(course_id=course_id)
+        .order_by("order")
+        .values("id", "order", "slug", "title", "description")
+    }
+    contents = (
+        Content.objects.non_polymorphic()
+        .filter(module__course_id=course_id)
+        .order_by("order")
+        .values(
+            "module_id",
+            "order",
+            "slug",
+            "title",
+            "is_free",
+            "polymorphic_ctype_id",
+            "videocontent__duration",
+        )
+    )
+    for content in contents:
+        duration = content["videocontent__duration"]
+        modules[content["module_id"]]["items"].append(
+            {
+                "order": content["order"],
+                "slug": str(content["slug"]),
+                "title": content["title"],
+                "resourcetype": ContentType.objects.get_for_id(
+                    content["polymorphic_ctype_id"]
+                ).model_class().__name__,
+                "is_free": content["is_free"],
+                "duration": duration_string(duration) if duration else None,
+                "url": reverse("content-detail", kwargs={"slug": content["slug"]}),
+            }
+        )
+    return list(modules.values())
+
+
+def get_course_outline(course_id):
+    """Return the outline of a course, building and caching it on a miss."""
+    key = OUTLINE_KEY.format(course_id=course_id, version=get_outline_version(course_id))
+    outline = cache.get(key)
+    if outline is None:
+        outline = build_course_outline(course_id)
+        cache.set(key, outline, timeout=settings.CACHE_TTL)
+    return outline
+
+
+def outline_modules(course_id, request=None):
+    """
+    Return the outline in the shape of ``ModuleSerializer(many=True)``.
+
+    ``contents`` keeps the content hyperlinks ModuleSerializer used to
+    produce, while ``items`` carries the per-content details.
+    """
+    build_url = request.build_absolute_uri if request is not None else str
+    modules = []
+    for module in get_course_outline(course_id):
+        items = [
+            {key: value for key, value in item.items() if key != "url"}
+            for item in module["items"]
+        ]
+        modules.append(
+            {
+                "order": module["order"],
+                "slug": module["slug"],
+                "title": module["title"],
+                "description": module["description"],
+                "contents": [build_url(item["url"]) for item in module["items"]],
+                "items": items,
+            }
+        )
+    return modules
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CourseCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the course catalog.
+
+    Pages are fetched with ``WHERE created < cursor ORDER BY created DESC``
+    against the catalog indexes, so later pages cost the same as the first.
+    """
+
+    ordering = ("-created", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
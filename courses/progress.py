@@ -0,0 +1,108 @@
+from collections import namedtuple
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent once, after the transaction commits, when a student finishes the
+# last content of a module / of a whole course. Receivers get ``student_id``
+# plus ``module_id`` or ``course_id`` as keyword arguments.
+module_completed = Signal()
+course_completed = Signal()
+
+# Sent when the stored counters of every CourseProgress row of a course
+# change at once, e.g. after a content is added. Receivers get ``course_id``,
+# and ``student_id`` when only the row of that student changed.
+course_progress_changed = Signal()
+
+CompletionResult = namedtuple(
+    "CompletionResult", ["content_completed", "module_completed", "course_completed"]
+)
+
+
+def complete_content(content_progress):
+    """
+    Mark a content as completed and detect the thresholds it crosses.
+
+    The cost is a fixed number of queries regardless of the size of the
+    module or the course: the module check is a single aggregate and the
+    course check reads the stored counters of the locked CourseProgress row.
+
+    Args:
+        content_progress: The ContentProgress row being completed
+
+    Returns:
+        CompletionResult: Which of content, module and course were just
+        completed by this call. All False if the content was already done.
+    """
+    from .models import Content, ContentProgress, CourseProgress
+
+    now = timezone.now()
+    with transaction.atomic():
+        if content_progress.pk is None:
+            content_progress.save()
+        just_completed = ContentProgress.objects.filter(
+            pk=content_progress.pk, completed=False
+        ).update(completed=True, completed_at=now)
+        content_progress.completed = True
+        if not just_completed:
+            return CompletionResult(False, False, False)
+        content_progress.completed_at = now
+
+        module_id, course_id = (
+            Content.objects.non_polymorphic()
+            .filter(pk=content_progress.content_id)
+            .values_list("module_id", "module__course_id")
+            .get()
+        )
+
+        course_progress, created = CourseProgress.objects.select_for_update().get_or_create(
+            student_id=content_progress.student_id, course_id=course_id
+        )
+        update_fields = ["last_accessed"]
+        if not created:
+            # A freshly created row already counted this completion.
+            course_progress.completed_contents += 1
+            update_fields.append("completed_contents")
+
+        module_counts = (
+            Content.objects.non_polymorphic()
+            .filter(module_id=module_id)
+            .aggregate(
+                total=models.Count("pk", distinct=True),
+                completed=models.Count(
+                    "progress",
+                    filter=models.Q(
+                        progress__student_id=content_progress.student_id,
+                        progress__completed=True,
+                    ),
+                    distinct=True,
+                ),
+            )
+        )
+        module_done = module_counts["completed"] >= module_counts["total"]
+
+        course_done = (
+            not course_progress.completed
+            and course_progress.completed_contents >= course_progress.total_contents
+        )
+        if course_done:
+            course_progress.completed = True
+            course_progress.completed_at = now
+            update_fields += ["completed", "completed_at"]
+        course_progress.save(update_fields=update_fields)
+
+        student_id = content_progress.student_id
+        if module_done:
+            transaction.on_commit(
+                lambda: module_completed.send(
+                    sender=ContentProgress, student_id=student_id, module_id=module_id
+                )
+            )
+        if course_done:
+            transaction.on_commit(
+                lambda: course_completed.send(
+                    sender=ContentProgress, student_id=student_id, course_id=course_id
+                )
+            )
+
+    return CompletionResult(True, module_done, course_done)
@@ -11,14 +11,19 @@ from courses.models import (
     ContentProgress,
     CourseProgress,
     CourseMedia,
+    UploadSession,
 )
 from rest_polymorphic.serializers import PolymorphicSerializer
+from drf_spectacular.utils import extend_schema_field
+from .utils import MAX_FILE_SIZE_MB
+from .outline import outline_modules
 
 
 class VideoContentSerializer(serializers.ModelSerializer):
     class Meta:
         model = VideoContent
         fields = "__all__"
+        read_only_fields = ["video_file", "public_id", "thumbnail_url", "status"]
         extra_kwargs = {"module": {"read_only": True}}
 
 
@@ -26,6 +31,7 @@ class ImageContentSerializer(serializers.ModelSerializer):
     class Meta:
         model = ImageContent
         fields = "__all__"
+        read_only_fields = ["image_file", "public_id", "thumbnail_url", "status"]
         extra_kwargs = {"module": {"read_only": True}}
 
 
@@ -33,6 +39,7 @@ class FileContentSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileContent
         fields = "__all__"
+        read_only_fields = ["file", "public_id", "file_size", "status"]
         extra_kwargs = {"module": {"read_only": True}}
 
 
@@ -40,7 +47,7 @@ class TextContentSerializer(serializers.ModelSerializer):
     class Meta:
         model = TextContent
         fields = "__all__"
-        extra_kwargs = {"module": {"read_only": True}}
+        extra_kwargs = {"module": {"read_only": True}, "status": {"read_only": True}}
 
 
 class ContentSerializer(PolymorphicSerializer):
@@ -64,17 +71,34 @@ class ModuleSerializer(serializers.ModelSerializer):
 
 
 class CourseSerializer(serializers.ModelSerializer):
-    modules = ModuleSerializer(many=True, read_only=True)
+    modules = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
         exclude = ["slug", "owner"]
 
+    @extend_schema_field(ModuleSerializer(many=True))
+    def get_modules(self, obj):
+        return outline_modules(obj.id, request=self.context.get("request"))
+
 
 class CourseListSerializer(serializers.ModelSerializer):
+    """Catalog entry of a course, without its modules."""
+
     class Meta:
         model = Course
-        fields = "__all__"
+        fields = [
+            "id",
+            "title",
+            "slug",
+            "price",
+            "subject",
+            "required_time",
+            "summary",
+            "thumbnail",
+            "created",
+            "updated",
+        ]
 
 
 class SubjectListSerializer(serializers.ModelSerializer):
@@ -132,6 +156,7 @@ class CourseMediaSerializer(serializers.ModelSerializer):
             "thumbnail_url",
             "duration",
             "size",
+            "status",
             "created_at",
             "updated_at",
         ]
@@ -140,11 +165,39 @@ class CourseMediaSerializer(serializers.ModelSerializer):
             "thumbnail_url",
             "duration",
             "size",
+            "status",
             "created_at",
             "updated_at",
         ]
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    resourcetype = serializers.ChoiceField(
+        choices=["VideoContent", "ImageContent", "FileContent"]
+    )
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "resourcetype", "filename", "size", "offset", "content_type", "created"]
+        read_only_fields = ["id", "offset", "content_type", "created"]
+
+    def validate_size(self, value):
+        if value == 0:
+            raise serializers.ValidationError("File must not be empty.")
+        if value > MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise serializers.ValidationError(f"File size must be less than {MAX_FILE_SIZE_MB}MB")
+        return value
+
+
+class ReorderSerializer(serializers.Serializer):
+    order = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+    def validate_order(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Slugs must not repeat.")
+        return value
+
+
 class CourseMediaUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
     title = serializers.CharField(max_length=255)
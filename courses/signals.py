@@ -0,0 +1,112 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .assets import release_asset
+from .models import (
+    Content,
+    Module,
+    CourseProgress,
+    ContentProgress,
+    CourseMedia,
+    FileContent,
+    ImageContent,
+    VideoContent,
+)
+from .outline import bump_outline_version
+from .progress import course_progress_changed
+
+
+def _course_id(content):
+    """Return the course id of a content, looked up once per module."""
+    cached = getattr(content, "_course_id_cache", None)
+    if cached is None or cached[0] != content.module_id:
+        course_id = (
+            Module.objects.filter(pk=content.module_id)
+            .values_list("course_id", flat=True)
+            .first()
+        )
+        cached = content._course_id_cache = (content.module_id, course_id)
+    return cached[1]
+
+
+@receiver(post_save)
+def content_created(sender, instance, created, **kwargs):
+    """Count a new content item in the progress rows of its course."""
+    if not created or not isinstance(instance, Content):
+        return
+    course_id = _course_id(instance)
+    CourseProgress.objects.filter(course_id=course_id).update(
+        total_contents=F("total_contents") + 1
+    )
+    course_progress_changed.send(sender=Content, course_id=course_id)
+
+
+@receiver(post_delete)
+def content_deleted(sender, instance, **kwargs):
+    """Stop counting a removed content item.
+
+    Polymorphic contents send post_delete once for the concrete model and
+    once for the ``Content`` parent, so only the parent signal is handled.
+    """
+    if sender is not Content:
+        return
+    course_id = _course_id(instance)
+    CourseProgress.objects.filter(course_id=course_id, total_contents__gt=0).update(
+        total_contents=F("total_contents") - 1
+    )
+    course_progress_changed.send(sender=Content, course_id=course_id)
+
+
+@receiver(post_delete, sender=ContentProgress)
+def content_progress_deleted(sender, instance, **kwargs):
+    if not instance.completed:
+        return
+    course_id = (
+        Content.objects.non_polymorphic()
+        .filter(pk=instance.content_id)
+        .values_list("module__course_id", flat=True)
+        .first()
+    )
+    if course_id is None:
+        return
+    CourseProgress.objects.filter(
+        student_id=instance.student_id,
+        course_id=course_id,
+        completed_contents__gt=0,
+    ).update(completed_contents=F("completed_contents") - 1)
+    # The queryset update skips post_save, which the completion path relies on
+    course_progress_changed.send(
+        sender=ContentProgress, course_id=course_id, student_id=instance.student_id
+    )
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def module_changed(sender, instance, **kwargs):
+    bump_outline_version(instance.course_id)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def content_changed(sender, instance, **kwargs):
+    if not isinstance(instance, Content):
+        return
+    if kwargs.get("signal") is post_delete and sender is not Content:
+        return
+    course_id = _course_id(instance)
+    if course_id is not None:
+        bump_outline_version(course_id)
+
+
+@receiver(post_delete, sender=VideoContent)
+@receiver(post_delete, sender=ImageContent)
+@receiver(post_delete, sender=FileContent)
+@receiver(post_delete, sender=CourseMedia)
+def media_deleted(sender, instance, **kwargs):
+    """Release the stored file of a deleted row.
+
+    Receivers also run for cascade and queryset deletes, which skip the
+    model's delete(). The file is queued in the deleting transaction, so
+    it stays stored if the delete is rolled back.
+    """
+    release_asset(instance.public_id)
@@ -0,0 +1,274 @@
+"""
+Media storage backends.
+
+Everything that stores, deletes or links uploaded media goes through the
+backend selected by ``MEDIA_UPLOAD_BACKEND``, see ``get_media_storage()``.
+"""
+import mimetypes
+import mmap
+import os
+import re
+import uuid
+import cloudinary
+import cloudinary.api
+import cloudinary.api_client.call_api
+import cloudinary.uploader
+from cloudinary.utils import get_http_connector
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, StreamingHttpResponse
+
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Folder the backends store uploads in. Staged uploads and other files
+# under MEDIA_ROOT are outside it and never served by LocalMediaStorage.
+UPLOAD_FOLDER = "e-learning"
+
+_cloudinary_http = None
+
+
+def cloudinary_http_pool():
+    """
+    Return the process-wide pool Cloudinary requests go through.
+
+    The SDK keeps a module-level pool manager with a single connection per
+    host, so concurrent calls from threads or eventlet workers open and
+    drop extra connections, and it takes no connector per call. This is
+    the one place that swaps the SDK's uploader and Admin API connectors
+    for a pool sized by ``CLOUDINARY_HTTP_POOL_SIZE``, once per process.
+    """
+    global _cloudinary_http
+    if _cloudinary_http is None:
+        _cloudinary_http = get_http_connector(
+            cloudinary.config(),
+            {
+                **cloudinary.CERT_KWARGS,
+                "maxsize": settings.CLOUDINARY_HTTP_POOL_SIZE,
+                "block": False,
+            },
+        )
+        cloudinary.uploader._http = _cloudinary_http
+        cloudinary.api_client.call_api._http = _cloudinary_http
+    return _cloudinary_http
+
+
+class MediaStorage:
+    """
+    Interface of a media backend.
+
+    ``upload`` returns a dict with the ``url``, ``public_id``, ``format`` and
+    ``resource_type`` of the stored file (plus ``thumbnail_url`` when the
+    backend makes one), or None if the file could not be stored.
+    """
+
+    def upload(self, file, folder=UPLOAD_FOLDER):
+        raise NotImplementedError
+
+    def destroy_many(self, public_ids):
+        """
+        Delete several files.
+
+        Returns the public_ids that are gone from the backend, whether they
+        were deleted now or were already missing. The others failed and can
+        be retried.
+        """
+        raise NotImplementedError
+
+    def destroy(self, public_id):
+        """Delete one file, returning True if it is gone."""
+        return public_id in self.destroy_many([public_id])
+
+    def url(self, public_id):
+        raise NotImplementedError
+
+    def open(self, public_id):
+        """Return a stored file as a binary file object."""
+        raise NotImplementedError
+
+
+class CloudinaryMediaStorage(MediaStorage):
+    """Cloudinary backend sharing one keep-alive connection pool per process."""
+
+    RESOURCE_TYPES = ("image", "video", "raw")
+    DELETE_BATCH_SIZE = 100  # Limit of the delete_resources Admin API
+
+    def __init__(self):
+        self.http = cloudinary_http_pool()
+
+    def upload(self, file, folder=UPLOAD_FOLDER):
+        try:
+            result = cloudinary.uploader.upload(
+                file,
+                folder=folder,
+                resource_type="auto",  # Automatically detect if it's an image or video
+                eager=[
+                    {"format": "mp4", "quality": "auto"},  # For videos
+                    {"format": "webp", "quality": "auto"},  # For images
+                ],
+                eager_async=True,
+            )
+            return {
+                "url": result["secure_url"],
+                "public_id": result["public_id"],
+                "format": result["format"],
+                "resource_type": result["resource_type"],
+            }
+        except Exception as e:
+            print(f"Error uploading to Cloudinary: {str(e)}")
+            return None
+
+    def destroy_many(self, public_ids):
+        # The resource type of a public_id is not recorded, so ids that are
+        # not found as images are retried as videos and then as raw files.
+        remaining = list(dict.fromkeys(public_ids))
+        gone = []
+        for resource_type in self.RESOURCE_TYPES:
+            not_found = []
+            for start in range(0, len(remaining), self.DELETE_BATCH_SIZE):
+                batch = remaining[start : start + self.DELETE_BATCH_SIZE]
+                try:
+                    result = cloudinary.api.delete_resources(
+                        batch, resource_type=resource_type
+                    )
+                except Exception as e:
+                    # Left out of the result so the batch is retried
+                    print(f"Error deleting from Cloudinary: {str(e)}")
+                    continue
+                for public_id, outcome in result.get("deleted", {}).items():
+                    if outcome == "deleted":
+                        gone.append(public_id)
+                    else:
+                        not_found.append(public_id)
+            remaining = not_found
+            if not remaining:
+                break
+        # Not found under any resource type, so there is nothing to delete
+        return gone + remaining
+
+    def url(self, public_id):
+        return cloudinary.CloudinaryImage(public_id).build_url()
+
+    def open(self, public_id):
+        response = self.http.request(
+            "GET",
+            cloudinary.CloudinaryImage(public_id).build_url(secure=True),
+            preload_content=False,
+        )
+        if response.status != 200:
+            response.release_conn()
+            raise FileNotFoundError(f"{public_id} answered {response.status}")
+        return response
+
+
+class LocalMediaStorage(MediaStorage):
+    """Files under MEDIA_ROOT, a stand-in for Cloudinary in development and tests."""
+
+    def __init__(self):
+        # Without a location the storage follows MEDIA_ROOT, also when tests
+        # override it.
+        self.storage = FileSystemStorage()
+
+    def upload(self, file, folder=UPLOAD_FOLDER):
+        try:
+            extension = os.path.splitext(getattr(file, "name", "") or "")[1].lower()
+            name = self.storage.save(f"{folder}/{uuid.uuid4().hex}{extension}", File(file))
+            content_type = mimetypes.guess_type(name)[0] or ""
+            resource_type = content_type.split("/")[0]
+            return {
+                "url": self.storage.url(name),
+                "public_id": name,
+                "format": extension.lstrip("."),
+                "resource_type": resource_type if resource_type in ("image", "video") else "raw",
+            }
+        except Exception as e:
+            print(f"Error storing file locally: {str(e)}")
+            return None
+
+    def destroy_many(self, public_ids):
+        gone = []
+        for public_id in public_ids:
+            try:
+                self.storage.delete(public_id)
+            except Exception as e:
+                print(f"Error deleting stored file: {str(e)}")
+                continue
+            gone.append(public_id)
+        return gone
+
+    def url(self, public_id):
+        return self.storage.url(public_id)
+
+    def open(self, public_id):
+        return self.storage.open(public_id, "rb")
+
+    def serve(self, request, public_id):
+        """
+        Stream a stored file.
+
+        Only files in UPLOAD_FOLDER are served, anything else under
+        MEDIA_ROOT answers 404.
+
+        Whole files go out through FileResponse, which WSGI servers send
+        with sendfile. Range requests, which video players use to seek, are
+        streamed block by block from a memory map of the file.
+        """
+        try:
+            folder = os.path.realpath(self.storage.path(UPLOAD_FOLDER))
+            path = os.path.realpath(self.storage.path(public_id))
+        except Exception:
+            raise Http404("File not found")
+        if os.path.commonpath([folder, path]) != folder or not os.path.isfile(path):
+            raise Http404("File not found")
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        size = os.path.getsize(path)
+        match = RANGE_HEADER.match(request.headers.get("Range", ""))
+        if not match or size == 0:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+            response["Accept-Ranges"] = "bytes"
+            return response
+
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last or size - 1), size - 1)
+        else:
+            # "bytes=-N" asks for the last N bytes
+            start, end = max(size - int(last or 0), 0), size - 1
+        if start > end or start >= size:
+            response = StreamingHttpResponse([], status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        response = StreamingHttpResponse(
+            _mapped_range(path, start, end), status=206, content_type=content_type
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+
+def _mapped_range(path, start, end, block_size=256 * 1024):
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            for offset in range(start, end + 1, block_size):
+                yield bytes(view[offset : min(offset + block_size, end + 1)])
+        finally:
+            view.release()
+
+
+MEDIA_STORAGES = {
+    "cloudinary": CloudinaryMediaStorage,
+    "local": LocalMediaStorage,
+}
+
+_storages = {}
+
+
+def get_media_storage():
+    """Return the backend configured by ``MEDIA_UPLOAD_BACKEND``."""
+    name = settings.MEDIA_UPLOAD_BACKEND
+    if name not in _storages:
+        _storages[name] = MEDIA_STORAGES[name]()
+    return _storages[name]
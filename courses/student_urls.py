@@ -5,6 +5,7 @@ from .views import (
     StudentContentView,
     CourseProgressView,
     ContentProgressView,
+    ImageDerivativeView,
 )
 
 router = routers.DefaultRouter()
@@ -24,4 +25,16 @@ urlpatterns += [
         ContentProgressView.as_view(),
         name="content_progress",
     ),
+    path(
+        "course/<slug:slug>/image/<str:preset>",
+        ImageDerivativeView.as_view(),
+        {"kind": "course"},
+        name="course_image",
+    ),
+    path(
+        "content/<slug:slug>/image/<str:preset>",
+        ImageDerivativeView.as_view(),
+        {"kind": "content"},
+        name="content_image",
+    ),
 ]
@@ -72,3 +72,56 @@ def process_course_enrollment(enrollment_id):
         return True
     except Enrollment.DoesNotExist:
         return False
+
+
+@shared_task
+def flush_progress_heartbeats():
+    """Write buffered video positions back to ContentProgress."""
+    from .heartbeat import flush_heartbeats
+
+    return flush_heartbeats()
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def process_content_upload(self, content_id, staged, replaced_public_id=None):
+    """Transfer a staged content file to the media backend."""
+    from .uploads import UploadError, finish_content_upload
+
+    try:
+        return finish_content_upload(
+            content_id,
+            staged,
+            replaced_public_id,
+            last_attempt=self.request.retries >= self.max_retries,
+        )
+    except UploadError as exc:
+        raise self.retry(exc=exc)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def process_media_upload(self, media_id, staged):
+    """Transfer a staged course media file to the media backend."""
+    from .uploads import UploadError, finish_media_upload
+
+    try:
+        return finish_media_upload(
+            media_id, staged, last_attempt=self.request.retries >= self.max_retries
+        )
+    except UploadError as exc:
+        raise self.retry(exc=exc)
+
+
+@shared_task
+def purge_upload_sessions():
+    """Discard resumable uploads that were never finalized."""
+    from .uploads import purge_upload_sessions
+
+    return purge_upload_sessions()
+
+
+@shared_task
+def drain_media_tombstones():
+    """Delete the files of removed media from the media backend."""
+    from .assets import drain_tombstones
+
+    return drain_tombstones()
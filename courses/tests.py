@@ -6,13 +6,49 @@ import io
 from PIL import Image
 import tempfile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Course, Module, Content, Subject, TextContent
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+from .models import (
+    Course, Module, Content, Subject, TextContent, VideoContent, ImageContent, FileContent,
+    CourseProgress, ContentProgress, UploadStatus, UploadSession, StoredAsset, MediaTombstone,
+    CourseMedia, OrderSequence,
+)
+from .assets import drain_tombstones
+from .derivatives import DerivativeCache
+from .serializers import ContentSerializer
+from .progress import CompletionResult, course_completed
+from .heartbeat import get_heartbeat_buffer, flush_heartbeats
+from .outline import OUTLINE_VERSION_KEY, outline_modules
+from .storage import LocalMediaStorage
+from . import uploads
+from .uploads import (
+    UPLOAD_GROUP, StagedFile, UploadError, append_chunk, finish_content_upload, hash_file, receive_chunk,
+)
 from accounts.models import Instructor, Student
+import hashlib
+import uuid
 import json
+from unittest import mock
+import os
+import shutil
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 
 User = get_user_model()
 
+# Course thumbnails saved by the tests go here instead of the repo's media/
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
 
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
 class CourseViewSetTest(APITestCase):
     def setUp(self):
         # Create users
@@ -154,6 +190,7 @@ class CourseViewSetTest(APITestCase):
         self.assertEqual(Course.objects.count(), 1)  # Count should remain unchanged
 
 
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
 class ModuleViewsTest(APITestCase):
     def setUp(self):
         # Create users
@@ -268,6 +305,7 @@ class ModuleViewsTest(APITestCase):
         self.assertEqual(Module.objects.count(), 0)
 
 
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
 class ContentViewsTest(APITestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(
@@ -418,3 +456,1012 @@ class ContentViewsTest(APITestCase):
         self.assertEqual(Content.objects.count(), 1)  # Count should remain unchanged
 
 
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CourseProgressCounterTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123'
+        )
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        self.first = TextContent.objects.create(title='First', module=self.module, text='1')
+        self.second = TextContent.objects.create(title='Second', module=self.module, text='2')
+        self.progress = CourseProgress.objects.create(student=self.student_user, course=self.course)
+
+    def test_counters_initialized_on_create(self):
+        self.assertEqual(self.progress.total_contents, 2)
+        self.assertEqual(self.progress.completed_contents, 0)
+        self.assertEqual(self.progress.progress_percentage, 0)
+
+    def test_counters_follow_content_changes(self):
+        TextContent.objects.create(title='Third', module=self.module, text='3')
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.total_contents, 3)
+
+        self.second.delete()
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.total_contents, 2)
+
+    def test_counters_follow_completion(self):
+        content_progress = ContentProgress.objects.create(student=self.student_user, content=self.first)
+        content_progress.mark_as_completed()
+        content_progress.mark_as_completed()
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.completed_contents, 1)
+        self.assertEqual(self.progress.progress_percentage, 50)
+
+        self.first.delete()
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.total_contents, 1)
+        self.assertEqual(self.progress.completed_contents, 0)
+
+    def test_progress_percentage_is_a_single_row_read(self):
+        progress = CourseProgress.objects.get(pk=self.progress.pk)
+        with self.assertNumQueries(0):
+            progress.progress_percentage
+
+    def test_rebuild_command(self):
+        ContentProgress.objects.create(student=self.student_user, content=self.first, completed=True)
+        CourseProgress.objects.update(total_contents=0, completed_contents=0)
+        call_command('rebuild_progress_counters', stdout=io.StringIO())
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.total_contents, 2)
+        self.assertEqual(self.progress.completed_contents, 1)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CompletionEngineTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123'
+        )
+        self.subject = Subject.objects.create(title="test", slug="test")
+
+    def _create_course(self, title, modules, contents_per_module):
+        course = Course.objects.create(
+            title=title,
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        contents = []
+        for module_index in range(modules):
+            module = Module.objects.create(title=f'Module {module_index}', course=course)
+            for content_index in range(contents_per_module):
+                contents.append(
+                    TextContent.objects.create(title=f'Content {content_index}', module=module, text='text')
+                )
+        CourseProgress.objects.create(student=self.student_user, course=course)
+        return course, contents
+
+    def _complete(self, content):
+        progress = ContentProgress.objects.create(student=self.student_user, content=content)
+        return progress.mark_as_completed()
+
+    def test_thresholds_crossed(self):
+        course, contents = self._create_course('Small Course', modules=2, contents_per_module=2)
+
+        self.assertEqual(self._complete(contents[0]), CompletionResult(True, False, False))
+        self.assertEqual(self._complete(contents[1]), CompletionResult(True, True, False))
+        self._complete(contents[2])
+        self.assertEqual(self._complete(contents[3]), CompletionResult(True, True, True))
+
+        course_progress = CourseProgress.objects.get(student=self.student_user, course=course)
+        self.assertTrue(course_progress.completed)
+        self.assertIsNotNone(course_progress.completed_at)
+        self.assertEqual(course_progress.progress_percentage, 100)
+
+    def test_completing_twice_is_a_no_op(self):
+        course, contents = self._create_course('Small Course', modules=1, contents_per_module=2)
+        progress = ContentProgress.objects.create(student=self.student_user, content=contents[0])
+        progress.mark_as_completed()
+        self.assertEqual(progress.mark_as_completed(), CompletionResult(False, False, False))
+        course_progress = CourseProgress.objects.get(student=self.student_user, course=course)
+        self.assertEqual(course_progress.completed_contents, 1)
+
+    def test_signals_sent_on_course_completion(self):
+        course, contents = self._create_course('Small Course', modules=1, contents_per_module=1)
+        received = []
+        handler = lambda sender, **kwargs: received.append(kwargs)
+        course_completed.connect(handler)
+        self.addCleanup(course_completed.disconnect, handler)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._complete(contents[0])
+        self.assertEqual(received[0]['course_id'], course.id)
+        self.assertEqual(received[0]['student_id'], self.student_user.id)
+
+    def test_query_count_does_not_depend_on_course_size(self):
+        _, small_contents = self._create_course('Small Course', modules=1, contents_per_module=2)
+        _, large_contents = self._create_course('Large Course', modules=10, contents_per_module=20)
+        small_progress = ContentProgress.objects.create(student=self.student_user, content=small_contents[0])
+        large_progress = ContentProgress.objects.create(student=self.student_user, content=large_contents[0])
+
+        with CaptureQueriesContext(connection) as small_queries:
+            small_progress.mark_as_completed()
+        with self.assertNumQueries(len(small_queries)):
+            large_progress.mark_as_completed()
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+@override_settings(PROGRESS_HEARTBEAT_BUFFER='memory')
+class ContentProgressHeartbeatTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123'
+        )
+        self.student = Student.objects.create(user=self.student_user, education="BACHELORS",
+                                              phone_number="09991113333", birth_date="2002-10-2")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        self.content = TextContent.objects.create(title='Video', module=self.module, text='text')
+        self.buffer = get_heartbeat_buffer()
+        self.buffer.drain()
+        cache.clear()
+        self.url = reverse('content_progress', kwargs={'slug': self.content.slug})
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student_user)
+
+    def test_position_is_buffered_not_written(self):
+        response = self.client.post(self.url, {'last_position': 42.5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['last_position'], 42.5)
+        self.assertFalse(ContentProgress.objects.exists())
+
+        self.client.post(self.url, {'last_position': 50}, format='json')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['last_position'], 50)
+
+    def test_flush_writes_latest_positions(self):
+        other = TextContent.objects.create(title='Other', module=self.module, text='text')
+        ContentProgress.objects.create(student=self.student_user, content=other, last_position=1)
+        self.buffer.push(self.student_user.id, self.content.id, 10)
+        self.buffer.push(self.student_user.id, self.content.id, 20)
+        self.buffer.push(self.student_user.id, other.id, 30)
+
+        self.assertEqual(flush_heartbeats(), 2)
+        self.assertEqual(ContentProgress.objects.get(content=self.content).last_position, 20)
+        self.assertEqual(ContentProgress.objects.get(content=other).last_position, 30)
+        self.assertEqual(self.buffer.drain(), {})
+
+    def test_flush_drops_positions_of_deleted_content(self):
+        other = TextContent.objects.create(title='Other', module=self.module, text='text')
+        self.buffer.push(self.student_user.id, self.content.id, 10)
+        self.buffer.push(self.student_user.id, other.id, 20)
+        other.delete()
+
+        self.assertEqual(flush_heartbeats(), 1)
+        self.assertEqual(ContentProgress.objects.get(content=self.content).last_position, 10)
+        self.assertEqual(self.buffer.drain(), {})
+
+    def test_completion_is_written_immediately(self):
+        response = self.client.post(self.url, {'completed': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(ContentProgress.objects.get(content=self.content).completed)
+
+    def test_invalid_position(self):
+        for position in ('abc', 'nan', 'inf', '-inf'):
+            response = self.client.post(self.url, {'last_position': position}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.buffer.drain(), {})
+
+    def test_heartbeat_reads_progress_row_from_cache(self):
+        self.client.post(self.url, {'completed': True}, format='json')
+        progress = ContentProgress.objects.get(content=self.content)
+        self.client.post(self.url, {'last_position': 5}, format='json')
+        with self.assertNumQueries(1):  # The content lookup
+            response = self.client.post(self.url, {'last_position': 10}, format='json')
+        self.assertEqual(response.data['id'], progress.id)
+        self.assertTrue(response.data['completed'])
+        self.assertEqual(response.data['last_position'], 10)
+
+    def test_flush_drops_cached_missing_row(self):
+        response = self.client.post(self.url, {'last_position': 5}, format='json')
+        self.assertIsNone(response.data['id'])
+        flush_heartbeats()
+        response = self.client.post(self.url, {'last_position': 6}, format='json')
+        self.assertEqual(response.data['id'], ContentProgress.objects.get(content=self.content).id)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CourseOutlineTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.instructor = Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        self.content = TextContent.objects.create(title='First', module=self.module, text='1')
+        # Course ids are reused between tests, start from a fresh version
+        cache.delete(OUTLINE_VERSION_KEY.format(course_id=self.course.id))
+
+    def test_outline_shape(self):
+        modules = outline_modules(self.course.id)
+        self.assertEqual(len(modules), 1)
+        self.assertEqual(modules[0]['slug'], str(self.module.slug))
+        self.assertEqual(modules[0]['contents'], [reverse('content-detail', kwargs={'slug': self.content.slug})])
+        self.assertEqual(modules[0]['items'][0]['resourcetype'], 'TextContent')
+        self.assertEqual(modules[0]['items'][0]['title'], 'First')
+
+    def test_outline_is_cached(self):
+        outline_modules(self.course.id)
+        with self.assertNumQueries(0):
+            outline_modules(self.course.id)
+
+    def test_outline_invalidated_by_changes(self):
+        outline_modules(self.course.id)
+        TextContent.objects.create(title='Second', module=self.module, text='2')
+        self.assertEqual(len(outline_modules(self.course.id)[0]['items']), 2)
+
+        self.module.title = 'Renamed'
+        self.module.save()
+        self.assertEqual(outline_modules(self.course.id)[0]['title'], 'Renamed')
+
+        self.content.delete()
+        self.assertEqual(len(outline_modules(self.course.id)[0]['items']), 1)
+
+    def test_module_list_served_from_outline(self):
+        url = reverse('module_list', kwargs={'slug': self.course.slug})
+        self.client.force_authenticate(user=self.instructor_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['items'][0]['slug'], str(self.content.slug))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class OrderAllocationTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.instructor = Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+
+    def test_positions_are_sequential_per_parent(self):
+        contents = [
+            TextContent.objects.create(title=f'Content {i}', module=self.module, text='x')
+            for i in range(3)
+        ]
+        self.assertEqual([content.order for content in contents], [0, 1, 2])
+        other = Module.objects.create(title='Module 2', course=self.course)
+        self.assertEqual(other.order, 1)
+        self.assertEqual(TextContent.objects.create(title='Other', module=other, text='x').order, 0)
+
+    def test_sequence_continues_after_existing_rows(self):
+        TextContent.objects.create(title='Explicit', module=self.module, text='x', order=7)
+        content = TextContent.objects.create(title='Next', module=self.module, text='x')
+        self.assertEqual(content.order, 8)
+
+    def test_reorder_contents(self):
+        contents = [
+            TextContent.objects.create(title=f'Content {i}', module=self.module, text='x')
+            for i in range(3)
+        ]
+        url = reverse('content-reorder', kwargs={'module_slug': self.module.slug})
+        self.client.force_authenticate(user=self.instructor_user)
+        new_order = [str(contents[2].slug), str(contents[0].slug), str(contents[1].slug)]
+        response = self.client.post(url, {'order': new_order}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [str(slug) for slug in Content.objects.filter(module=self.module).order_by('order').values_list('slug', flat=True)],
+            new_order,
+        )
+        appended = TextContent.objects.create(title='Appended', module=self.module, text='x')
+        self.assertEqual(appended.order, 3)
+
+    def test_locked_sequence_is_seeded_from_existing_rows(self):
+        TextContent.objects.create(title='Explicit', module=self.module, text='x', order=4)
+        OrderSequence.objects.all().delete()
+        order_field = Content._meta.get_field('order')
+        self.assertEqual(order_field.lock_sequence(module=self.module).value, 4)
+        self.assertEqual(TextContent.objects.create(title='Next', module=self.module, text='x').order, 5)
+
+    def test_locked_sequence_of_empty_parent_starts_at_zero(self):
+        order_field = Content._meta.get_field('order')
+        self.assertEqual(order_field.lock_sequence(module=self.module).value, -1)
+        self.assertEqual(TextContent.objects.create(title='First', module=self.module, text='x').order, 0)
+
+    def test_reorder_requires_every_slug(self):
+        contents = [
+            TextContent.objects.create(title=f'Content {i}', module=self.module, text='x')
+            for i in range(2)
+        ]
+        url = reverse('content-reorder', kwargs={'module_slug': self.module.slug})
+        self.client.force_authenticate(user=self.instructor_user)
+        response = self.client.post(url, {'order': [str(contents[0].slug)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reorder_modules(self):
+        second = Module.objects.create(title='Module 2', course=self.course)
+        url = reverse('module_reorder', kwargs={'slug': self.course.slug})
+        self.client.force_authenticate(user=self.instructor_user)
+        response = self.client.post(url, {'order': [str(second.slug), str(self.module.slug)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second.refresh_from_db()
+        self.module.refresh_from_db()
+        self.assertEqual((second.order, self.module.order), (0, 1))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class StudentCourseCatalogTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.instructor = Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123'
+        )
+        self.student = Student.objects.create(user=self.student_user, education="BACHELORS",
+                                              phone_number="09991113333", birth_date="2002-10-2")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.other_subject = Subject.objects.create(title="other", slug="other")
+        self.courses = [
+            Course.objects.create(
+                title=f'Course {i}',
+                price=i * 10,
+                subject=self.subject if i % 2 else self.other_subject,
+                required_time=10,
+                owner=self.instructor_user
+            )
+            for i in range(5)
+        ]
+        self.url = reverse('course_list-list')
+        self.client.force_authenticate(user=self.student_user)
+
+    def test_pages_follow_cursor(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('modules', response.data['results'][0])
+        titles = [course['title'] for course in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            titles += [course['title'] for course in response.data['results']]
+        self.assertEqual(sorted(titles), sorted(course.title for course in self.courses))
+        self.assertEqual(len(titles), len(set(titles)))
+
+    def test_page_cost_is_constant(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(self.url, {'page_size': 2})
+        with CaptureQueriesContext(connection) as next_page:
+            self.client.get(response.data['next'])
+        self.assertEqual(len(first_page), len(next_page))
+
+    def test_filters(self):
+        response = self.client.get(self.url, {'subject': 'test'})
+        self.assertEqual({course['title'] for course in response.data['results']}, {'Course 1', 'Course 3'})
+        response = self.client.get(self.url, {'min_price': '15', 'max_price': '30'})
+        self.assertEqual({course['title'] for course in response.data['results']}, {'Course 2', 'Course 3'})
+
+    def test_invalid_price_filter(self):
+        response = self.client.get(self.url, {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ContentSubclassListingTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.instructor = Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        TextContent.objects.create(title='Text', module=self.module, text='hello')
+        VideoContent.objects.create(title='Video', module=self.module, video_file='https://example.com/v.mp4',
+                                    public_id='video')
+        ImageContent.objects.create(title='Image', module=self.module, image_file='https://example.com/i.png',
+                                    public_id='image')
+        FileContent.objects.create(title='File', module=self.module, file='https://example.com/f.pdf',
+                                   public_id='file', file_size=3)
+
+    def test_same_json_as_polymorphic_queryset(self):
+        polymorphic = ContentSerializer(self.module.contents.order_by('order'), many=True).data
+        joined = ContentSerializer(
+            Content.objects.filter(module=self.module).order_by('order').select_subclasses(), many=True
+        ).data
+        self.assertEqual(joined, polymorphic)
+        self.assertEqual([item['resourcetype'] for item in joined],
+                         ['TextContent', 'VideoContent', 'ImageContent', 'FileContent'])
+
+    def test_single_query(self):
+        contents = Content.objects.filter(module=self.module).select_subclasses()
+        with self.assertNumQueries(1):
+            ContentSerializer(contents, many=True).data
+
+    def test_module_contents_endpoint(self):
+        url = reverse('module-contents', kwargs={'module_slug': self.module.slug})
+        self.client.force_authenticate(user=self.instructor_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data], ['Text', 'Video', 'Image', 'File'])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ContentUploadPipelineTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.instructor = Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.staging_root = os.path.join(self.media_root, 'staging')
+        settings_override = override_settings(
+            MEDIA_UPLOAD_BACKEND='local',
+            MEDIA_ROOT=self.media_root,
+            UPLOAD_STAGING_ROOT=self.staging_root,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_authenticate(user=self.instructor_user)
+
+    def _post_image(self, color='red'):
+        file = io.BytesIO()
+        Image.new('RGB', (10, 10), color=color).save(file, 'png')
+        url = reverse('module-contents', kwargs={'module_slug': self.module.slug})
+        data = {
+            'title': 'Image',
+            'resourcetype': 'ImageContent',
+            'image_file': SimpleUploadedFile('image.png', file.getvalue(), content_type='image/png'),
+        }
+        return self.client.post(url, data, format='multipart')
+
+    def _upload_image(self, color='red'):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self._post_image(color)
+        self.assertEqual(len(callbacks), 1)
+        staged = [os.path.join(self.staging_root, name) for name in os.listdir(self.staging_root)]
+        self.assertEqual(len(staged), 1)
+        return response, StagedFile(staged[0], hash_file(staged[0]), os.path.getsize(staged[0]))
+
+    def test_upload_is_accepted_then_processed(self):
+        response, staged = self._upload_image()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], UploadStatus.PROCESSING)
+        content = Content.objects.get(slug=response.data['slug'])
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(UPLOAD_GROUP.format(user_id=self.instructor_user.id), channel)
+
+        self.assertEqual(finish_content_upload(content.id, staged), UploadStatus.READY)
+        content.refresh_from_db()
+        self.assertEqual(content.status, UploadStatus.READY)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, content.public_id)))
+        self.assertFalse(os.path.exists(staged.path))
+
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['upload']['slug'], str(content.slug))
+        self.assertEqual(message['upload']['status'], UploadStatus.READY)
+
+    def test_failed_upload(self):
+        response, staged = self._upload_image()
+        content = Content.objects.get(slug=response.data['slug'])
+        # A file where the media root should be makes every store fail
+        broken_root = os.path.join(self.media_root, 'broken')
+        open(broken_root, 'w').close()
+        with override_settings(MEDIA_ROOT=broken_root):
+            with self.assertRaises(UploadError):
+                finish_content_upload(content.id, staged, last_attempt=False)
+            self.assertEqual(finish_content_upload(content.id, staged), UploadStatus.FAILED)
+        content.refresh_from_db()
+        self.assertEqual(content.status, UploadStatus.FAILED)
+
+    def test_content_deleted_during_transfer_releases_file(self):
+        response, staged = self._upload_image()
+        content = Content.objects.get(slug=response.data['slug'])
+        transfer = uploads._transfer
+
+        def transfer_then_delete(*args, **kwargs):
+            result = transfer(*args, **kwargs)
+            Content.objects.filter(pk=content.pk).delete()
+            return result
+
+        with mock.patch.object(uploads, '_transfer', transfer_then_delete):
+            self.assertEqual(finish_content_upload(content.id, staged), UploadStatus.FAILED)
+        self.assertFalse(StoredAsset.objects.exists())
+        self.assertEqual(MediaTombstone.objects.count(), 1)
+        self.assertFalse(os.path.exists(staged.path))
+
+    def test_content_deleted_during_failed_transfer(self):
+        response, staged = self._upload_image()
+        content = Content.objects.get(slug=response.data['slug'])
+
+        def delete_then_fail(*args, **kwargs):
+            Content.objects.filter(pk=content.pk).delete()
+            return None
+
+        with mock.patch.object(uploads, '_transfer', delete_then_fail), \
+                mock.patch.object(uploads, 'notify_upload') as notify:
+            self.assertEqual(finish_content_upload(content.id, staged), UploadStatus.FAILED)
+        self.assertFalse(os.path.exists(staged.path))
+        self.assertEqual(notify.call_args.args[1]['status'], UploadStatus.FAILED)
+
+    def test_duplicate_upload_reuses_stored_file(self):
+        response, staged = self._upload_image()
+        first = Content.objects.get(slug=response.data['slug'])
+        finish_content_upload(first.id, staged)
+        first.refresh_from_db()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self._post_image()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], UploadStatus.READY)
+        self.assertEqual(response.data['public_id'], first.public_id)
+        self.assertEqual(len(callbacks), 1)  # Only the staging cleanup
+        self.assertEqual(os.listdir(self.staging_root), [])
+        self.assertEqual(StoredAsset.objects.get(public_id=first.public_id).ref_count, 2)
+
+        stored_path = os.path.join(self.media_root, first.public_id)
+        first.delete()
+        self.assertTrue(os.path.exists(stored_path))
+        self.assertFalse(MediaTombstone.objects.exists())
+        Content.objects.get(slug=response.data['slug']).delete()
+        self.assertFalse(StoredAsset.objects.exists())
+        self.assertEqual(drain_tombstones(), 1)
+        self.assertFalse(os.path.exists(stored_path))
+
+    def test_different_files_are_stored_separately(self):
+        response, staged = self._upload_image('red')
+        finish_content_upload(Content.objects.get(slug=response.data['slug']).id, staged)
+        response, staged = self._upload_image('blue')
+        finish_content_upload(Content.objects.get(slug=response.data['slug']).id, staged)
+        self.assertEqual(StoredAsset.objects.count(), 2)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+@override_settings(MEDIA_UPLOAD_BACKEND='local')
+class ResumableUploadTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.instructor = Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        self.staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging_root)
+        settings_override = override_settings(UPLOAD_STAGING_ROOT=self.staging_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_authenticate(user=self.instructor_user)
+        self.video = b'\x00\x00\x00\x18ftypmp42' + os.urandom(1000)
+
+    def _init(self, size, resourcetype='VideoContent'):
+        url = reverse('upload-session-create', kwargs={'module_slug': self.module.slug})
+        response = self.client.post(url, {'resourcetype': resourcetype, 'filename': 'intro.mp4', 'size': size},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return reverse('upload-session', kwargs={'upload_id': response.data['id']}), response.data['id']
+
+    def _put(self, url, chunk, offset, checksum=None):
+        return self.client.put(
+            url, chunk, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def test_chunked_upload_and_finalize(self):
+        url, upload_id = self._init(len(self.video))
+        response = self._put(url, self.video[:600], 0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], 600)
+        self.assertEqual(response.data['content_type'], 'video/mp4')
+
+        # A corrupted chunk is rejected and can be sent again
+        response = self._put(url, self.video[600:], 600, checksum='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._put(url, self.video[600:], 0)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 600)
+        response = self._put(url, self.video[600:], 600)
+        self.assertEqual(response.data['offset'], len(self.video))
+
+        session = UploadSession.objects.get(id=upload_id)
+        with open(session.staged_path, 'rb') as staged:
+            self.assertEqual(staged.read(), self.video)
+
+        finalize_url = reverse('upload-session-finalize', kwargs={'upload_id': upload_id})
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(finalize_url, {'title': 'Intro'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['resourcetype'], 'VideoContent')
+        self.assertEqual(response.data['status'], UploadStatus.PROCESSING)
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(UploadSession.objects.filter(id=upload_id).exists())
+        self.assertTrue(os.path.exists(session.staged_path))
+
+    def test_chunk_is_not_appended_after_the_offset_moved(self):
+        url, upload_id = self._init(len(self.video))
+        session = UploadSession.objects.get(id=upload_id)
+        first = self.video[:600]
+        late = receive_chunk(session, 0, io.BytesIO(first), hashlib.sha256(first).hexdigest())
+        self._put(url, first, 0)
+
+        self.assertFalse(append_chunk(session, late))
+        os.remove(late.path)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).offset, 600)
+        # Only the staging file is left, received chunks are removed
+        self.assertEqual(os.listdir(self.staging_root), [os.path.basename(session.staged_path)])
+
+    def test_finalized_file_is_hashed_by_the_upload_task(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        url, upload_id = self._init(len(self.video))
+        self._put(url, self.video, 0)
+        staged_path = UploadSession.objects.get(id=upload_id).staged_path
+        finalize_url = reverse('upload-session-finalize', kwargs={'upload_id': upload_id})
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post(finalize_url, {'title': 'Intro'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        content = Content.objects.get(slug=response.data['slug'])
+        with override_settings(MEDIA_ROOT=media_root):
+            result = finish_content_upload(content.id, StagedFile(staged_path, None, len(self.video)))
+        self.assertEqual(result, UploadStatus.READY)
+        content.refresh_from_db()
+        self.assertEqual(
+            StoredAsset.objects.get(public_id=content.public_id).sha256,
+            hashlib.sha256(self.video).hexdigest(),
+        )
+
+    def test_missing_staged_file_fails_the_upload(self):
+        url, upload_id = self._init(len(self.video))
+        self._put(url, self.video, 0)
+        staged_path = UploadSession.objects.get(id=upload_id).staged_path
+        finalize_url = reverse('upload-session-finalize', kwargs={'upload_id': upload_id})
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post(finalize_url, {'title': 'Intro'}, format='json')
+        content = Content.objects.get(slug=response.data['slug'])
+        os.remove(staged_path)
+
+        result = finish_content_upload(content.id, StagedFile(staged_path, None, len(self.video)))
+        self.assertEqual(result, UploadStatus.FAILED)
+        content.refresh_from_db()
+        self.assertEqual(content.status, UploadStatus.FAILED)
+
+    def test_finalize_discards_session_without_staged_file(self):
+        url, upload_id = self._init(len(self.video))
+        self._put(url, self.video, 0)
+        os.remove(UploadSession.objects.get(id=upload_id).staged_path)
+        finalize_url = reverse('upload-session-finalize', kwargs={'upload_id': upload_id})
+        response = self.client.post(finalize_url, {'title': 'Intro'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UploadSession.objects.filter(id=upload_id).exists())
+        self.assertFalse(Content.objects.exists())
+
+    def test_finalize_requires_every_chunk(self):
+        url, upload_id = self._init(len(self.video))
+        self._put(url, self.video[:600], 0)
+        finalize_url = reverse('upload-session-finalize', kwargs={'upload_id': upload_id})
+        response = self.client.post(finalize_url, {'title': 'Intro'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_disallowed_type_rejected_on_first_chunk(self):
+        executable = b'MZ' + os.urandom(100)
+        url, upload_id = self._init(len(executable))
+        response = self._put(url, executable, 0)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).offset, 0)
+
+    def test_size_limit(self):
+        url = reverse('upload-session-create', kwargs={'module_slug': self.module.slug})
+        response = self.client.post(url, {'resourcetype': 'VideoContent', 'filename': 'big.mp4',
+                                          'size': 101 * 1024 * 1024}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LocalMediaStorageTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = LocalMediaStorage()
+        self.data = os.urandom(1000)
+        file = io.BytesIO(self.data)
+        file.name = 'clip.mp4'
+        self.stored = self.storage.upload(file)
+
+    def test_upload_and_destroy_many(self):
+        self.assertEqual(self.stored['resource_type'], 'video')
+        self.assertEqual(self.storage.url(self.stored['public_id']), self.stored['url'])
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, self.stored['public_id'])))
+        gone = self.storage.destroy_many([self.stored['public_id'], 'e-learning/missing.mp4'])
+        self.assertEqual(gone, [self.stored['public_id'], 'e-learning/missing.mp4'])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, self.stored['public_id'])))
+
+    def test_serve_whole_file(self):
+        request = RequestFactory().get('/')
+        response = self.storage.serve(request, self.stored['public_id'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        response.close()
+
+    def test_serve_range(self):
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=100-199')
+        response = self.storage.serve(request, self.stored['public_id'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1000')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=-10')
+        response = self.storage.serve(request, self.stored['public_id'])
+        self.assertEqual(b''.join(response.streaming_content), self.data[-10:])
+
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=2000-')
+        response = self.storage.serve(request, self.stored['public_id'])
+        self.assertEqual(response.status_code, 416)
+
+    def test_serve_only_uploaded_files(self):
+        os.makedirs(os.path.join(self.media_root, 'staging'))
+        with open(os.path.join(self.media_root, 'staging', 'upload'), 'wb') as file:
+            file.write(self.data)
+        request = RequestFactory().get('/')
+        for public_id in ('staging/upload', 'e-learning/../staging/upload'):
+            with self.assertRaises(Http404):
+                self.storage.serve(request, public_id)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class MediaTombstoneTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_UPLOAD_BACKEND='local', MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        self.module = Module.objects.create(title='Module 1', course=self.course)
+        self.storage = LocalMediaStorage()
+        self.public_ids = []
+        video = self._store('clip.mp4')
+        VideoContent.objects.create(module=self.module, title='Video', video_file=video['url'],
+                                    public_id=video['public_id'])
+        file = self._store('notes.pdf')
+        FileContent.objects.create(module=self.module, title='File', file=file['url'],
+                                   public_id=file['public_id'], file_size=100)
+        media = self._store('cover.png')
+        CourseMedia.objects.create(course=self.course, title='Cover', media_type='image',
+                                   file_url=media['url'], public_id=media['public_id'], size=100)
+
+    def _store(self, name):
+        file = io.BytesIO(os.urandom(100))
+        file.name = name
+        stored = self.storage.upload(file)
+        self.public_ids.append(stored['public_id'])
+        return stored
+
+    def _stored_files(self):
+        return [public_id for public_id in self.public_ids
+                if os.path.exists(os.path.join(self.media_root, public_id))]
+
+    def test_cascade_delete_queues_files(self):
+        self.course.delete()
+        self.assertCountEqual(MediaTombstone.objects.values_list('public_id', flat=True), self.public_ids)
+        self.assertEqual(len(self._stored_files()), 3)
+
+        self.assertEqual(drain_tombstones(batch_size=2), 3)
+        self.assertEqual(self._stored_files(), [])
+        self.assertFalse(MediaTombstone.objects.exists())
+
+    def test_queryset_delete_queues_files(self):
+        Content.objects.filter(module=self.module).delete()
+        self.assertCountEqual(MediaTombstone.objects.values_list('public_id', flat=True), self.public_ids[:2])
+
+    def test_failed_delete_is_retried(self):
+        # A non-empty directory cannot be deleted as a file
+        os.makedirs(os.path.join(self.media_root, 'e-learning', 'busy', 'inner'))
+        MediaTombstone.objects.create(public_id='e-learning/busy')
+        CourseMedia.objects.all().delete()
+
+        self.assertEqual(drain_tombstones(), 1)
+        tombstone = MediaTombstone.objects.get()
+        self.assertEqual(tombstone.public_id, 'e-learning/busy')
+        self.assertEqual(tombstone.attempts, 1)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ImageDerivativeTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.derivative_root = os.path.join(self.media_root, 'derivatives')
+        settings_override = override_settings(
+            MEDIA_UPLOAD_BACKEND='local',
+            MEDIA_ROOT=self.media_root,
+            IMAGE_DERIVATIVE_ROOT=self.derivative_root,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123',
+        )
+        self.client.force_authenticate(user=self.user)
+        subject = Subject.objects.create(title="test", slug="test")
+        self.course = Course.objects.create(
+            title='Test Course',
+            price=0,
+            subject=subject,
+            required_time=10,
+            owner=self.user,
+            thumbnail=SimpleUploadedFile('cover.png', self._png(1200, 800), content_type='image/png'),
+        )
+        module = Module.objects.create(title='Module 1', course=self.course)
+        file = io.BytesIO(self._png(100, 100))
+        file.name = 'small.png'
+        stored = LocalMediaStorage().upload(file)
+        self.content = ImageContent.objects.create(module=module, title='Image', image_file=stored['url'],
+                                                   public_id=stored['public_id'])
+
+    def _png(self, width, height):
+        file = io.BytesIO()
+        Image.new('RGBA', (width, height), color=(255, 0, 0, 128)).save(file, 'png')
+        return file.getvalue()
+
+    def _get(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_course_derivative(self):
+        url = reverse('course_image', kwargs={'slug': self.course.slug, 'preset': 'card'})
+        response, image = self._get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual((image.format, image.size), ('WEBP', (640, 360)))
+
+        response, image = self._get(url + '?output=jpeg')
+        self.assertEqual((image.format, image.size), ('JPEG', (640, 360)))
+        self.assertEqual(len(os.listdir(self.derivative_root)), 2)
+
+        # Served from the cache
+        self._get(url, HTTP_ACCEPT='image/webp')
+        self.assertEqual(len(os.listdir(self.derivative_root)), 2)
+
+    def test_small_images_are_not_enlarged(self):
+        url = reverse('content_image', kwargs={'slug': self.content.slug, 'preset': 'hero'})
+        response, image = self._get(url)
+        self.assertEqual((image.format, image.size), ('JPEG', (100, 56)))
+
+    def test_invalid_requests(self):
+        url = reverse('course_image', kwargs={'slug': self.course.slug, 'preset': 'huge'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        url = reverse('course_image', kwargs={'slug': self.course.slug, 'preset': 'card'})
+        self.assertEqual(self.client.get(url + '?output=gif').status_code, status.HTTP_400_BAD_REQUEST)
+        url = reverse('content_image', kwargs={'slug': uuid.uuid4(), 'preset': 'card'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = DerivativeCache(self.derivative_root, max_bytes=250)
+        for index, key in enumerate(['a', 'b']):
+            cache.put(key, b'x' * 100).close()
+            os.utime(cache.path(key), (index, index))
+        cache.get('a').close()
+        with cache.put('c', b'x' * 100) as file:
+            self.assertEqual(file.read(), b'x' * 100)
+        self.assertCountEqual(os.listdir(self.derivative_root), ['a', 'c'])
+
+    def test_cache_is_scanned_only_when_full(self):
+        cache = DerivativeCache(self.derivative_root, max_bytes=250)
+        with mock.patch.object(DerivativeCache, 'evict', autospec=True, side_effect=DerivativeCache.evict) as evict:
+            for key in ['a', 'b', 'c']:
+                cache.put(key, b'x' * 100).close()
+        # Once to count the existing files, once when the third write fills it
+        self.assertEqual(evict.call_count, 2)
+        self.assertEqual(len(os.listdir(self.derivative_root)), 2)
+
+    def test_evicted_derivative_is_still_served(self):
+        cache = DerivativeCache(self.derivative_root, max_bytes=250)
+        cache.put('a', b'x' * 100).close()
+        with cache.get('a') as file:
+            os.remove(cache.path('a'))
+            self.assertEqual(file.read(), b'x' * 100)
+
@@ -0,0 +1,466 @@
+"""
+Background processing of media uploads.
+
+Views stream the uploaded file into UPLOAD_STAGING_ROOT, save the row with
+status "processing" and answer 202 right away. The process_*_upload tasks
+then transfer the staged file to the media backend, fill in its url and
+public_id and push the outcome to the ``uploads_<user id>`` channel group,
+which UploadStatusConsumer forwards to the owner's websocket.
+
+Large files can instead be sent through an UploadSession: chunks are
+appended to the staging file by offset and the finalized file enters the
+same pipeline without being read back. Its digest is computed by the upload
+task rather than by the request finalizing the session.
+
+Staged files carry the SHA-256 of their bytes. Files already stored (see
+assets.py) are reused, so re-uploads finish without any transfer.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from .assets import acquire_asset, register_asset, release_asset
+from .models import Content, CourseMedia, UploadSession, UploadStatus
+from .storage import get_media_storage
+from .utils import ALLOWED_FILE_TYPES, sniff_content_type
+
+UPLOAD_GROUP = "uploads_{user_id}"
+
+# Largest chunk accepted by a single PUT of a resumable upload
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Resumable uploads not finalized within this time are discarded
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+READ_SIZE = 64 * 1024
+
+# Resource type to file field mapping
+RESOURCE_TYPE_MAPPING = {
+    "VideoContent": "video_file",
+    "ImageContent": "image_file",
+    "FileContent": "file",
+    "TextContent": None,
+}
+
+# Content types a resumable upload must sniff as, per resource type
+RESOURCE_MEDIA_PREFIX = {
+    "VideoContent": "video/",
+    "ImageContent": "image/",
+}
+
+
+# A file in the staging directory. Passed to the upload tasks as a list.
+# ``sha256`` is None until the upload task hashes a resumable upload.
+StagedFile = namedtuple("StagedFile", ["path", "sha256", "size"])
+
+# A chunk of a resumable upload waiting in its own file to be appended
+ReceivedChunk = namedtuple("ReceivedChunk", ["path", "offset", "size", "content_type"])
+
+
+class UploadError(Exception):
+    """The media backend did not accept a staged file."""
+
+
+class ChunkRejected(Exception):
+    """A chunk of a resumable upload was not appended."""
+
+
+def hash_file(path):
+    """Return the hex SHA-256 of a file, reading it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_upload(file):
+    """
+    Move an uploaded file into the staging directory.
+
+    Files Django already spooled to disk are moved instead of copied, small
+    in-memory uploads are written out chunk by chunk and hashed on the way.
+
+    Args:
+        file: The UploadedFile from the request
+
+    Returns:
+        StagedFile: The staged file and its digest
+    """
+    os.makedirs(settings.UPLOAD_STAGING_ROOT, exist_ok=True)
+    extension = os.path.splitext(file.name or "")[1].lower()
+    path = os.path.join(settings.UPLOAD_STAGING_ROOT, f"{uuid.uuid4().hex}{extension}")
+    if hasattr(file, "temporary_file_path"):
+        shutil.move(file.temporary_file_path(), path)
+        return StagedFile(path, hash_file(path), file.size)
+    digest = hashlib.sha256()
+    with open(path, "wb") as staged:
+        for chunk in file.chunks():
+            digest.update(chunk)
+            staged.write(chunk)
+    return StagedFile(path, digest.hexdigest(), file.size)
+
+
+def _file_fields(resource_type, stored):
+    """Model fields of a content of ``resource_type`` pointing at a stored file."""
+    fields = {
+        RESOURCE_TYPE_MAPPING[resource_type]: stored["url"],
+        "public_id": stored["public_id"],
+    }
+    if resource_type in ("VideoContent", "ImageContent"):
+        fields["thumbnail_url"] = stored.get("thumbnail_url")
+    return fields
+
+
+def create_uploaded_content(serializer, module, resource_type, staged):
+    """
+    Save a validated ContentSerializer for a staged file.
+
+    If the same bytes are already stored the content is ready at once.
+    Otherwise, or if the staged file is not hashed yet, it is created with
+    status "processing" and the transfer of the staged file is queued for
+    when the row is committed.
+
+    Args:
+        serializer: A valid ContentSerializer without the file fields
+        module: The module the content belongs to
+        resource_type: One of the file types of RESOURCE_TYPE_MAPPING
+        staged: The StagedFile, removed once it is no longer needed
+
+    Returns:
+        Content: The created content
+    """
+    extra = {"file_size": staged.size} if resource_type == "FileContent" else {}
+    with transaction.atomic():
+        stored = acquire_asset(staged.sha256) if staged.sha256 else None
+        if stored is not None:
+            content = serializer.save(
+                module=module,
+                status=UploadStatus.READY,
+                **_file_fields(resource_type, stored),
+                **extra,
+            )
+            transaction.on_commit(lambda: os.remove(staged.path))
+        else:
+            content = serializer.save(
+                module=module, status=UploadStatus.PROCESSING, **extra
+            )
+            schedule_content_upload(content, staged)
+    return content
+
+
+def create_uploaded_media(serializer, course, staged):
+    """Save a validated CourseMediaSerializer for a staged file, like content."""
+    with transaction.atomic():
+        stored = acquire_asset(staged.sha256)
+        if stored is not None:
+            media = serializer.save(
+                course=course,
+                size=staged.size,
+                status=UploadStatus.READY,
+                file_url=stored["url"],
+                public_id=stored["public_id"],
+                thumbnail_url=stored.get("thumbnail_url"),
+            )
+            transaction.on_commit(lambda: os.remove(staged.path))
+        else:
+            media = serializer.save(
+                course=course, size=staged.size, status=UploadStatus.PROCESSING
+            )
+            schedule_media_upload(media, staged)
+    return media
+
+
+def receive_chunk(session, offset, stream, checksum):
+    """
+    Stream a chunk of a resumable upload into a temporary file.
+
+    The chunk is hashed on the way and nothing is locked while it is read,
+    see ``append_chunk``. The type of the file is sniffed from the first
+    chunk, so a disallowed file is rejected before the rest of it is sent.
+
+    Args:
+        session: The UploadSession, read without a lock
+        offset: Upload-Offset the chunk was sent at
+        stream: File-like object with the chunk body
+        checksum: Hex SHA-256 of the chunk sent by the client
+
+    Returns:
+        ReceivedChunk: The temporary file, which the caller removes
+
+    Raises:
+        ChunkRejected: The chunk is too large, corrupt or of a disallowed type
+    """
+    os.makedirs(settings.UPLOAD_STAGING_ROOT, exist_ok=True)
+    digest = hashlib.sha256()
+    received = 0
+    content_type = session.content_type
+    fd, path = tempfile.mkstemp(suffix=".part", dir=settings.UPLOAD_STAGING_ROOT)
+    try:
+        with os.fdopen(fd, "wb") as chunk:
+            while True:
+                piece = stream.read(READ_SIZE)
+                if not piece:
+                    break
+                received += len(piece)
+                if received > CHUNK_SIZE:
+                    raise ChunkRejected(f"Chunks must not exceed {CHUNK_SIZE} bytes")
+                if offset + received > session.size:
+                    raise ChunkRejected("Chunk goes past the declared size")
+                if offset == 0 and received == len(piece):
+                    content_type = sniff_content_type(piece)
+                    if content_type not in ALLOWED_FILE_TYPES:
+                        raise ChunkRejected(
+                            "File type not allowed. "
+                            f"Allowed types: {', '.join(ALLOWED_FILE_TYPES)}"
+                        )
+                    expected = RESOURCE_MEDIA_PREFIX.get(session.resourcetype, "")
+                    if not content_type.startswith(expected):
+                        raise ChunkRejected(f"File is not valid for {session.resourcetype}")
+                digest.update(piece)
+                chunk.write(piece)
+        if not received:
+            raise ChunkRejected("Empty chunk")
+        if digest.hexdigest() != (checksum or "").lower():
+            raise ChunkRejected("Chunk checksum does not match")
+    except BaseException:
+        os.remove(path)
+        raise
+    return ReceivedChunk(path, offset, received, content_type)
+
+
+def append_chunk(session, chunk):
+    """
+    Append a received chunk to the staging file of a resumable upload.
+
+    The offset only advances if it is still the one the chunk was sent at,
+    and the staging file is written after it, so an error rolls the offset
+    back with the caller's transaction. A previously interrupted append is
+    overwritten.
+
+    Args:
+        session: The UploadSession, locked by the caller
+        chunk: ReceivedChunk from ``receive_chunk``
+
+    Returns:
+        bool: False if the offset moved since the chunk was sent
+    """
+    advanced = UploadSession.objects.filter(pk=session.pk, offset=chunk.offset).update(
+        offset=chunk.offset + chunk.size, content_type=chunk.content_type
+    )
+    if not advanced:
+        return False
+    path = session.staged_path
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as staged, open(
+        chunk.path, "rb"
+    ) as source:
+        staged.truncate(chunk.offset)
+        staged.seek(chunk.offset)
+        shutil.copyfileobj(source, staged, READ_SIZE)
+    session.offset = chunk.offset + chunk.size
+    session.content_type = chunk.content_type
+    return True
+
+
+def discard_session(session):
+    """Delete a resumable upload and its staging file."""
+    if os.path.exists(session.staged_path):
+        os.remove(session.staged_path)
+    session.delete()
+
+
+def purge_upload_sessions():
+    """Discard resumable uploads older than UPLOAD_SESSION_TTL."""
+    expired = UploadSession.objects.filter(created__lt=timezone.now() - UPLOAD_SESSION_TTL)
+    count = 0
+    for session in expired.iterator():
+        discard_session(session)
+        count += 1
+    return count
+
+
+def schedule_content_upload(content, staged, replaced_public_id=None):
+    """Queue the transfer of a staged file once the content row is committed."""
+    from .tasks import process_content_upload
+
+    transaction.on_commit(
+        lambda: process_content_upload.delay(content.pk, staged, replaced_public_id)
+    )
+
+
+def schedule_media_upload(media, staged):
+    """Queue the transfer of a staged file once the media row is committed."""
+    from .tasks import process_media_upload
+
+    transaction.on_commit(lambda: process_media_upload.delay(media.pk, staged))
+
+
+def notify_upload(user_id, upload):
+    """Push an upload status change to the user's open websockets."""
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            UPLOAD_GROUP.format(user_id=user_id),
+            {"type": "upload.status", "upload": upload},
+        )
+    except Exception as e:
+        # Clients can still poll the status, a lost push is not fatal.
+        print(f"Error sending upload status: {str(e)}")
+
+
+def _transfer(staged, last_attempt):
+    """
+    Store a staged file, reusing a stored copy of the same bytes.
+
+    Returns None once every attempt has failed.
+    """
+    stored = acquire_asset(staged.sha256)
+    if stored is not None:
+        return stored
+    with open(staged.path, "rb") as file:
+        result = get_media_storage().upload(file)
+    if result is None:
+        if not last_attempt:
+            raise UploadError(f"Upload of {staged.path} failed")
+        return None
+    return register_asset(staged.sha256, result, staged.size)
+
+
+def _remove_staged(staged):
+    if os.path.exists(staged.path):
+        os.remove(staged.path)
+
+
+def _store_staged(staged, last_attempt):
+    """
+    Hash a staged file if needed and store it like ``_transfer``.
+
+    Returns None if the staged file is gone, e.g. discarded with its
+    session, since no retry can store it.
+    """
+    try:
+        if staged.sha256 is None:
+            staged = staged._replace(sha256=hash_file(staged.path))
+        return _transfer(staged, last_attempt)
+    except FileNotFoundError as e:
+        print(f"Error uploading staged file: {str(e)}")
+        return None
+
+
+def finish_content_upload(content_id, staged, replaced_public_id=None, last_attempt=True):
+    """
+    Transfer the staged file of a content and mark the content ready.
+
+    Args:
+        content_id: Primary key of the processing content
+        staged: The StagedFile returned by ``stage_upload``
+        replaced_public_id: File to release once the new one is stored
+        last_attempt: Mark the content failed instead of raising UploadError
+
+    Returns:
+        str: The new upload status
+    """
+    staged = StagedFile(*staged)
+    content = Content.objects.filter(pk=content_id).first()
+    if content is None:
+        # Deleted while the upload was queued.
+        _remove_staged(staged)
+        return None
+    resource_type = type(content).__name__
+    result = _store_staged(staged, last_attempt)
+
+    if result is None:
+        # update() rather than save(), which raises if the row is gone
+        content.status = UploadStatus.FAILED
+        Content.objects.filter(pk=content_id).update(status=UploadStatus.FAILED)
+    else:
+        fields = _file_fields(resource_type, result)
+        for name, value in fields.items():
+            setattr(content, name, value)
+        content.status = UploadStatus.READY
+        try:
+            with transaction.atomic():
+                content.save(update_fields=[*fields, "status"])
+        except (Content.DoesNotExist, DatabaseError) as e:
+            # Deleted during the transfer or not writable, nothing refers to the file
+            print(f"Error saving uploaded content {content_id}: {str(e)}")
+            release_asset(result["public_id"])
+            content.status = UploadStatus.FAILED
+            Content.objects.filter(pk=content_id).update(status=UploadStatus.FAILED)
+            result = None
+        else:
+            if replaced_public_id:
+                release_asset(replaced_public_id)
+    _remove_staged(staged)
+
+    owner_id = Content.objects.non_polymorphic().filter(pk=content_id).values_list(
+        "module__course__owner_id", flat=True
+    ).first()
+    notify_upload(
+        owner_id,
+        {
+            "kind": "content",
+            "slug": str(content.slug),
+            "resourcetype": resource_type,
+            "status": content.status,
+            "url": result["url"] if result else None,
+        },
+    )
+    return content.status
+
+
+def finish_media_upload(media_id, staged, last_attempt=True):
+    """
+    Transfer the staged file of a course media and mark it ready.
+
+    Args:
+        media_id: Primary key of the processing CourseMedia
+        staged: The StagedFile returned by ``stage_upload``
+        last_attempt: Mark the media failed instead of raising UploadError
+
+    Returns:
+        str: The new upload status
+    """
+    staged = StagedFile(*staged)
+    media = CourseMedia.objects.select_related("course").filter(pk=media_id).first()
+    if media is None:
+        _remove_staged(staged)
+        return None
+    result = _store_staged(staged, last_attempt)
+
+    if result is None:
+        media.status = UploadStatus.FAILED
+        CourseMedia.objects.filter(pk=media_id).update(status=UploadStatus.FAILED)
+    else:
+        media.file_url = result["url"]
+        media.public_id = result["public_id"]
+        media.thumbnail_url = result.get("thumbnail_url")
+        media.status = UploadStatus.READY
+        try:
+            with transaction.atomic():
+                media.save(update_fields=["file_url", "public_id", "thumbnail_url", "status"])
+        except (CourseMedia.DoesNotExist, DatabaseError) as e:
+            print(f"Error saving uploaded media {media_id}: {str(e)}")
+            release_asset(result["public_id"])
+            media.status = UploadStatus.FAILED
+            CourseMedia.objects.filter(pk=media_id).update(status=UploadStatus.FAILED)
+            media.file_url = ""
+    _remove_staged(staged)
+
+    notify_upload(
+        media.course.owner_id,
+        {
+            "kind": "media",
+            "id": media.id,
+            "status": media.status,
+            "url": media.file_url or None,
+        },
+    )
+    return media.status
@@ -1,84 +1,41 @@
-import os
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-from django.conf import settings
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-
-
-def upload_file_to_cloudinary(file, folder="e-learning"):
-    """
-    Upload a file to Cloudinary and return the URL.
-
-    Args:
-        file: The file to upload
-        folder: The folder in Cloudinary to store the file
-
-    Returns:
-        dict: Contains the URL and other metadata of the uploaded file
-    """
-    try:
-        # Upload the file to Cloudinary
-        result = cloudinary.uploader.upload(
-            file,
-            folder=folder,
-            resource_type="auto",  # Automatically detect if it's an image or video
-            eager=[
-                {"format": "mp4", "quality": "auto"},  # For videos
-                {"format": "webp", "quality": "auto"},  # For images
-            ],
-            eager_async=True,
-        )
-
-        return {
-            "url": result["secure_url"],
-            "public_id": result["public_id"],
-            "format": result["format"],
-            "resource_type": result["resource_type"],
-        }
-    except Exception as e:
-        # Log the error and return None
-        print(f"Error uploading to Cloudinary: {str(e)}")
-        return None
-
-
-def delete_file_from_cloudinary(public_id):
-    """
-    Delete a file from Cloudinary.
-
-    Args:
-        public_id: The public_id of the file to delete
-
-    Returns:
-        bool: True if deletion was successful, False otherwise
-    """
-    try:
-        result = cloudinary.uploader.destroy(public_id)
-        return result.get("result") == "ok"
-    except Exception as e:
-        print(f"Error deleting from Cloudinary: {str(e)}")
-        return False
-
-
-def get_file_url(public_id):
+ALLOWED_FILE_TYPES = [
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "video/mp4",
+    "video/webm",
+]
+
+MAX_FILE_SIZE_MB = 100
+
+# Leading bytes of the allowed file types, with the offset they start at
+FILE_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "video/webm"),
+]
+
+
+def sniff_content_type(head):
     """
-    Get the URL of a file from Cloudinary.
+    Detect the type of a file from its first bytes.
 
     Args:
-        public_id: The public_id of the file
+        head: The first bytes of the file, at least 12 to detect every type
 
     Returns:
-        str: The URL of the file
+        str: The content type, or None if the signature is not recognized
     """
-    try:
-        return cloudinary.CloudinaryImage(public_id).build_url()
-    except Exception as e:
-        print(f"Error getting file URL: {str(e)}")
-        return None
+    for offset, signature, content_type in FILE_SIGNATURES:
+        if head[offset : offset + len(signature)] == signature:
+            return content_type
+    return None
 
 
-def validate_file(file, max_size_mb=100, allowed_types=None):
+def validate_file(file, max_size_mb=MAX_FILE_SIZE_MB, allowed_types=None):
     """
     Validate a file before uploading.
 
@@ -91,13 +48,7 @@ def validate_file(file, max_size_mb=100, allowed_types=None):
         tuple: (is_valid, error_message)
     """
     if allowed_types is None:
-        allowed_types = [
-            "image/jpeg",
-            "image/png",
-            "image/gif",
-            "video/mp4",
-            "video/webm",
-        ]
+        allowed_types = ALLOWED_FILE_TYPES
 
     # Check file size
     max_size_bytes = max_size_mb * 1024 * 1024
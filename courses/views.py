@@ -1,9 +1,18 @@
+import math
+import os
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from django.db import transaction
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
 from drf_spectacular.utils import (
     extend_schema,
     extend_schema_view,
@@ -15,11 +24,14 @@ from rest_framework.permissions import IsAuthenticated
 from drf_spectacular.types import OpenApiTypes
 from .serializers import (
     CourseSerializer,
+    CourseListSerializer,
     ModuleSerializer,
     ContentSerializer,
     CourseProgressSerializer,
     ContentProgressSerializer,
     CourseMediaSerializer,
+    ReorderSerializer,
+    UploadSessionSerializer,
 )
 from core.permissions import IsInstructor, IsOwner, IsStudent
 from .models import (
@@ -29,9 +41,30 @@ from .models import (
     CourseProgress,
     ContentProgress,
     CourseMedia,
+    ImageContent,
+    UploadSession,
+    UploadStatus,
+)
+from .utils import validate_file
+from .uploads import (
+    CHUNK_SIZE,
+    RESOURCE_TYPE_MAPPING,
+    ChunkRejected,
+    append_chunk,
+    receive_chunk,
+    StagedFile,
+    create_uploaded_content,
+    create_uploaded_media,
+    discard_session,
+    schedule_content_upload,
+    stage_upload,
 )
-from .utils import validate_file, upload_file_to_cloudinary, delete_file_from_cloudinary
 from .tasks import send_course_update_notification
+from .heartbeat import forget_progress, get_heartbeat_buffer, get_progress_fields
+from .outline import outline_modules, bump_outline_version
+from .pagination import CourseCursorPagination
+from .storage import UPLOAD_FOLDER, get_media_storage
+from .derivatives import FORMATS, PRESETS, DerivativeError, get_derivative
 
 
 @extend_schema_view(
@@ -124,8 +157,8 @@ class ModuleListView(APIView):
     def get(self, request, slug: str = None):
         course = get_object_or_404(Course, slug=slug)
         self.check_object_permissions(request, course)
-        course_modules_serializer = ModuleSerializer(instance=course.modules, many=True)
-        return Response(data=course_modules_serializer.data, status=status.HTTP_200_OK)
+        modules = outline_modules(course.id, request=request)
+        return Response(data=modules, status=status.HTTP_200_OK)
 
 
 @extend_schema_view(
@@ -252,13 +285,89 @@ class ModuleViewSet(ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-# Resource type to file field mapping
-RESOURCE_TYPE_MAPPING = {
-    "VideoContent": "video_file",
-    "ImageContent": "image_file",
-    "FileContent": "file",
-    "TextContent": None,
-}
+def reorder_children(request, model, **scope):
+    """Validate a reorder request and rewrite the positions in one UPDATE.
+
+    The parent's position counter stays locked from the validation to the
+    rewrite, so no child can be added in between.
+    """
+    serializer = ReorderSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    order = serializer.validated_data["order"]
+    order_field = model._meta.get_field("order")
+    with transaction.atomic():
+        order_field.lock_sequence(**scope)
+        existing = set(
+            model._default_manager.filter(**scope).values_list("slug", flat=True)
+        )
+        if existing != set(order):
+            return Response(
+                {"error": "order must list every slug of the parent exactly once"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        order_field.reorder(order, **scope)
+    return Response(
+        data=[{"slug": slug, "order": position} for position, slug in enumerate(order)],
+        status=status.HTTP_200_OK,
+    )
+
+
+@extend_schema_view(
+    post=extend_schema(tags=["courses"]),
+)
+class ModuleReorderView(APIView):
+    permission_classes = [IsAuthenticated, IsInstructor, IsOwner]
+
+    @extend_schema(
+        summary="Reorder the modules of a course",
+        description="Set the position of every module of the course in one request. "
+        "`order` lists all module slugs in their new order.",
+        request=ReorderSerializer,
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: {"description": "Invalid or incomplete order"},
+            404: {"description": "Course not found"},
+        },
+    )
+    def post(self, request, slug: str):
+        course = get_object_or_404(Course, slug=slug)
+        self.check_object_permissions(request, course)
+        response = reorder_children(request, Module, course=course)
+        bump_outline_version(course.id)
+        return response
+
+
+@extend_schema_view(
+    post=extend_schema(tags=["content"]),
+)
+class ContentReorderView(APIView):
+    permission_classes = [IsAuthenticated, IsInstructor, IsOwner]
+
+    @extend_schema(
+        summary="Reorder the contents of a module",
+        description="Set the position of every content of the module in one request. "
+        "`order` lists all content slugs in their new order.",
+        request=ReorderSerializer,
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: {"description": "Invalid or incomplete order"},
+            404: {"description": "Module not found"},
+        },
+    )
+    def post(self, request, module_slug: str):
+        module = get_object_or_404(Module.objects.select_related("course"), slug=module_slug)
+        self.check_object_permissions(request, module.course)
+        response = reorder_children(request, Content, module=module)
+        bump_outline_version(module.course_id)
+        return response
+
+
+def upload_response_status(content):
+    """201 if an uploaded file was already stored, 202 while it is transferred."""
+    if content.status == UploadStatus.READY:
+        return status.HTTP_201_CREATED
+    return status.HTTP_202_ACCEPTED
 
 
 @extend_schema_view(
@@ -288,13 +397,16 @@ class ContentViewListCreate(APIView):
     )
     def get(self, request, module_slug):
         module = get_object_or_404(Module, slug=module_slug)
-        contents = module.contents.all()
+        contents = Content.objects.filter(module=module).order_by("order").select_subclasses()
         serializer = ContentSerializer(instance=contents, many=True)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     @extend_schema(
         summary="Create module content",
-        description="Create a new content item for a specific module. Use multipart/form-data for file uploads.",
+        description="Create a new content item for a specific module. Use multipart/form-data for file uploads. "
+        "File contents are created with status `processing` and answered with 202; the file is "
+        "transferred in the background and the status pushed on `ws/uploads/`. A file whose "
+        "bytes are already stored is reused and answered with 201.",
         request={
             "multipart/form-data": {
                 "type": "object",
@@ -339,6 +451,7 @@ class ContentViewListCreate(APIView):
         },
         responses={
             201: ContentSerializer,
+            202: ContentSerializer,
             400: {"type": "object", "properties": {"detail": {"type": "string"}}},
             404: {"type": "object", "properties": {"detail": {"type": "string"}}},
         },
@@ -355,49 +468,211 @@ class ContentViewListCreate(APIView):
     def post(self, request, module_slug):
         module = get_object_or_404(Module, slug=module_slug)
         resource_type = request.data.get("resourcetype")
+        file_field = RESOURCE_TYPE_MAPPING.get(resource_type)
 
-        # Check if it's a file-based content
-        if resource_type in RESOURCE_TYPE_MAPPING:
-            file_field = RESOURCE_TYPE_MAPPING[resource_type]
-
-            if file_field:  # Skip for TextContent
-                file = request.FILES.get(file_field)
-                if not file:
-                    return Response(
-                        {"error": f"{file_field} is required"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Validate file
-                is_valid, error_message = validate_file(file)
-                if not is_valid:
-                    return Response(
-                        {"error": error_message}, status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Upload to Cloudinary
-                upload_result = upload_file_to_cloudinary(file)
-                if not upload_result:
-                    return Response(
-                        {"error": "Failed to upload file"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Add Cloudinary data to request data
-                request.data[file_field] = upload_result["url"]
-                request.data["public_id"] = upload_result["public_id"]
-
-                # Add specific fields based on content type
-                if resource_type == "VideoContent":
-                    request.data["thumbnail_url"] = upload_result.get("thumbnail_url")
-                elif resource_type == "FileContent":
-                    request.data["file_size"] = file.size
+        if not file_field:  # TextContent or an unknown type
+            serializer = ContentSerializer(data=request.data)
+            if serializer.is_valid():
+                serializer.save(module=module)
+                return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+            return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file = request.FILES.get(file_field)
+        if not file:
+            return Response(
+                {"error": f"{file_field} is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Validate file
+        is_valid, error_message = validate_file(file)
+        if not is_valid:
+            return Response({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = ContentSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(module=module)
-            return Response(data=serializer.data, status=status.HTTP_201_CREATED)
-        return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # The transfer to the media backend happens in process_content_upload,
+        # unless the same file is already stored
+        content = create_uploaded_content(
+            serializer, module, resource_type, stage_upload(file)
+        )
+        return Response(data=serializer.data, status=upload_response_status(content))
+
+
+@extend_schema_view(
+    post=extend_schema(tags=["content"]),
+)
+class UploadSessionCreateView(APIView):
+    permission_classes = [IsAuthenticated, IsInstructor, IsOwner]
+
+    @extend_schema(
+        summary="Start a resumable upload",
+        description="Open an upload session for a file content of the module. Send the file "
+        "in chunks with PUT on the returned session, then finalize it.",
+        request=UploadSessionSerializer,
+        responses={
+            201: UploadSessionSerializer,
+            400: {"description": "Invalid file metadata"},
+            404: {"description": "Module not found"},
+        },
+    )
+    def post(self, request, module_slug):
+        module = get_object_or_404(Module.objects.select_related("course"), slug=module_slug)
+        self.check_object_permissions(request, module.course)
+        serializer = UploadSessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save(owner=request.user, module=module)
+        return Response(
+            data={**serializer.data, "chunk_size": CHUNK_SIZE},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+@extend_schema_view(
+    get=extend_schema(tags=["content"]),
+    put=extend_schema(tags=["content"]),
+    delete=extend_schema(tags=["content"]),
+)
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated, IsInstructor]
+
+    def get_session(self, request, upload_id, lock=False):
+        sessions = UploadSession.objects.filter(owner=request.user)
+        if lock:
+            sessions = sessions.select_for_update()
+        return get_object_or_404(sessions, id=upload_id)
+
+    @extend_schema(
+        summary="Get a resumable upload",
+        description="Get the number of bytes received so far, to resume from `offset`.",
+        responses={200: UploadSessionSerializer, 404: {"description": "Upload not found"}},
+    )
+    def get(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        return Response(data=UploadSessionSerializer(session).data)
+
+    @extend_schema(
+        summary="Upload a chunk",
+        description="Append the raw request body at `Upload-Offset`, which must equal the "
+        "current offset. `Upload-Checksum` is the hex SHA-256 of the chunk.",
+        parameters=[
+            OpenApiParameter(
+                name="Upload-Offset",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.HEADER,
+                required=True,
+            ),
+            OpenApiParameter(
+                name="Upload-Checksum",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                required=True,
+            ),
+        ],
+        request={"application/octet-stream": {"type": "string", "format": "binary"}},
+        responses={
+            200: UploadSessionSerializer,
+            400: {"description": "Chunk rejected"},
+            404: {"description": "Upload not found"},
+            409: {"description": "Offset does not match the upload"},
+        },
+    )
+    def put(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return Response(
+                {"error": "Upload-Offset must be a number"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if offset != session.offset:
+            return Response(
+                {"error": "Upload-Offset does not match", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        # The body is read before the session is locked, so a slow client
+        # does not hold a row lock and a transaction open
+        try:
+            chunk = receive_chunk(
+                session, offset, request.stream, request.headers.get("Upload-Checksum")
+            )
+        except ChunkRejected as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                session = self.get_session(request, upload_id, lock=True)
+                appended = append_chunk(session, chunk)
+        finally:
+            os.remove(chunk.path)
+        if not appended:
+            return Response(
+                {"error": "Upload-Offset does not match", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(data=UploadSessionSerializer(session).data)
+
+    @extend_schema(
+        summary="Cancel a resumable upload",
+        responses={204: None, 404: {"description": "Upload not found"}},
+    )
+    def delete(self, request, upload_id):
+        discard_session(self.get_session(request, upload_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema_view(
+    post=extend_schema(tags=["content"]),
+)
+class UploadSessionFinalizeView(APIView):
+    permission_classes = [IsAuthenticated, IsInstructor]
+
+    @extend_schema(
+        summary="Finalize a resumable upload",
+        description="Create the content from the assembled file. Takes the same fields as "
+        "creating module content, without the file. The content is created with status "
+        "`processing` like a direct upload.",
+        request=ContentSerializer,
+        responses={
+            202: ContentSerializer,
+            400: {"description": "Upload incomplete, missing or invalid content"},
+            404: {"description": "Upload not found"},
+        },
+    )
+    def post(self, request, upload_id):
+        with transaction.atomic():
+            session = get_object_or_404(
+                UploadSession.objects.select_for_update().select_related("module"),
+                id=upload_id,
+                owner=request.user,
+            )
+            if not session.is_complete:
+                return Response(
+                    {"error": "Upload is incomplete", "offset": session.offset},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not os.path.exists(session.staged_path):
+                discard_session(session)
+                return Response(
+                    {"error": "Uploaded file is missing, start a new upload"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            data = request.data.copy()
+            data["resourcetype"] = session.resourcetype
+            serializer = ContentSerializer(data=data)
+            if not serializer.is_valid():
+                return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # The staged file now belongs to the upload pipeline, which hashes
+            # it instead of reading it back while the session is locked
+            staged = StagedFile(session.staged_path, None, session.size)
+            content = create_uploaded_content(
+                serializer, session.module, session.resourcetype, staged
+            )
+            session.delete()
+        return Response(data=serializer.data, status=upload_response_status(content))
 
 
 @extend_schema_view(
@@ -497,6 +772,7 @@ class ContentDetailView(ViewSet):
         },
         responses={
             200: ContentSerializer,
+            202: ContentSerializer,
             400: {"type": "object", "properties": {"detail": {"type": "string"}}},
             403: {"type": "object", "properties": {"detail": {"type": "string"}}},
             404: {"type": "object", "properties": {"detail": {"type": "string"}}},
@@ -507,44 +783,33 @@ class ContentDetailView(ViewSet):
         self.check_object_permissions(request, content.module.course)
 
         # Handle file updates if a new file is provided
-        if content.resourcetype in ("VideoContent", "ImageContent", "FileContent"):
-            file_field = RESOURCE_TYPE_MAPPING[content.resourcetype]
-            file = request.FILES.get(file_field)
-
-            if file:
-                # Validate file
-                is_valid, error_message = validate_file(file)
-                if not is_valid:
-                    return Response(
-                        {"error": error_message}, status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Delete old file from Cloudinary
-                delete_file_from_cloudinary(content.public_id)
-
-                # Upload new file to Cloudinary
-                upload_result = upload_file_to_cloudinary(file)
-                if not upload_result:
-                    return Response(
-                        {"error": "Failed to upload file"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Add Cloudinary data to request data
-                request.data[file_field] = upload_result["url"]
-                request.data["public_id"] = upload_result["public_id"]
-                if content.resourcetype == "VideoContent":
-                    request.data["thumbnail_url"] = upload_result.get("thumbnail_url")
-                elif content.resourcetype == "FileContent":
-                    request.data["file_size"] = file.size
+        file_field = RESOURCE_TYPE_MAPPING.get(type(content).__name__)
+        file = request.FILES.get(file_field) if file_field else None
+        if file:
+            # Validate file
+            is_valid, error_message = validate_file(file)
+            if not is_valid:
+                return Response(
+                    {"error": error_message}, status=status.HTTP_400_BAD_REQUEST
+                )
 
         serializer = ContentSerializer(
             data=request.data, instance=content, partial=True
         )
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not file:
             serializer.save()
             return Response(data=serializer.data)
-        return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # The old file keeps being served until the new one is stored
+        extra = {"file_size": file.size} if file_field == "file" else {}
+        with transaction.atomic():
+            content = serializer.save(status=UploadStatus.PROCESSING, **extra)
+            schedule_content_upload(
+                content, stage_upload(file), replaced_public_id=content.public_id
+            )
+        return Response(data=serializer.data, status=status.HTTP_202_ACCEPTED)
 
     @extend_schema(
         summary="Delete content",
@@ -605,18 +870,71 @@ class StudentCourseView(ViewSet):
 
     @extend_schema(
         summary="List all courses",
-        description="Get a list of all available courses",
+        description="Get a page of the course catalog, newest first. "
+        "Follow the `next` link to fetch the following page.",
+        parameters=[
+            OpenApiParameter(
+                name="subject",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="Only courses of the subject with this slug",
+            ),
+            OpenApiParameter(
+                name="min_price",
+                type=OpenApiTypes.DECIMAL,
+                location=OpenApiParameter.QUERY,
+                description="Only courses costing at least this much",
+            ),
+            OpenApiParameter(
+                name="max_price",
+                type=OpenApiTypes.DECIMAL,
+                location=OpenApiParameter.QUERY,
+                description="Only courses costing at most this much",
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="Opaque cursor taken from the `next` or `previous` link",
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Number of courses per page",
+            ),
+        ],
         responses={
-            status.HTTP_200_OK: CourseSerializer(many=True),
+            status.HTTP_200_OK: CourseListSerializer(many=True),
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(description="Invalid filter"),
             status.HTTP_403_FORBIDDEN: OpenApiResponse(description="Not authorized"),
         },
     )
     def list(self, request):
         courses = Course.objects.all()
-        course_serializer = CourseSerializer(
-            instance=courses, many=True, context={"request": request}
+        subject = request.query_params.get("subject")
+        if subject:
+            courses = courses.filter(subject__slug=subject)
+        for param, lookup in [("min_price", "price__gte"), ("max_price", "price__lte")]:
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                value = Decimal(value)
+                if not value.is_finite():
+                    raise InvalidOperation
+            except InvalidOperation:
+                return Response(
+                    {"error": f"{param} must be a number"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            courses = courses.filter(**{lookup: value})
+        paginator = CourseCursorPagination()
+        page = paginator.paginate_queryset(courses, request, view=self)
+        course_serializer = CourseListSerializer(
+            instance=page, many=True, context={"request": request}
         )
-        return Response(data=course_serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(course_serializer.data)
 
 
 @extend_schema_view(
@@ -643,11 +961,99 @@ class StudentContentView(APIView):
         },
     )
     def get(self, request, slug=None):
-        content = get_object_or_404(Content, slug=slug)
+        content = get_object_or_404(Content.objects.select_subclasses(), slug=slug)
         content_serializer = ContentSerializer(instance=content)
         return Response(data=content_serializer.data, status=status.HTTP_200_OK)
 
 
+class ImageNegotiation(DefaultContentNegotiation):
+    """Accept image types, the view picks the image format itself."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+@extend_schema_view(
+    get=extend_schema(tags=["media"]),
+)
+class ImageDerivativeView(APIView):
+    """Resized copy of a course thumbnail or an image content."""
+
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = ImageNegotiation
+
+    @extend_schema(
+        summary="Retrieve a resized image",
+        description=(
+            "Get the thumbnail of a course or the image of an image content "
+            "resized to a preset, as WebP or JPEG"
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="preset",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.PATH,
+                enum=list(PRESETS),
+                description="Size preset",
+            ),
+            OpenApiParameter(
+                name="output",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=list(FORMATS),
+                description="Image format, WebP if the Accept header allows it by default",
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: OpenApiTypes.BINARY,
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(description="Unknown preset or format"),
+            status.HTTP_404_NOT_FOUND: OpenApiResponse(description="Image not found"),
+        },
+    )
+    def get(self, request, kind, slug=None, preset=None):
+        if preset not in PRESETS:
+            return Response(
+                {"error": f"Unknown preset. Available presets: {', '.join(PRESETS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        output_format = request.query_params.get("output")
+        if output_format is None:
+            accepts_webp = "image/webp" in request.headers.get("Accept", "")
+            output_format = "webp" if accepts_webp else "jpeg"
+        elif output_format not in FORMATS:
+            return Response(
+                {"error": f"Unknown format. Available formats: {', '.join(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if kind == "course":
+            course = get_object_or_404(Course, slug=slug)
+            if not course.thumbnail:
+                return Response({"error": "Course has no thumbnail"}, status=status.HTTP_404_NOT_FOUND)
+            source_id = f"course:{course.thumbnail.name}"
+            open_source = partial(course.thumbnail.open, "rb")
+        else:
+            content = get_object_or_404(
+                ImageContent.objects.non_polymorphic(), slug=slug, status=UploadStatus.READY
+            )
+            source_id = f"content:{content.public_id}"
+            open_source = partial(get_media_storage().open, content.public_id)
+
+        try:
+            derivative = get_derivative(source_id, open_source, preset, output_format)
+        except DerivativeError:
+            return Response({"error": "Image not available"}, status=status.HTTP_404_NOT_FOUND)
+        response = FileResponse(derivative, content_type=FORMATS[output_format][1])
+        # The source id is part of the cache key, so a derivative never changes
+        patch_cache_control(response, private=True, max_age=60 * 60 * 24)
+        if "output" not in request.query_params:
+            patch_vary_headers(response, ["Accept"])
+        return response
+
+
 @extend_schema_view(
     get=extend_schema(tags=["progress"]),
 )
@@ -703,10 +1109,16 @@ class ContentProgressView(APIView):
         },
     )
     def get(self, request, slug):
-        content = get_object_or_404(Content, slug=slug)
+        content = get_object_or_404(Content.objects.non_polymorphic(), slug=slug)
         progress, created = ContentProgress.objects.get_or_create(
             student=request.user, content=content
         )
+        if created:
+            forget_progress([(request.user.id, content.id)])
+        # Heartbeats not flushed yet are newer than the stored position
+        position = get_heartbeat_buffer().get(request.user.id, content.id)
+        if position is not None:
+            progress.last_position = position
         serializer = ContentProgressSerializer(progress)
         return Response(serializer.data)
 
@@ -724,20 +1136,43 @@ class ContentProgressView(APIView):
         request=ContentProgressSerializer,
         responses={
             status.HTTP_200_OK: ContentProgressSerializer,
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(description="Invalid position"),
             status.HTTP_404_NOT_FOUND: OpenApiResponse(description="Content not found"),
         },
     )
     def post(self, request, slug):
-        content = get_object_or_404(Content, slug=slug)
+        content = get_object_or_404(Content.objects.non_polymorphic(), slug=slug)
+
+        if not request.data.get("completed") and "last_position" in request.data:
+            # Position heartbeat: buffered and written back in bulk by
+            # the flush_progress_heartbeats task.
+            try:
+                position = float(request.data["last_position"])
+            except (TypeError, ValueError):
+                position = None
+            if position is None or not math.isfinite(position):
+                return Response(
+                    {"error": "last_position must be a number"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            get_heartbeat_buffer().push(request.user.id, content.id, position)
+            progress = ContentProgress(
+                student=request.user,
+                content=content,
+                last_position=position,
+                **get_progress_fields(request.user.id, content.id),
+            )
+            serializer = ContentProgressSerializer(progress)
+            return Response(serializer.data)
+
         progress, created = ContentProgress.objects.get_or_create(
             student=request.user, content=content
         )
-
+        if created:
+            forget_progress([(request.user.id, content.id)])
         if request.data.get("completed"):
             progress.mark_as_completed()
-        elif "last_position" in request.data:
-            progress.last_position = request.data["last_position"]
-            progress.save()
+            forget_progress([(request.user.id, content.id)])
 
         serializer = ContentProgressSerializer(progress)
         return Response(serializer.data)
@@ -761,19 +1196,15 @@ class CourseMediaViewSet(ModelViewSet):
         if not is_valid:
             raise self.serializer_class.ValidationError(error_message)
 
-        # Upload to Cloudinary
-        upload_result = upload_file_to_cloudinary(file)
-        if not upload_result:
-            raise self.serializer_class.ValidationError("Failed to upload file")
-
-        # Create media object
-        serializer.save(
-            course=course,
-            file_url=upload_result["url"],
-            public_id=upload_result["public_id"],
-            size=file.size,
-        )
+        # The transfer to the media backend happens in process_media_upload,
+        # unless the same file is already stored
+        create_uploaded_media(serializer, course, stage_upload(file))
 
     def perform_destroy(self, instance):
-        # The delete method in the model will handle Cloudinary deletion
+        # courses.signals queues the stored file for deletion
         instance.delete()
+
+
+def serve_local_media(request, name):
+    """Serve a file uploaded to the local media backend."""
+    return get_media_storage().serve(request, f"{UPLOAD_FOLDER}/{name}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from courses.models import Course
+from dashboard.rollups import rebuild_instructor_rollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored instructor dashboard rollups from enrollments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--instructor",
+            type=int,
+            help="Only rebuild the rollups of the instructor with this user id.",
+        )
+
+    def handle(self, *args, **options):
+        if options["instructor"]:
+            instructor_ids = [options["instructor"]]
+        else:
+            instructor_ids = Course.objects.values_list("owner_id", flat=True).distinct()
+        count = 0
+        for instructor_id in instructor_ids:
+            rebuild_instructor_rollup(instructor_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {count} instructors"))
@@ -1,3 +1,45 @@
 from django.db import models
+from django.contrib.auth import get_user_model
+from courses.models import Course
 
-# Create your models here.
+UserModel = get_user_model()
+
+
+class CourseRollup(models.Model):
+    """Enrollment totals of one course, updated incrementally on enrollment."""
+
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True, related_name="rollup"
+    )
+    owner = models.ForeignKey(
+        UserModel, on_delete=models.CASCADE, related_name="course_rollups"
+    )
+    students = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["owner", "-students"])]
+
+    def __str__(self):
+        return f"{self.course.title}: {self.students} students"
+
+
+class InstructorRollup(models.Model):
+    """Dashboard statistics of one instructor, updated incrementally."""
+
+    TOP_COURSES = 5
+
+    instructor = models.OneToOneField(
+        UserModel,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="dashboard_rollup",
+    )
+    active_courses = models.PositiveIntegerField(default=0)
+    total_students = models.PositiveIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    top_course_ids = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard of {self.instructor.get_full_name()}"
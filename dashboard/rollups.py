@@ -0,0 +1,155 @@
+"""
+Incrementally maintained instructor dashboard statistics.
+
+Enrollments adjust the CourseRollup of their course and the
+InstructorRollup of its owner with a few single-row updates, so reading
+the dashboard does not depend on the number of courses or students.
+Rollups that do not exist yet are rebuilt from one annotated queryset.
+"""
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from courses.models import Course
+from .models import CourseRollup, InstructorRollup
+
+
+def annotate_enrollment_stats(courses):
+    """Annotate courses with their number of students and revenue."""
+    return courses.annotate(
+        student_count=Count("enrollments"),
+        revenue=ExpressionWrapper(
+            F("price") * Count("enrollments"),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+def top_course_ids(instructor_id):
+    return list(
+        CourseRollup.objects.filter(owner_id=instructor_id)
+        .order_by("-students", "-course_id")
+        .values_list("course_id", flat=True)[: InstructorRollup.TOP_COURSES]
+    )
+
+
+def rebuild_instructor_rollup(instructor_id):
+    """Recompute the rollups of an instructor and all their courses."""
+    with transaction.atomic():
+        courses = annotate_enrollment_stats(
+            Course.objects.filter(owner_id=instructor_id).order_by()
+        ).values("id", "student_count", "revenue")
+        course_rollups = [
+            CourseRollup(
+                course_id=course["id"],
+                owner_id=instructor_id,
+                students=course["student_count"],
+                revenue=course["revenue"] or 0,
+            )
+            for course in courses
+        ]
+        CourseRollup.objects.bulk_create(
+            course_rollups,
+            update_conflicts=True,
+            unique_fields=["course"],
+            update_fields=["owner", "students", "revenue"],
+        )
+        rollup, created = InstructorRollup.objects.update_or_create(
+            instructor_id=instructor_id,
+            defaults={
+                "active_courses": len(course_rollups),
+                "total_students": sum(cr.students for cr in course_rollups),
+                "total_revenue": sum(cr.revenue for cr in course_rollups),
+                "top_course_ids": top_course_ids(instructor_id),
+            },
+        )
+    return rollup
+
+
+def get_instructor_rollup(instructor_id):
+    rollup = InstructorRollup.objects.filter(instructor_id=instructor_id).first()
+    if rollup is None:
+        rollup = rebuild_instructor_rollup(instructor_id)
+    return rollup
+
+
+def record_enrollment(course_id, delta):
+    """
+    Apply an enrollment (delta=1) or unenrollment (delta=-1) to the rollups.
+
+    Returns:
+        bool: False if the rollups were missing and had to be rebuilt, or
+        if the course is being deleted and there is nothing to update
+    """
+    with transaction.atomic():
+        course = Course.objects.values_list("owner_id", "price").filter(pk=course_id)
+        if not course:
+            return False
+        owner_id, price = course[0]
+        updated = CourseRollup.objects.filter(course_id=course_id).update(
+            students=F("students") + delta, revenue=F("revenue") + price * delta
+        )
+        rollup = (
+            InstructorRollup.objects.select_for_update()
+            .filter(instructor_id=owner_id)
+            .first()
+        )
+        if not updated or rollup is None:
+            if delta > 0:
+                rebuild_instructor_rollup(owner_id)
+            return False
+        rollup.total_students = F("total_students") + delta
+        rollup.total_revenue = F("total_revenue") + price * delta
+        rollup.top_course_ids = top_course_ids(owner_id)
+        rollup.save()
+    return True
+
+
+def record_course_created(course):
+    with transaction.atomic():
+        CourseRollup.objects.get_or_create(
+            course_id=course.id, defaults={"owner_id": course.owner_id}
+        )
+        rollup = (
+            InstructorRollup.objects.select_for_update()
+            .filter(instructor_id=course.owner_id)
+            .first()
+        )
+        if rollup is not None:
+            rollup.active_courses = F("active_courses") + 1
+            rollup.top_course_ids = top_course_ids(course.owner_id)
+            rollup.save()
+
+
+def record_course_price(course):
+    """Reprice the revenue of a course after it was saved."""
+    with transaction.atomic():
+        CourseRollup.objects.filter(course_id=course.id).update(
+            revenue=F("students") * course.price
+        )
+        total_revenue = CourseRollup.objects.filter(owner_id=course.owner_id).aggregate(
+            total=Sum("revenue")
+        )["total"]
+        InstructorRollup.objects.filter(instructor_id=course.owner_id).update(
+            total_revenue=total_revenue or 0
+        )
+
+
+def record_course_deleted(course):
+    """Remove a course from the rollups before it and its enrollments go."""
+    with transaction.atomic():
+        course_rollup = (
+            CourseRollup.objects.select_for_update().filter(course_id=course.id).first()
+        )
+        if course_rollup is None:
+            return
+        course_rollup.delete()
+        rollup = (
+            InstructorRollup.objects.select_for_update()
+            .filter(instructor_id=course.owner_id)
+            .first()
+        )
+        if rollup is not None:
+            rollup.active_courses = F("active_courses") - 1
+            rollup.total_students = F("total_students") - course_rollup.students
+            rollup.total_revenue = F("total_revenue") - course_rollup.revenue
+            rollup.top_course_ids = top_course_ids(course.owner_id)
+            rollup.save()
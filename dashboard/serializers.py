@@ -12,4 +12,14 @@ class TeacherDashboardSerializer(serializers.Serializer):
     role = serializers.CharField(default='teacher')
     statistics = serializers.DictField()
     top_courses = serializers.ListField()
-    courses = serializers.ListField()
\ No newline at end of file
+    courses = serializers.ListField()
+
+class InstructorCourseSerializer(serializers.ModelSerializer):
+    students = serializers.IntegerField(source='rollup.students', default=0, read_only=True)
+    revenue = serializers.DecimalField(
+        source='rollup.revenue', max_digits=14, decimal_places=2, default=0, read_only=True
+    )
+
+    class Meta:
+        model = Course
+        fields = ['id', 'title', 'slug', 'price', 'subject', 'created', 'updated', 'students', 'revenue']
@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from courses.models import Course, CourseProgress
+from courses.progress import course_progress_changed
+from enrollment.models import Enrollment
+from . import rollups
+from .views import STUDENT_DASHBOARD_KEY
+
+
+@receiver(post_save, sender=CourseProgress)
+@receiver(post_delete, sender=CourseProgress)
+def invalidate_student_dashboard(sender, instance, **kwargs):
+    cache.delete(STUDENT_DASHBOARD_KEY.format(user_id=instance.student_id))
+
+
+@receiver(course_progress_changed)
+def invalidate_course_student_dashboards(sender, course_id, student_id=None, **kwargs):
+    if student_id is not None:
+        cache.delete(STUDENT_DASHBOARD_KEY.format(user_id=student_id))
+        return
+    student_ids = CourseProgress.objects.filter(course_id=course_id).values_list(
+        "student_id", flat=True
+    )
+    cache.delete_many(
+        [STUDENT_DASHBOARD_KEY.format(user_id=student_id) for student_id in student_ids]
+    )
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_created(sender, instance, created, **kwargs):
+    if created:
+        rollups.record_enrollment(instance.course_id, 1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    rollups.record_enrollment(instance.course_id, -1)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    if created:
+        rollups.record_course_created(instance)
+    else:
+        rollups.record_course_price(instance)
+
+
+@receiver(pre_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    rollups.record_course_deleted(instance)
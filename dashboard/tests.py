@@ -1,3 +1,188 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from accounts.models import Student, Instructor
+from courses.models import Course, Module, Subject, TextContent, CourseProgress, ContentProgress
+from enrollment.models import Enrollment
+from .models import InstructorRollup
+from .views import STUDENT_DASHBOARD_KEY
 
-# Create your tests here.
+User = get_user_model()
+
+# Course thumbnails saved by the tests go here instead of the repo's media/
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class StudentDashboardTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpassword123'
+        )
+        Student.objects.create(user=self.student_user, education="BACHELORS",
+                               phone_number="09991113333", birth_date="2002-10-2")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        cache.delete(STUDENT_DASHBOARD_KEY.format(user_id=self.student_user.id))
+        self.url = reverse('dashboard')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student_user)
+
+    def _enroll(self, title, contents=2):
+        course = Course.objects.create(
+            title=title,
+            price=0,
+            subject=self.subject,
+            required_time=10,
+            owner=self.instructor_user
+        )
+        module = Module.objects.create(title='Module', course=course)
+        created = [
+            TextContent.objects.create(title=f'Content {index}', module=module, text='text')
+            for index in range(contents)
+        ]
+        CourseProgress.objects.create(student=self.student_user, course=course)
+        return course, created
+
+    def test_statistics(self):
+        _, contents = self._enroll('Course 1')
+        self._enroll('Course 2')
+        ContentProgress.objects.create(student=self.student_user, content=contents[0]).mark_as_completed()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['statistics'], {
+            'totalCourses': 2,
+            'completedCourses': 0,
+            'inProgressCourses': 2,
+            'averageProgress': 25.0,
+        })
+        self.assertEqual(len(response.data['enrolled_courses']), 2)
+        self.assertEqual(len(response.data['recent_courses']), 2)
+
+    def test_query_count_does_not_depend_on_enrollments(self):
+        self._enroll('Course 1')
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        cache.delete(STUDENT_DASHBOARD_KEY.format(user_id=self.student_user.id))
+
+        for index in range(2, 12):
+            self._enroll(f'Course {index}')
+        cache.delete(STUDENT_DASHBOARD_KEY.format(user_id=self.student_user.id))
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['totalCourses'], 11)
+
+    def test_cached_until_progress_changes(self):
+        _, contents = self._enroll('Course 1')
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        ContentProgress.objects.create(student=self.student_user, content=contents[0]).mark_as_completed()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['averageProgress'], 50.0)
+
+        TextContent.objects.create(title='New', module=contents[0].module, text='text')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['averageProgress'], 33.33)
+
+    def test_cache_invalidated_when_completion_is_deleted(self):
+        _, contents = self._enroll('Course 1')
+        content_progress = ContentProgress.objects.create(student=self.student_user, content=contents[0])
+        content_progress.mark_as_completed()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['averageProgress'], 50.0)
+
+        content_progress.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['averageProgress'], 0.0)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class InstructorDashboardTest(APITestCase):
+    def setUp(self):
+        self.instructor_user = User.objects.create_user(
+            username='instructor',
+            email='instructor@example.com',
+            password='testpassword123',
+        )
+        Instructor.objects.create(user=self.instructor_user, education="BACHELORS")
+        self.subject = Subject.objects.create(title="test", slug="test")
+        self.courses = [
+            Course.objects.create(
+                title=f'Course {index}',
+                price=10,
+                subject=self.subject,
+                required_time=10,
+                owner=self.instructor_user
+            )
+            for index in range(3)
+        ]
+        self.url = reverse('dashboard')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.instructor_user)
+
+    def _enroll(self, course, count):
+        for _ in range(count):
+            student = User.objects.create_user(username=f'student{User.objects.count()}')
+            Enrollment.objects.create(user=student, course=course, deadline='2030-01-01')
+
+    def test_statistics_and_top_courses(self):
+        self._enroll(self.courses[1], 3)
+        self._enroll(self.courses[2], 1)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['statistics'], {
+            'activeCourses': 3,
+            'totalStudents': 4,
+            'totalRevenue': Decimal('40.00'),
+            'averageStudentsPerCourse': 1.33,
+        })
+        self.assertEqual(
+            [course['id'] for course in response.data['top_courses']],
+            [self.courses[1].id, self.courses[2].id, self.courses[0].id]
+        )
+        self.assertEqual(response.data['top_courses'][0]['students'], 3)
+
+    def test_rollup_follows_enrollments_and_courses(self):
+        self.client.get(self.url)
+        self._enroll(self.courses[0], 2)
+        Enrollment.objects.filter(course=self.courses[0]).first().delete()
+        self.courses[2].delete()
+        self.courses[1].price = 20
+        self.courses[1].save()
+        self._enroll(self.courses[1], 1)
+
+        rollup = InstructorRollup.objects.get(instructor=self.instructor_user)
+        self.assertEqual(rollup.active_courses, 2)
+        self.assertEqual(rollup.total_students, 2)
+        self.assertEqual(rollup.total_revenue, Decimal('30.00'))
+        self.assertEqual(rollup.top_course_ids, [self.courses[1].id, self.courses[0].id])
+
+    def test_query_count_does_not_depend_on_enrollments(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self._enroll(self.courses[0], 20)
+        with self.assertNumQueries(len(few)):
+            self.client.get(self.url)
@@ -1,12 +1,21 @@
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Count
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, F, FloatField, Q, Value, When
 from django.utils import timezone
 from datetime import timedelta
 from courses.models import Course, CourseProgress
-from courses.serializers import CourseProgressSerializer, CourseSerializer
-from .serializers import StudentDashboardSerializer, TeacherDashboardSerializer
+from courses.serializers import CourseProgressSerializer
+from .rollups import get_instructor_rollup
+from .serializers import (
+    StudentDashboardSerializer,
+    TeacherDashboardSerializer,
+    InstructorCourseSerializer,
+)
+
+STUDENT_DASHBOARD_KEY = "dashboard:student:{user_id}"
 
 class DashboardView(APIView):
     permission_classes = [IsAuthenticated]
@@ -15,57 +24,27 @@ class DashboardView(APIView):
         user = request.user
         
         if hasattr(user, "student"):
-            # Get enrolled courses with progress using CourseProgress model
-            course_progresses = CourseProgress.objects.filter(student=user)
-            
-            # Calculate statistics
-            total_courses = course_progresses.count()
-            completed_courses = course_progresses.filter(completed=True).count()
-            in_progress_courses = total_courses - completed_courses
-            
-            # Calculate average progress manually
-            total_progress = sum(cp.progress_percentage for cp in course_progresses)
-            avg_progress = total_progress / total_courses if total_courses > 0 else 0
-            
-            # Get recently accessed courses (last 7 days)
-            recent_courses = course_progresses.filter(
-                last_accessed__gte=timezone.now() - timedelta(days=7)
-            ).order_by('-last_accessed')[:5]
-            
-            # Prepare data for serialization
-            data = {
-                'role': 'student',
-                'statistics': {
-                    'totalCourses': total_courses,
-                    'completedCourses': completed_courses,
-                    'inProgressCourses': in_progress_courses,
-                    'averageProgress': round(avg_progress, 2)
-                },
-                'recent_courses': CourseProgressSerializer(recent_courses, many=True, context={'request': request}).data,
-                'enrolled_courses': CourseProgressSerializer(course_progresses, many=True, context={'request': request}).data
-            }
-            
-            serializer = StudentDashboardSerializer(data)
-            return Response(serializer.data)
+            cache_key = STUDENT_DASHBOARD_KEY.format(user_id=user.id)
+            data = cache.get(cache_key)
+            if data is None:
+                data = self._student_dashboard(request)
+                cache.set(cache_key, data, timeout=settings.CACHE_TTL)
+            return Response(data)
         
         elif hasattr(user, "instructor"):
-            # Get courses created by the teacher
-            courses = user.courses.all()
-            
-            # Calculate statistics
-            active_courses = courses.count()
-            total_students = sum(course.enrollments.count() for course in courses)
-            total_revenue = sum(
-                course.price * course.enrollments.count() 
-                for course in courses
+            # Statistics and top courses come from the stored rollup
+            rollup = get_instructor_rollup(user.id)
+            courses = list(
+                Course.objects.filter(owner=user).select_related('rollup')
             )
-            
-            # Get top performing courses (by enrollment)
-            top_courses = sorted(
-                courses,
-                key=lambda x: x.enrollments.count(),
-                reverse=True
-            )[:5]
+            courses_by_id = {course.id: course for course in courses}
+            top_courses = [
+                courses_by_id[course_id]
+                for course_id in rollup.top_course_ids
+                if course_id in courses_by_id
+            ]
+            active_courses = rollup.active_courses
+            total_students = rollup.total_students
             
             # Prepare data for serialization
             data = {
@@ -73,14 +52,62 @@ class DashboardView(APIView):
                 'statistics': {
                     'activeCourses': active_courses,
                     'totalStudents': total_students,
-                    'totalRevenue': round(total_revenue, 2),
+                    'totalRevenue': round(rollup.total_revenue, 2),
                     'averageStudentsPerCourse': round(total_students / active_courses, 2) if active_courses > 0 else 0
                 },
-                'top_courses': CourseSerializer(top_courses, many=True, context={'request': request}).data,
-                'courses': CourseSerializer(courses, many=True, context={'request': request}).data
+                'top_courses': InstructorCourseSerializer(top_courses, many=True).data,
+                'courses': InstructorCourseSerializer(courses, many=True).data
             }
             
             serializer = TeacherDashboardSerializer(data)
             return Response(serializer.data)
         
-        return Response({'error': 'Invalid user role'}, status=400)
\ No newline at end of file
+        return Response({'error': 'Invalid user role'}, status=400)
+
+    def _student_dashboard(self, request):
+        course_progresses = CourseProgress.objects.filter(student=request.user)
+
+        # All statistics in one aggregate query over the stored counters
+        statistics = course_progresses.aggregate(
+            total_courses=Count('pk'),
+            completed_courses=Count('pk', filter=Q(completed=True)),
+            average_progress=Avg(
+                Case(
+                    When(total_contents=0, then=Value(0.0)),
+                    default=F('completed_contents') * 100.0 / F('total_contents'),
+                    output_field=FloatField(),
+                )
+            ),
+        )
+        total_courses = statistics['total_courses']
+        completed_courses = statistics['completed_courses']
+
+        # Fetch the courses once and take the recently accessed ones
+        # (last 7 days) from the same list
+        course_progresses = list(course_progresses)
+        recent_since = timezone.now() - timedelta(days=7)
+        recent_courses = sorted(
+            (cp for cp in course_progresses if cp.last_accessed >= recent_since),
+            key=lambda cp: cp.last_accessed,
+            reverse=True,
+        )[:5]
+        enrolled_courses = CourseProgressSerializer(
+            course_progresses, many=True, context={'request': request}
+        ).data
+        recent_ids = [cp.id for cp in recent_courses]
+        serialized = {course['id']: course for course in enrolled_courses}
+
+        data = {
+            'role': 'student',
+            'statistics': {
+                'totalCourses': total_courses,
+                'completedCourses': completed_courses,
+                'inProgressCourses': total_courses - completed_courses,
+                'averageProgress': round(statistics['average_progress'] or 0, 2)
+            },
+            'recent_courses': [serialized[course_id] for course_id in recent_ids],
+            'enrolled_courses': enrolled_courses
+        }
+
+        serializer = StudentDashboardSerializer(data)
+        return serializer.data
\ No newline at end of file